@@ -0,0 +1,212 @@
+"""Buffered application logging for SmartTest.
+
+llm.log() and MyApp.log() hand messages to a single LogSink: the caller
+only puts the line into an in-memory queue, a background thread writes
+queued lines to the console and the log file in batches and rotates the
+file when it grows past max_bytes. Messages below the configured level
+(SMARTTEST_LOG_LEVEL, INFO by default) are dropped at the call site.
+"""
+import atexit
+import os
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
+
+DEFAULT_LOG_PATH = str(Path(__file__).parent / 'llm_debug.log')
+DEFAULT_MAX_BYTES = 1024 * 1024
+DEFAULT_BACKUPS = 2
+FLUSH_INTERVAL = 0.5  # Seconds a line may wait in the queue before it is written
+BATCH_SIZE = 500
+QUEUE_SIZE = 10000
+
+
+def _level_from_env():
+    name = os.getenv('SMARTTEST_LOG_LEVEL', 'INFO').upper()
+    for level, level_name in LEVEL_NAMES.items():
+        if level_name == name:
+            return level
+    return INFO
+
+
+class LogSink:
+    """
+    Queue + writer thread shared by all loggers of the process.
+
+    Attributes:
+        level: Minimum level that is queued
+        path: Log file (None - console only)
+        stats: Counters of queued, written, dropped lines, batches and rotations
+    """
+
+    def __init__(self, path=DEFAULT_LOG_PATH, level=INFO, console=True, max_bytes=DEFAULT_MAX_BYTES,
+                 backups=DEFAULT_BACKUPS):
+        self.path = path
+        self.level = level
+        self.console = console
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.stats = {'queued': 0, 'written': 0, 'dropped': 0, 'batches': 0, 'rotations': 0}
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._file = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def emit(self, source, message, level=INFO):
+        """Queues a message; never blocks the caller."""
+        if level < self.level:
+            return
+        self._start()
+        try:
+            self._queue.put_nowait((level, source, message))
+            self.stats['queued'] += 1
+        except queue.Full:
+            self.stats['dropped'] += 1
+
+    def flush(self, timeout=2.0):
+        """Waits until everything queued so far has been written."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def set_path(self, path):
+        """Switches the log file; lines still queued go to the new file."""
+        with self._lock:
+            self._close_file()
+            self.path = path
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='applog-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Let more lines accumulate so they are written together
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while len(batch) < BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or isinstance(batch[-1], threading.Event):
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch):
+        lines = []
+        events = []
+        for item in batch:
+            if isinstance(item, threading.Event):
+                events.append(item)
+                continue
+            level, source, message = item
+            prefix = f"[{source}]" if level == INFO else f"[{source}] {LEVEL_NAMES.get(level, level)}:"
+            lines.append(f"{prefix} {message}\n")
+        if lines:
+            text = ''.join(lines)
+            if self.console:
+                try:
+                    sys.stdout.write(text)
+                    sys.stdout.flush()
+                except Exception:
+                    pass
+            with self._lock:
+                self._write_file(text)
+            self.stats['written'] += len(lines)
+            self.stats['batches'] += 1
+        for event in events:
+            event.set()
+
+    def _write_file(self, text):
+        if not self.path:
+            return
+        try:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(text)
+            self._file.flush()
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+        except Exception:
+            self._close_file()
+
+    def _rotate(self):
+        self._close_file()
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.stats['rotations'] += 1
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except Exception:
+                pass
+            self._file = None
+
+
+_sink = LogSink(level=_level_from_env())
+atexit.register(_sink.flush)
+
+
+def get_sink():
+    return _sink
+
+
+def configure(path=None, level=None, console=None, max_bytes=None, backups=None):
+    """Changes settings of the shared sink (only the given ones)."""
+    if path is not None:
+        _sink.set_path(path)
+    if level is not None:
+        _sink.level = level
+    if console is not None:
+        _sink.console = console
+    if max_bytes is not None:
+        _sink.max_bytes = max_bytes
+    if backups is not None:
+        _sink.backups = backups
+
+
+def enabled(level):
+    """True if messages of this level are logged (to skip building expensive ones)."""
+    return _sink.enabled(level)
+
+
+def write(source, message, level=INFO):
+    _sink.emit(source, message, level)
+
+
+def flush(timeout=2.0):
+    _sink.flush(timeout)
+
+
+def get_stats():
+    return dict(_sink.stats, queue=_sink._queue.qsize())
@@ -0,0 +1,120 @@
+"""Disk cache of the parsed KV rules.
+
+Builder.load_string() parses the whole KV source and compiles every
+property expression on each launch. load_string() here does the same
+once and keeps the resulting kivy.lang.Parser pickled (code objects via
+marshal) in a cache directory. The file name is a hash of the KV source,
+the Kivy version and the Python bytecode tag, so an edited KV, an
+upgraded Kivy or another interpreter simply misses the cache. Any
+problem with a cache file falls back to a normal parse.
+"""
+import copyreg
+import hashlib
+import io
+import marshal
+import os
+import pickle
+import sys
+import types
+from functools import partial
+
+import kivy
+from kivy.factory import Factory
+from kivy.lang import Builder, Parser
+from kivy.logger import Logger
+
+FORMAT_VERSION = 1
+
+
+def _reduce_code(code):
+    return marshal.loads, (marshal.dumps(code),)
+
+
+class _ParserPickler(pickle.Pickler):
+    """Pickler that also stores the code objects compiled by Parser.precompile()."""
+    dispatch_table = copyreg.dispatch_table.copy()
+    dispatch_table[types.CodeType] = _reduce_code
+
+
+def cache_key(source):
+    """Hash of the KV source and everything its compiled form depends on."""
+    digest = hashlib.sha256()
+    for part in (str(FORMAT_VERSION), kivy.__version__, sys.implementation.cache_tag or '', source):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:32]
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        parser = pickle.load(f)
+    if not isinstance(parser, Parser):
+        raise TypeError(f'unexpected object in {path}')
+    # #:import and #:set fill the global idmap: not part of the pickled state
+    parser.execute_directives()
+    return parser
+
+
+def _write(path, parser):
+    buffer = io.BytesIO()
+    _ParserPickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(parser)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(buffer.getvalue())
+    os.replace(tmp_path, path)
+
+
+def get_parser(source, cache_dir):
+    """
+    Returns (parser, hit): the parsed source, from the cache when possible.
+
+    Stale cache files of other sources/versions are removed when a new
+    one is written.
+    """
+    name = cache_key(source) + '.pickle'
+    path = os.path.join(cache_dir, name)
+    if os.path.exists(path):
+        try:
+            return _read(path), True
+        except Exception as e:
+            Logger.warning(f'KVCache: ignoring {path}: {e!r}')
+    parser = Parser(content=source)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        _write(path, parser)
+        for entry in os.listdir(cache_dir):
+            if entry != name and entry.endswith(('.pickle', '.tmp')):
+                os.remove(os.path.join(cache_dir, entry))
+    except Exception as e:
+        Logger.warning(f'KVCache: cannot write {path}: {e!r}')
+    return parser, False
+
+
+def load_string(source, cache_dir):
+    """
+    Builder.load_string(source) with the parse step served from cache_dir.
+
+    Registers the rules, templates and dynamic classes exactly like
+    Builder.load_string and returns the root widget (or None).
+    """
+    parser, hit = get_parser(source, cache_dir)
+    Logger.debug(f"KVCache: {'hit' if hit else 'miss'} in {cache_dir}")
+
+    Builder.rules.extend(parser.rules)
+    Builder._clear_matchcache()
+    for name, cls, template in parser.templates:
+        Builder.templates[name] = (cls, template, None)
+        Factory.register(name, cls=partial(Builder.template, name), is_template=True, warn=True)
+    for name, baseclasses in parser.dynamic_classes.items():
+        Factory.register(name, baseclasses=baseclasses, filename=None, warn=True)
+
+    if not parser.root:
+        return None
+    widget = Factory.get(parser.root.name)(__no_builder=True)
+    rule_children = []
+    widget.apply_class_lang_rules(root=widget, rule_children=rule_children)
+    Builder._apply_rule(widget, parser.root, parser.root, rule_children=rule_children)
+    for child in rule_children:
+        child.dispatch('on_kv_post', widget)
+    widget.dispatch('on_kv_post', widget)
+    return widget
@@ -1,42 +1,54 @@
 """LLM module for quiz generation using OpenRouter API.
 Uses kivy.network.urlrequest for Android compatibility.
-Falls back to urllib for desktop.
+Falls back to pooled keep-alive http.client connections for desktop.
+Every API function has an asyncio twin (agenerate_quiz, ...) that can be
+submitted to a shared background event loop with submit_async().
 """
+import asyncio
 import json
 import os
 import sys
 import traceback
 import socket
+import ssl
 import http.client
 import base64
+import concurrent.futures
+import functools
+import hashlib
+import io
+import math
+import threading
+import time
+import urllib.request
+import weakref
+from collections import OrderedDict, deque, namedtuple
 from pathlib import Path
+from urllib.parse import unquote, urlparse
 
-# Detailed logging
-def log(msg):
-    """Print log message with prefix"""
-    print(f"[LLM] {msg}")
-    # Also try to write to file for Android debugging
-    try:
-        log_path = Path(__file__).parent / 'llm_debug.log'
-        with open(log_path, 'a', encoding='utf-8') as f:
-            f.write(f"{msg}\n")
-    except:
-        pass
+import applog
+from applog import DEBUG, INFO, WARNING, ERROR
+
+# Detailed logging (console + llm_debug.log, written by the applog thread)
+def log(msg, level=INFO):
+    """Queue a log message; DEBUG messages are dropped unless SMARTTEST_LOG_LEVEL=DEBUG"""
+    applog.write('LLM', msg, level)
 
-log(f"=== LLM Module Loading ===")
-log(f"Python version: {sys.version}")
-log(f"Platform: {sys.platform}")
-log(f"Current directory: {os.getcwd()}")
-log(f"__file__: {__file__}")
+if applog.enabled(DEBUG):
+    log(f"=== LLM Module Loading ===", DEBUG)
+    log(f"Python version: {sys.version}", DEBUG)
+    log(f"Platform: {sys.platform}", DEBUG)
+    log(f"Current directory: {os.getcwd()}", DEBUG)
+    log(f"__file__: {__file__}", DEBUG)
 
 # Try to load environment variables
 try:
     from dotenv import load_dotenv
     env_path = Path(__file__).parent / '.env'
     load_dotenv(dotenv_path=env_path)
-    log(f".env loaded from: {env_path}, exists: {env_path.exists()}")
+    log(f".env loaded from: {env_path}, exists: {env_path.exists()}", DEBUG)
 except Exception as e:
-    log(f"Warning: Could not load dotenv: {e}")
+    log(f"Warning: Could not load dotenv: {e}", WARNING)
 
 # Check if running on Android
 IS_ANDROID = False
@@ -45,12 +57,7 @@ try:
     IS_ANDROID = True
     log("Android module imported - running on Android")
 except ImportError:
-    log("Not running on Android (android module not found)")
-
-# Global variable to store async result
-_async_result = None
-_async_error = None
-_async_done = False
+    log("Not running on Android (android module not found)", DEBUG)
 
 # Fallback IPs for openrouter.ai (to bypass DNS issues on some networks)
 FALLBACK_OPENROUTER_IPS = [
@@ -58,6 +65,42 @@ FALLBACK_OPENROUTER_IPS = [
     "172.67.213.90",
 ]
 
+# Chat completions endpoint; OPENROUTER_URL can point it at a local stub server
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+# Request the theory and the questions of a quiz as two concurrent calls
+# instead of one (see generate_quiz)
+QUIZ_SPLIT_MODE = os.getenv("SMARTTEST_QUIZ_SPLIT", "").lower() in ("1", "true", "yes")
+
+# Response cache (see configure_response_cache): entries live for
+# RESPONSE_CACHE_TTL seconds and only the listed functions are cached
+RESPONSE_CACHE_TTL = 7 * 24 * 3600
+RESPONSE_CACHE_MAX_ENTRIES = 200
+RESPONSE_CACHE_MAX_BYTES = 20 * 1024 * 1024
+RESPONSE_CACHE_FUNCTIONS = ('generate_quiz', 'generate_next_topics', 'generate_open_questions', 'evaluate_answer')
+
+# Keep-alive pool settings: idle connections older than POOL_IDLE_TIMEOUT
+# seconds are closed instead of being reused
+POOL_IDLE_TIMEOUT = 60
+POOL_MAX_IDLE_PER_HOST = 4
+
+# Transport selection: after TRANSPORT_FAILURE_THRESHOLD consecutive failures a
+# transport is skipped for TRANSPORT_COOLDOWN seconds; while a lower-priority
+# transport is preferred, a higher-priority one is retried every
+# TRANSPORT_REPROBE_INTERVAL seconds
+TRANSPORT_FAILURE_THRESHOLD = 2
+TRANSPORT_COOLDOWN = 120
+TRANSPORT_REPROBE_INTERVAL = 300
+
+# Images sent to the model (see encode_image_to_base64): the longer side is
+# scaled down to IMAGE_MAX_SIDE pixels and the image is re-encoded as
+# IMAGE_FORMAT without EXIF; encoded images are kept in memory up to
+# IMAGE_CACHE_MAX_BYTES, so sending the same file again costs only its hash
+IMAGE_MAX_SIDE = 1536
+IMAGE_FORMAT = 'JPEG'
+IMAGE_QUALITY = 85
+IMAGE_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
 
 def get_course_topics(memory_file='course_topics.json'):
     """Загрузить список тем курса из памяти (файла)."""
@@ -70,7 +113,7 @@ def get_course_topics(memory_file='course_topics.json'):
         if isinstance(data, list):
             return data
     except Exception as e:
-        log(f"Не удалось прочитать память тем: {e}")
+        log(f"Не удалось прочитать память тем: {e}", WARNING)
     return []
 
 
@@ -85,30 +128,40 @@ def save_course_topic(topic, memory_file='course_topics.json'):
     try:
         path.parent.mkdir(parents=True, exist_ok=True)
     except Exception as e:
-        log(f"Не удалось создать директорию памяти тем: {e}")
+        log(f"Не удалось создать директорию памяти тем: {e}", WARNING)
     topics = get_course_topics(memory_file)
     if normalized not in topics:
         topics.append(normalized)
         try:
             with path.open('w', encoding='utf-8') as f:
                 json.dump(topics, f, ensure_ascii=False, indent=2)
-            log(f"Тема сохранена в памяти: {normalized}")
+            log(f"Тема сохранена в памяти: {normalized}", DEBUG)
         except Exception as e:
-            log(f"Не удалось сохранить память тем: {e}")
+            log(f"Не удалось сохранить память тем: {e}", WARNING)
 
 
 def generate_next_topics(prev_material, n=5, api_key=None, memory_file='course_topics.json'):
     """Генерировать новые темы для изучения на основе предыдущего материала и сохранить их в память."""
+    return _run_sync(_generate_next_topics_steps(prev_material, n, api_key, memory_file))
+
+
+async def agenerate_next_topics(prev_material, n=5, api_key=None, memory_file='course_topics.json'):
+    """asyncio twin of generate_next_topics(); runs the same request steps without blocking a thread."""
+    return await _run_async(_generate_next_topics_steps(prev_material, n, api_key, memory_file))
+
+
+def _generate_next_topics_steps(prev_material, n=5, api_key=None, memory_file='course_topics.json'):
+    """Request steps of generate_next_topics() (see _run_sync)."""
     if not prev_material:
         prev_material = "Ранее изученный материал недоступен."
     material_snippet = prev_material[:1500]
-    log(f"=== generate_next_topics() starting ===")
-    log(f"  Material snippet length: {len(material_snippet)}")
-    log(f"  API key provided: {api_key is not None}")
-    url = "https://openrouter.ai/api/v1/chat/completions"
+    log(f"=== generate_next_topics() starting ===", DEBUG)
+    log(f"  Material snippet length: {len(material_snippet)}", DEBUG)
+    log(f"  API key provided: {api_key is not None}", DEBUG)
+    url = OPENROUTER_URL
     if not api_key:
         api_key = os.getenv("OPENROUTER_API_KEY")
-        log(f"API key from env: {api_key is not None}")
+        log(f"API key from env: {api_key is not None}", DEBUG)
     if not api_key:
         log("API ключ не найден. Генерация тем пропущена.")
         return []
@@ -132,12 +185,15 @@ def generate_next_topics(prev_material, n=5, api_key=None, memory_file='course_t
         ]
     }
     try:
-        log(f"Sending request to OpenRouter for next topics...")
-        result = make_request(url, headers, data, timeout=60)
-        log(f"Got response from OpenRouter (next topics)")
+        log(f"Sending request to OpenRouter for next topics...", DEBUG)
+        request = _HTTPRequest(url, headers, data, 60)
+        result = _cache_get('generate_next_topics', request)
+        if result is None:
+            result = yield request
+        log(f"Got response from OpenRouter (next topics)", DEBUG)
         if 'choices' in result and len(result['choices']) > 0:
             content = result['choices'][0]['message']['content']
-            log(f"Content preview: {content[:200]}...")
+            log(f"Content preview: {content[:200]}...", DEBUG)
             content = content.replace('```json', '').replace('```', '').strip()
             try:
                 topics_raw = json.loads(content)
@@ -148,36 +204,46 @@ def generate_next_topics(prev_material, n=5, api_key=None, memory_file='course_t
                         if topic_name and topic_name not in topics:
                             topics.append(topic_name)
                             save_course_topic(topic_name, memory_file)
-                    log(f"Saved {len(topics)} topics to memory.")
+                    log(f"Saved {len(topics)} topics to memory.", DEBUG)
+                    _cache_put('generate_next_topics', request, result)
                     return topics
                 else:
-                    log("Ответ не является списком тем.")
+                    log("Ответ не является списком тем.", WARNING)
                     return []
             except json.JSONDecodeError as e:
-                log(f"Ошибка парсинга JSON тем: {e}")
+                log(f"Ошибка парсинга JSON тем: {e}", WARNING)
                 return []
         else:
-            log(f"Некорректный ответ API (next topics): {result}")
+            log(f"Некорректный ответ API (next topics): {result}", WARNING)
             return []
     except Exception as e:
-        log(f"Exception in generate_next_topics: {e}")
-        log(f"Traceback: {traceback.format_exc()}")
+        log(f"Exception in generate_next_topics: {e}", WARNING)
+        log(f"Traceback: {traceback.format_exc()}", DEBUG)
         return []
 
 
+class HTTPStatusError(Exception):
+    """HTTP error status returned by the server (the transport itself worked)."""
+
+    def __init__(self, status, body=''):
+        super().__init__(f"HTTP {status}: {body[:500]}")
+        self.status = status
+        self.body = body
+
+
 def make_request_java(url, headers, data, timeout=60):
     """Make HTTP request using Java HttpURLConnection (Android native, best compatibility)."""
     if not IS_ANDROID:
         raise ImportError("Java HTTP client only available on Android")
     
-    log("make_request_java() starting...")
-    log(f"  URL: {url}")
+    log("make_request_java() starting...", DEBUG)
+    log(f"  URL: {url}", DEBUG)
     
     try:
         from jnius import autoclass, cast
-        log("jnius imported successfully")
+        log("jnius imported successfully", DEBUG)
     except ImportError as e:
-        log(f"Failed to import jnius: {e}")
+        log(f"Failed to import jnius: {e}", WARNING)
         raise
     
     URL = autoclass('java.net.URL')
@@ -187,14 +253,14 @@ def make_request_java(url, headers, data, timeout=60):
     DataOutputStream = autoclass('java.io.DataOutputStream')
     
     body = json.dumps(data, ensure_ascii=False).encode('utf-8')
-    log(f"Request body prepared, length: {len(body)}")
+    log(f"Request body prepared, length: {len(body)}", DEBUG)
     
     try:
         url_obj = URL(url)
         # openConnection() returns URLConnection, need to cast to HttpURLConnection
         url_connection = url_obj.openConnection()
         conn = cast('java.net.HttpURLConnection', url_connection)
-        log("Connection cast to HttpURLConnection successfully")
+        log("Connection cast to HttpURLConnection successfully", DEBUG)
         
         conn.setRequestMethod("POST")
         conn.setDoOutput(True)
@@ -206,7 +272,7 @@ def make_request_java(url, headers, data, timeout=60):
         for key, value in headers.items():
             conn.setRequestProperty(key, value)
         
-        log("Sending request via Java HttpURLConnection...")
+        log("Sending request via Java HttpURLConnection...", DEBUG)
         
         # Write body
         out_stream = DataOutputStream(conn.getOutputStream())
@@ -216,7 +282,7 @@ def make_request_java(url, headers, data, timeout=60):
         
         # Read response
         response_code = conn.getResponseCode()
-        log(f"Java response code: {response_code}")
+        log(f"Java response code: {response_code}", DEBUG)
         
         if response_code >= 400:
             # Read error stream
@@ -229,9 +295,9 @@ def make_request_java(url, headers, data, timeout=60):
                     response_text += line
                     line = reader.readLine()
                 reader.close()
-                raise Exception(f"HTTP {response_code}: {response_text[:500]}")
+                raise HTTPStatusError(response_code, response_text)
             else:
-                raise Exception(f"HTTP {response_code}")
+                raise HTTPStatusError(response_code)
         
         # Read success stream
         reader = BufferedReader(InputStreamReader(conn.getInputStream(), "UTF-8"))
@@ -243,368 +309,1737 @@ def make_request_java(url, headers, data, timeout=60):
         reader.close()
         conn.disconnect()
         
-        log(f"Java response length: {len(response_text)}")
+        log(f"Java response length: {len(response_text)}", DEBUG)
         return json.loads(response_text)
         
     except Exception as e:
-        log(f"Java HTTP request failed: {e}")
-        log(f"Traceback: {traceback.format_exc()}")
+        log(f"Java HTTP request failed: {e}", WARNING)
+        log(f"Traceback: {traceback.format_exc()}", DEBUG)
         raise
 
-def _on_success(req, result):
-    """Callback for successful UrlRequest"""
-    global _async_result, _async_done
-    log(f"UrlRequest SUCCESS!")
-    log(f"  Status: {req.resp_status}")
-    log(f"  Headers: {req.resp_headers}")
-    log(f"  Result type: {type(result)}")
-    log(f"  Result preview: {str(result)[:500]}")
-    _async_result = result
-    _async_done = True
-
-def _on_failure(req, result):
+def _on_success(future, req, result):
+    """Callback for successful UrlRequest: resolves the request's future"""
+    log(f"UrlRequest SUCCESS!", DEBUG)
+    log(f"  Status: {req.resp_status}", DEBUG)
+    log(f"  Headers: {req.resp_headers}", DEBUG)
+    log(f"  Result type: {type(result)}", DEBUG)
+    log(f"  Result preview: {str(result)[:500]}", DEBUG)
+    if not future.done():
+        future.set_result(result)
+
+def _on_failure(future, req, result):
     """Callback for failed UrlRequest"""
-    global _async_error, _async_done
-    log(f"UrlRequest FAILURE!")
-    log(f"  Status: {req.resp_status}")
-    log(f"  Result: {result}")
-    _async_error = f"HTTP {req.resp_status}: {result}"
-    _async_done = True
-
-def _on_error(req, error):
+    log(f"UrlRequest FAILURE!", WARNING)
+    log(f"  Status: {req.resp_status}", DEBUG)
+    log(f"  Result: {result}", DEBUG)
+    if not future.done():
+        future.set_exception(HTTPStatusError(req.resp_status, str(result)))
+
+def _on_error(future, req, error):
     """Callback for UrlRequest error"""
-    global _async_error, _async_done
-    log(f"UrlRequest ERROR!")
-    log(f"  Error type: {type(error)}")
-    log(f"  Error: {error}")
-    log(f"  Traceback: {traceback.format_exc()}")
-    _async_error = str(error)
-    _async_done = True
+    log(f"UrlRequest ERROR!", WARNING)
+    log(f"  Error type: {type(error)}", DEBUG)
+    log(f"  Error: {error}", WARNING)
+    if not future.done():
+        future.set_exception(Exception(str(error)))
 
 def _on_progress(req, current, total):
     """Callback for UrlRequest progress"""
     if total > 0:
-        log(f"Progress: {current}/{total} bytes ({100*current//total}%)")
+        log(f"Progress: {current}/{total} bytes ({100*current//total}%)", DEBUG)
     else:
-        log(f"Progress: {current} bytes (total unknown)")
+        log(f"Progress: {current} bytes (total unknown)", DEBUG)
 
 def make_request_kivy(url, headers, data, timeout=60):
-    """Make HTTP request using Kivy's UrlRequest (Android compatible)"""
-    global _async_result, _async_error, _async_done
-    _async_result = None
-    _async_error = None
-    _async_done = False
-    
-    log(f"make_request_kivy() starting...")
-    log(f"  URL: {url}")
-    log(f"  Timeout: {timeout}")
-    log(f"  Data keys: {list(data.keys()) if isinstance(data, dict) else 'not a dict'}")
+    """
+    Make HTTP request using Kivy's UrlRequest (Android compatible).
+
+    Each call gets its own Future resolved by the UrlRequest callbacks, so the
+    caller wakes up as soon as the response arrives and concurrent requests
+    from different threads do not share state.
+    """
+    log(f"make_request_kivy() starting...", DEBUG)
+    log(f"  URL: {url}", DEBUG)
+    log(f"  Timeout: {timeout}", DEBUG)
+    log(f"  Data keys: {list(data.keys()) if isinstance(data, dict) else 'not a dict'}", DEBUG)
     
     try:
         from kivy.network.urlrequest import UrlRequest
-        log("UrlRequest imported successfully")
+        log("UrlRequest imported successfully", DEBUG)
     except Exception as e:
-        log(f"Failed to import UrlRequest: {e}")
-        log(f"Traceback: {traceback.format_exc()}")
+        log(f"Failed to import UrlRequest: {e}", WARNING)
+        log(f"Traceback: {traceback.format_exc()}", DEBUG)
         raise
-    
-    import time
+
+    # UrlRequest delivers its callbacks through the Kivy Clock on the main
+    # thread, so waiting for them on that thread would never complete
+    if threading.current_thread() is threading.main_thread():
+        raise RuntimeError("make_request_kivy() cannot wait on the Kivy main thread")
     
     try:
         # Ensure UTF-8 encoding for body with non-ASCII characters
         body = json.dumps(data, ensure_ascii=False).encode('utf-8')
-        log(f"Request body prepared, length: {len(body)}")
+        log(f"Request body prepared, length: {len(body)}", DEBUG)
     except Exception as e:
-        log(f"Failed to serialize data: {e}")
+        log(f"Failed to serialize data: {e}", WARNING)
         raise
     
     # Force Content-Type with charset for proper encoding
     headers_copy = dict(headers)
     headers_copy['Content-Type'] = 'application/json; charset=utf-8'
     
-    log("Creating UrlRequest...")
+    future = concurrent.futures.Future()
+    log("Creating UrlRequest...", DEBUG)
     try:
         req = UrlRequest(
             url,
             req_body=body,
             req_headers=headers_copy,
-            on_success=_on_success,
-            on_failure=_on_failure,
-            on_error=_on_error,
+            on_success=functools.partial(_on_success, future),
+            on_failure=functools.partial(_on_failure, future),
+            on_error=functools.partial(_on_error, future),
             on_progress=_on_progress,
             timeout=timeout,
             method='POST'
         )
-        log(f"UrlRequest created: {req}")
+        log(f"UrlRequest created: {req}", DEBUG)
     except Exception as e:
-        log(f"Failed to create UrlRequest: {e}")
-        log(f"Traceback: {traceback.format_exc()}")
+        log(f"Failed to create UrlRequest: {e}", WARNING)
+        log(f"Traceback: {traceback.format_exc()}", DEBUG)
         raise
     
-    # Wait for request to complete (with timeout)
-    log("Waiting for request to complete...")
+    # Wait for one of the callbacks to resolve the future (with timeout)
+    log("Waiting for request to complete...", DEBUG)
     start_time = time.time()
-    check_count = 0
-    while not _async_done:
-        time.sleep(0.1)
-        check_count += 1
-        elapsed = time.time() - start_time
-        if check_count % 50 == 0:  # Log every 5 seconds
-            log(f"  Still waiting... {elapsed:.1f}s elapsed")
-        if elapsed > timeout:
-            log(f"Request timeout after {elapsed:.1f}s")
-            _async_error = "Request timeout"
-            break
-    
-    log(f"Request completed in {time.time() - start_time:.1f}s")
-    
-    if _async_error:
-        log(f"Request failed with error: {_async_error}")
-        raise Exception(_async_error)
-    
-    log(f"Returning result: {type(_async_result)}")
-    return _async_result
-
-def make_request_urllib(url, headers, data, timeout=60):
-    """Make HTTP request using urllib (standard library fallback)"""
-    log(f"make_request_urllib() starting...")
-    log(f"  URL: {url}")
-    
     try:
-        import urllib.request
-        import ssl
-        log("urllib.request and ssl imported")
+        result = future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        log(f"Request timeout after {time.time() - start_time:.1f}s", WARNING)
+        req.cancel()
+        raise Exception("Request timeout")
     except Exception as e:
-        log(f"Failed to import urllib/ssl: {e}")
+        log(f"Request failed with error: {e}", WARNING)
         raise
     
-    # Create SSL context that doesn't verify certificates (for Android compatibility)
+    log(f"Request completed in {time.time() - start_time:.1f}s", DEBUG)
+    log(f"Returning result: {type(result)}", DEBUG)
+    return result
+
+def _create_ssl_context():
+    """SSL context without certificate verification (for Android compatibility)."""
     ctx = ssl.create_default_context()
     ctx.check_hostname = False
     ctx.verify_mode = ssl.CERT_NONE
-    log("SSL context created (no verification)")
+    return ctx
+
+
+_SSL_CONTEXT = _create_ssl_context()
+
+
+class _SNIHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPSConnection to an explicit address that sends a different SNI hostname."""
+
+    def __init__(self, host, port=None, server_hostname=None, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self._server_hostname = server_hostname
+
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+        self.sock = self._context.wrap_socket(self.sock, server_hostname=self._server_hostname)
+
+
+class _ProxyHTTPConnection(http.client.HTTPConnection):
+    """Plain HTTP connection to a forward proxy: requests carry the absolute URL."""
+
+    def __init__(self, proxy_host, proxy_port, origin, proxy_headers=None, **kwargs):
+        super().__init__(proxy_host, proxy_port, **kwargs)
+        self._origin = origin
+        self._proxy_headers = proxy_headers or {}
+
+    def putrequest(self, method, url, *args, **kwargs):
+        super().putrequest(method, self._origin + url, *args, **kwargs)
+        for name, value in self._proxy_headers.items():
+            self.putheader(name, value)
+
+
+def _proxy_for(scheme, host):
+    """
+    Forward proxy for requests to host as (proxy_host, proxy_port, headers), or None.
+
+    Same configuration as urllib: HTTP(S)_PROXY / NO_PROXY environment
+    variables, or the system settings on Windows and macOS. headers hold
+    Proxy-Authorization if the proxy URL has credentials.
+    """
+    proxy = urllib.request.getproxies().get(scheme)
+    if not proxy or urllib.request.proxy_bypass(host):
+        return None
+    if '://' not in proxy:
+        proxy = 'http://' + proxy
+    parsed = urlparse(proxy)
+    headers = {}
+    if parsed.username:
+        credentials = f"{unquote(parsed.username)}:{unquote(parsed.password or '')}"
+        headers['Proxy-Authorization'] = 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+    return parsed.hostname, parsed.port or 80, headers
+
+
+class ConnectionPool:
+    """
+    Keep-alive connections to a single endpoint (scheme, address, port, SNI).
+
+    Idle connections are reused by the next request instead of doing a new
+    TCP+TLS handshake; connections idle longer than idle_timeout are closed.
+    A reused connection that turns out to be closed by the server is replaced
+    by a fresh one and the request is retried once. A configured proxy (see
+    _proxy_for) is used like urllib does: a CONNECT tunnel for https, absolute
+    URLs for http.
+    """
+
+    def __init__(self, scheme, host, port, server_hostname=None,
+                 max_idle=POOL_MAX_IDLE_PER_HOST, idle_timeout=POOL_IDLE_TIMEOUT):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.server_hostname = server_hostname
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self._idle = []  # [(connection, last_used)]
+        self._lock = threading.Lock()
+        self.stats = {
+            'requests': 0,
+            'hits': 0,
+            'new_connections': 0,
+            'reconnects': 0,
+            'evicted': 0,
+        }
+
+    def _new_connection(self, timeout):
+        with self._lock:
+            self.stats['new_connections'] += 1
+        proxy = _proxy_for(self.scheme, self.host)
+        if proxy:
+            log(f"Connecting to {self.host}:{self.port} through proxy {proxy[0]}:{proxy[1]}", DEBUG)
+        if self.scheme == 'http':
+            if proxy:
+                return _ProxyHTTPConnection(proxy[0], proxy[1], f"http://{self.host}:{self.port}",
+                                            proxy_headers=proxy[2], timeout=timeout)
+            return http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+        host, port = proxy[:2] if proxy else (self.host, self.port)
+        if self.server_hostname and self.server_hostname != self.host:
+            conn = _SNIHTTPSConnection(host, port, server_hostname=self.server_hostname,
+                                       timeout=timeout, context=_SSL_CONTEXT)
+        else:
+            conn = http.client.HTTPSConnection(host, port, timeout=timeout, context=_SSL_CONTEXT)
+        if proxy:
+            conn.set_tunnel(self.host, self.port, headers=proxy[2])
+        return conn
+
+    def _evict_expired(self, now):
+        """Closes idle connections older than idle_timeout. Caller holds the lock."""
+        alive = []
+        for conn, last_used in self._idle:
+            if now - last_used > self.idle_timeout:
+                conn.close()
+                self.stats['evicted'] += 1
+            else:
+                alive.append((conn, last_used))
+        self._idle = alive
+
+    def acquire(self, timeout):
+        """
+        Returns (connection, reused): an idle connection if available, else a new one.
+        """
+        with self._lock:
+            self.stats['requests'] += 1
+            self._evict_expired(time.monotonic())
+            conn = self._idle.pop()[0] if self._idle else None
+            if conn is not None:
+                self.stats['hits'] += 1
+        if conn is None:
+            return self._new_connection(timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def release(self, conn):
+        """Returns a connection whose response has been fully read to the pool."""
+        with self._lock:
+            if conn.sock is not None and len(self._idle) < self.max_idle:
+                self._idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def open(self, method, path, body, headers, timeout):
+        """
+        Sends a request and returns (connection, response) without reading the body.
+
+        The caller must read the response completely and call finish().
+        """
+        conn, reused = self.acquire(timeout)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            return conn, conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError,
+                http.client.CannotSendRequest, http.client.BadStatusLine):
+            conn.close()
+            if not reused:
+                raise
+        except Exception:
+            conn.close()
+            raise
+        # Server closed the idle keep-alive connection: reconnect once
+        with self._lock:
+            self.stats['reconnects'] += 1
+        conn = self._new_connection(timeout)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            return conn, conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+
+    def finish(self, conn, response):
+        """Releases the connection after its response has been consumed."""
+        if response.will_close or not response.isclosed():
+            conn.close()
+        else:
+            self.release(conn)
+
+    def request(self, method, path, body, headers, timeout):
+        """Sends a request and returns (status, raw_body)."""
+        conn, response = self.open(method, path, body, headers, timeout)
+        try:
+            raw = response.read()
+        except Exception:
+            conn.close()
+            raise
+        self.finish(conn, response)
+        return response.status, raw
+
+    def close(self):
+        """Closes all idle connections."""
+        with self._lock:
+            for conn, _ in self._idle:
+                conn.close()
+            self._idle = []
+
+
+_connection_pools = {}
+_connection_pools_lock = threading.Lock()
+
+
+def get_connection_pool(scheme, host, port=None, server_hostname=None):
+    """Returns the shared ConnectionPool for an endpoint, creating it on first use."""
+    port = port or (80 if scheme == 'http' else 443)
+    key = (scheme, host, port, server_hostname)
+    with _connection_pools_lock:
+        pool = _connection_pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(scheme, host, port, server_hostname=server_hostname)
+            _connection_pools[key] = pool
+        return pool
+
+
+def get_connection_pool_stats():
+    """Returns {"scheme://host:port[ sni=...]": stats} for every pool."""
+    with _connection_pools_lock:
+        pools = list(_connection_pools.values())
+    stats = {}
+    for pool in pools:
+        name = f"{pool.scheme}://{pool.host}:{pool.port}"
+        if pool.server_hostname:
+            name += f" sni={pool.server_hostname}"
+        with pool._lock:
+            stats[name] = dict(pool.stats, idle=len(pool._idle))
+    return stats
+
+
+def close_connection_pools():
+    """Closes idle connections of all pools (e.g. when the app is paused)."""
+    with _connection_pools_lock:
+        pools = list(_connection_pools.values())
+    for pool in pools:
+        pool.close()
+    if _background_loop is not None:
+        _background_loop.call_soon_threadsafe(_close_async_idle)
+
+
+def _pooled_post_json(url, headers, data, timeout, connect_host=None, server_hostname=None):
+    """
+    POSTs JSON through the shared keep-alive pool and returns the decoded response.
+
+    Args:
+        connect_host: Address to connect to instead of the URL host (IP fallback)
+        server_hostname: SNI hostname to send when connecting to connect_host
+    """
+    parsed = urlparse(url)
+    path = parsed.path or "/"
+    if parsed.query:
+        path += "?" + parsed.query
+    pool = get_connection_pool(parsed.scheme, connect_host or parsed.hostname, parsed.port,
+                               server_hostname=server_hostname)
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    status, raw = pool.request('POST', path, body, headers, timeout)
+    if status >= 400:
+        raise HTTPStatusError(status, raw.decode('utf-8', errors='replace'))
+    return json.loads(raw.decode('utf-8'))
+
+
+def make_request_urllib(url, headers, data, timeout=60):
+    """Make HTTP request using the standard library (pooled keep-alive http.client)"""
+    log(f"make_request_urllib() starting...", DEBUG)
+    log(f"  URL: {url}", DEBUG)
+
+    # Force Content-Type with charset
+    headers_copy = dict(headers)
+    headers_copy['Content-Type'] = 'application/json; charset=utf-8'
+
+    try:
+        result = _pooled_post_json(url, headers_copy, data, timeout)
+        log(f"Response parsed successfully", DEBUG)
+        return result
+    except Exception as e:
+        log(f"Request failed: {e}", WARNING)
+        log(f"Traceback: {traceback.format_exc()}", DEBUG)
+        raise
+
+
+def make_request_urllib_ip(url, headers, data, timeout, ip_override):
+    """Attempt request using a direct IP with Host header for openrouter.ai"""
+    log(f"make_request_urllib_ip() starting with IP {ip_override}...")
+
+    # Clone headers and force Host
+    headers_ip = dict(headers)
+    headers_ip["Host"] = "openrouter.ai"
+    headers_ip["Content-Type"] = "application/json; charset=utf-8"
+
+    # SNI will be the IP, so certificate checks are disabled in the shared context
+    result = _pooled_post_json(url, headers_ip, data, timeout, connect_host=ip_override)
+    log(f"Response via IP {ip_override}", DEBUG)
+    return result
+
+
+def make_request_socket_ip(url, headers, data, timeout, ip_override):
+    """Direct HTTPS request to IP with SNI set to openrouter.ai (bypasses DNS)."""
+    host = "openrouter.ai"
+    log(f"make_request_socket_ip() connecting to {ip_override} with SNI={host}")
+
+    request_headers = {
+        "Host": host,
+        "User-Agent": headers.get("User-Agent", "SmartTest/1.0"),
+        "Content-Type": headers.get("Content-Type", "application/json; charset=utf-8"),
+        "Authorization": headers.get("Authorization", ""),
+        "HTTP-Referer": headers.get("HTTP-Referer", ""),
+        "X-Title": headers.get("X-Title", ""),
+        "Accept": "application/json",
+    }
+    request_headers = {k: v for k, v in request_headers.items() if v}
+
+    result = _pooled_post_json(url, request_headers, data, timeout,
+                               connect_host=ip_override, server_hostname=host)
+    log(f"Response via socket IP {ip_override}", DEBUG)
+    return result
+
+def _is_dns_error(e):
+    """True if the exception means openrouter.ai could not be resolved."""
+    reason = getattr(e, "reason", None)
+    reason_msg = str(reason) if reason else ""
+    return (
+        isinstance(e, socket.gaierror)
+        or isinstance(reason, socket.gaierror)
+        or "No address associated with hostname" in str(e)
+        or "No address associated with hostname" in reason_msg
+    )
+
+
+class TransportSelector:
+    """
+    Remembers which HTTP transport works on this device.
+
+    make_request() asks for a plan (the order in which to try transports):
+    the last successful transport goes first, transports that failed
+    TRANSPORT_FAILURE_THRESHOLD times in a row are skipped until their
+    cooldown expires (circuit breaker), and a higher-priority transport is
+    periodically re-probed so a temporary failure does not demote it forever.
+    """
+
+    def __init__(self, names):
+        self.order = list(names)  # Priority order
+        self.preferred = None
+        self._last_probe = 0.0
+        self._lock = threading.Lock()
+        self._stats = {
+            name: {
+                'available': True,
+                'attempts': 0,
+                'successes': 0,
+                'failures': 0,
+                'consecutive_failures': 0,
+                'avg_latency': None,
+                'last_error': None,
+                'circuit_open_until': 0.0,
+            }
+            for name in self.order
+        }
+
+    def plan(self):
+        """Returns transport names in the order they should be tried."""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [n for n in self.order if self._stats[n]['available']]
+            healthy = [n for n in candidates if self._stats[n]['circuit_open_until'] <= now]
+            if not healthy:
+                # Every circuit is open: try everything rather than fail outright
+                return candidates
+            if self.preferred not in healthy:
+                return healthy
+            plan = [self.preferred] + [n for n in healthy if n != self.preferred]
+            higher = [n for n in healthy if self.order.index(n) < self.order.index(self.preferred)]
+            if higher and now - self._last_probe >= TRANSPORT_REPROBE_INTERVAL:
+                self._last_probe = now
+                plan.remove(higher[0])
+                plan.insert(0, higher[0])
+            return plan
+
+    def mark_unavailable(self, name, error):
+        """Excludes a transport that cannot work in this environment at all."""
+        with self._lock:
+            self._stats[name]['available'] = False
+            self._stats[name]['last_error'] = str(error)
+
+    def record_success(self, name, latency):
+        with self._lock:
+            stats = self._stats[name]
+            stats['attempts'] += 1
+            stats['successes'] += 1
+            stats['consecutive_failures'] = 0
+            stats['circuit_open_until'] = 0.0
+            if stats['avg_latency'] is None:
+                stats['avg_latency'] = latency
+            else:
+                stats['avg_latency'] = 0.8 * stats['avg_latency'] + 0.2 * latency
+            if self.preferred != name:
+                self._last_probe = time.monotonic()
+            self.preferred = name
+
+    def record_failure(self, name, error):
+        with self._lock:
+            stats = self._stats[name]
+            stats['attempts'] += 1
+            stats['failures'] += 1
+            stats['consecutive_failures'] += 1
+            stats['last_error'] = str(error)[:300]
+            if stats['consecutive_failures'] >= TRANSPORT_FAILURE_THRESHOLD:
+                stats['circuit_open_until'] = time.monotonic() + TRANSPORT_COOLDOWN
+            if self.preferred == name:
+                self.preferred = None
+
+    def get_stats(self):
+        """Returns the preferred transport and a copy of per-transport counters."""
+        now = time.monotonic()
+        with self._lock:
+            transports = {}
+            for name in self.order:
+                stats = dict(self._stats[name])
+                stats['circuit_open'] = stats.pop('circuit_open_until') > now
+                transports[name] = stats
+            return {'preferred': self.preferred, 'transports': transports}
+
+
+def _make_request_ip_fallback(url, headers, data, timeout):
+    """Tries every fallback IP, first through the IP URL, then with SNI=openrouter.ai."""
+    errors = []
+    for ip in FALLBACK_OPENROUTER_IPS:
+        try:
+            return make_request_urllib_ip(url, headers, data, timeout, ip_override=ip)
+        except HTTPStatusError:
+            raise
+        except Exception as ip_err:
+            errors.append(f"ip {ip}: {ip_err}")
+            log(f"Fallback via {ip} failed: {ip_err}", WARNING)
+        try:
+            return make_request_socket_ip(url, headers, data, timeout, ip_override=ip)
+        except HTTPStatusError:
+            raise
+        except Exception as ip_err:
+            errors.append(f"socket {ip}: {ip_err}")
+            log(f"Socket fallback via {ip} failed: {ip_err}", WARNING)
+    raise Exception('; '.join(errors) or "no fallback IPs configured")
+
+
+# Transports in priority order (Java only works on Android)
+_TRANSPORTS = {
+    'java': make_request_java,
+    'kivy': make_request_kivy,
+    'urllib': make_request_urllib,
+    'ip_fallback': _make_request_ip_fallback,
+}
+_transport_selector = TransportSelector(_TRANSPORTS)
+_dns_broken = False
+
+
+def get_transport_stats():
+    """Returns the currently preferred transport and per-transport latency/failure counters."""
+    return _transport_selector.get_stats()
+
+
+def make_request(url, headers, data, timeout=60):
+    """
+    Make HTTP request using the best available method.
+    Priority on Android: Java HttpURLConnection -> Kivy UrlRequest -> urllib -> IP fallbacks
+
+    The transport that succeeded last is tried first (see TransportSelector).
+    An HTTP error status means the transport works, so it is raised as is
+    instead of repeating the request over the other transports.
+    """
+    global _dns_broken
+    log(f"make_request() starting...", DEBUG)
+    errors = []
+    plan = _transport_selector.plan()
+    log(f"Transport plan: {plan}", DEBUG)
+
+    for name in plan:
+        if name == 'kivy' and threading.current_thread() is threading.main_thread():
+            continue
+        if name == 'ip_fallback' and not _dns_broken and _transport_selector.preferred != name:
+            # Direct IPs are only a workaround for broken DNS
+            continue
+        log(f"Attempting transport: {name}...", DEBUG)
+        start_time = time.monotonic()
+        try:
+            result = _TRANSPORTS[name](url, headers, data, timeout)
+        except ImportError as e:
+            log(f"Transport {name} not available: {e}", WARNING)
+            _transport_selector.mark_unavailable(name, e)
+            continue
+        except HTTPStatusError:
+            _transport_selector.record_success(name, time.monotonic() - start_time)
+            raise
+        except Exception as e:
+            errors.append(f"{name}: {e}")
+            _transport_selector.record_failure(name, e)
+            log(f"Transport {name} failed: {e}", WARNING)
+            log(f"Traceback: {traceback.format_exc()}", DEBUG)
+            if name == 'urllib' and _is_dns_error(e):
+                log("Detected DNS error, direct IP fallbacks for openrouter.ai enabled", WARNING)
+                _dns_broken = True
+            continue
+        _transport_selector.record_success(name, time.monotonic() - start_time)
+        if name == 'urllib':
+            _dns_broken = False
+        return result
     
+    # All methods failed
+    error_msg = f"Все методы HTTP не сработали: {'; '.join(errors)}"
+    log(error_msg, ERROR)
+    raise Exception(error_msg)
+
+_stream_history = deque(maxlen=50)
+_stream_history_lock = threading.Lock()
+
+
+def get_stream_stats():
+    """
+    Returns latency statistics of recent streamed responses.
+
+    time_to_first_token is measured from sending the request to the first
+    non-empty text delta; total is the time until the stream finished.
+    """
+    with _stream_history_lock:
+        history = list(_stream_history)
+    if not history:
+        return {'count': 0}
+    ttfts = [h['time_to_first_token'] for h in history if h['time_to_first_token'] is not None]
+    return {
+        'count': len(history),
+        'avg_time_to_first_token': sum(ttfts) / len(ttfts) if ttfts else None,
+        'avg_total': sum(h['total'] for h in history) / len(history),
+        'last': history[-1],
+    }
+
+
+def iter_stream_deltas(url, headers, data, timeout=60, stats=None):
+    """
+    Sends a chat completion request with "stream": true and yields text deltas.
+
+    OpenRouter answers with server-sent events: "data: {json}" lines carrying
+    choices[0].delta.content, ": comment" keep-alive lines and a final
+    "data: [DONE]". Uses the shared keep-alive pool.
+
+    Args:
+        stats: Optional dict filled with time_to_first_token, total and chunks
+    """
+    parsed = urlparse(url)
+    path = parsed.path or "/"
+    if parsed.query:
+        path += "?" + parsed.query
+    pool = get_connection_pool(parsed.scheme, parsed.hostname, parsed.port)
+
+    headers_copy = dict(headers)
+    headers_copy['Content-Type'] = 'application/json; charset=utf-8'
+    headers_copy['Accept'] = 'text/event-stream'
+    body = json.dumps(dict(data, stream=True), ensure_ascii=False).encode('utf-8')
+
+    if stats is None:
+        stats = {}
+    stats.update(time_to_first_token=None, total=None, chunks=0)
+    start_time = time.monotonic()
+    conn, response = pool.open('POST', path, body, headers_copy, timeout)
+    try:
+        if response.status >= 400:
+            raw = response.read()
+            raise HTTPStatusError(response.status, raw.decode('utf-8', errors='replace'))
+        while True:
+            line = response.readline()
+            if not line:
+                break
+            delta = _parse_stream_line(line)
+            if delta is _STREAM_DONE:
+                # Drain the terminating chunk so the connection can be reused
+                response.read()
+                break
+            if delta:
+                if stats['time_to_first_token'] is None:
+                    stats['time_to_first_token'] = time.monotonic() - start_time
+                stats['chunks'] += 1
+                yield delta
+    except BaseException:
+        conn.close()
+        raise
+    pool.finish(conn, response)
+    _record_stream_stats(stats, start_time)
+
+
+def _parse_stream_line(line):
+    """
+    Returns the text delta of one SSE line, None for lines without text and
+    _STREAM_DONE for the final "data: [DONE]".
+    """
+    line = line.decode('utf-8').strip()
+    if not line.startswith('data:'):
+        return None
+    payload = line[5:].strip()
+    if payload == '[DONE]':
+        return _STREAM_DONE
+    event = json.loads(payload)
+    if 'error' in event:
+        error = event['error']
+        raise HTTPStatusError(error.get('code', 500), error.get('message', str(error)))
+    choices = event.get('choices') or []
+    return (choices[0].get('delta') or {}).get('content') if choices else None
+
+
+_STREAM_DONE = object()
+
+
+def _record_stream_stats(stats, start_time):
+    stats['total'] = time.monotonic() - start_time
+    with _stream_history_lock:
+        _stream_history.append(dict(stats))
+    log(f"Stream finished: ttft={stats['time_to_first_token']}, total={stats['total']:.2f}s, chunks={stats['chunks']}", DEBUG)
+
+
+def make_request_stream(url, headers, data, timeout=60, on_delta=None):
+    """
+    Streaming counterpart of make_request().
+
+    Calls on_delta(text) for every text fragment as it arrives and returns a
+    response in the same shape as make_request(), with the assembled message
+    content and a 'stream_stats' entry. If streaming is not possible with the
+    current network (e.g. DNS only works through the Java stack on Android),
+    falls back to make_request() and delivers the whole content as one delta.
+    """
+    log(f"make_request_stream() starting...", DEBUG)
+    parts = []
+    stats = {}
+    try:
+        for delta in iter_stream_deltas(url, headers, data, timeout, stats=stats):
+            parts.append(delta)
+            if on_delta:
+                on_delta(delta)
+    except HTTPStatusError:
+        raise
+    except Exception as e:
+        if parts:
+            # Part of the answer was already shown; repeating it would duplicate text
+            raise
+        log(f"Streaming failed ({e}), falling back to a regular request", WARNING)
+        result = make_request(url, headers, data, timeout)
+        if on_delta and result.get('choices'):
+            on_delta(result['choices'][0]['message']['content'])
+        return result
+    return {
+        'choices': [{'message': {'role': 'assistant', 'content': ''.join(parts)}}],
+        'stream_stats': stats,
+    }
+
+
+# Request steps: the public API functions are written as generators that
+# yield an _HTTPRequest (or a list of them to run concurrently) and receive
+# the response, or get the transport error raised at the yield. _run_sync()
+# runs them on the blocking transports, _run_async() on asyncio, so both
+# APIs share the prompts and response parsing.
+_HTTPRequest = namedtuple('_HTTPRequest', 'url headers data timeout on_delta', defaults=(60, None))
+
+
+def _perform_request(request):
+    if request.on_delta:
+        return make_request_stream(request.url, request.headers, request.data, request.timeout,
+                                   on_delta=request.on_delta)
+    return make_request(request.url, request.headers, request.data, request.timeout)
+
+
+def _perform_requests(requests):
+    """Runs requests in parallel threads; failed ones are returned as their exception."""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(requests), thread_name_prefix='llm-request') as executor:
+        futures = [executor.submit(_perform_request, request) for request in requests]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def _run_sync(steps):
+    """Drives request steps with the blocking transports and returns their result."""
+    try:
+        request = next(steps)
+        while True:
+            try:
+                if isinstance(request, list):
+                    response = _perform_requests(request)
+                else:
+                    response = _perform_request(request)
+            except Exception as e:
+                request = steps.throw(e)
+            else:
+                request = steps.send(response)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def _aperform_request(request):
+    if request.on_delta:
+        return await amake_request_stream(request.url, request.headers, request.data, request.timeout,
+                                          on_delta=request.on_delta)
+    return await amake_request(request.url, request.headers, request.data, request.timeout)
+
+
+async def _run_async(steps):
+    """Drives request steps on the running event loop and returns their result."""
+    try:
+        request = next(steps)
+        while True:
+            try:
+                if isinstance(request, list):
+                    response = await asyncio.gather(*(_aperform_request(r) for r in request),
+                                                    return_exceptions=True)
+                else:
+                    response = await _aperform_request(request)
+            except Exception as e:
+                request = steps.throw(e)
+            else:
+                request = steps.send(response)
+    except StopIteration as stop:
+        return stop.value
+    finally:
+        # Cancelled: let the steps run their cleanup
+        steps.close()
+
+
+class ResponseCache:
+    """
+    Disk-backed cache of chat completion responses.
+
+    Entries are keyed by a SHA-256 hash of the request (URL, model, messages
+    and parameters; headers such as the API key are not part of the key) and
+    stored as one JSON file each, so the cache survives restarts. Entries
+    expire after ttl seconds; beyond max_entries or max_bytes the least
+    recently used ones are evicted (file mtime records the last use). Only
+    the functions listed in `functions` are cached. Thread-safe.
+    """
+
+    def __init__(self, directory, ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                 max_bytes=RESPONSE_CACHE_MAX_BYTES, functions=RESPONSE_CACHE_FUNCTIONS):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.functions = set(functions)
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'by_function': {}}
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self._total_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            files.append((st.st_mtime, name[:-5], st.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    @staticmethod
+    def key(request):
+        payload = json.dumps({'url': request.url, 'data': request.data}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def _count(self, function, stat):
+        self.stats[stat] += 1
+        counters = self.stats['by_function'].setdefault(function, {'hits': 0, 'misses': 0})
+        counters[stat] += 1
+
+    def get(self, function, request):
+        """Returns the cached response for the request, or None."""
+        if function not in self.functions:
+            return None
+        key = self.key(request)
+        with self._lock:
+            if key not in self._entries:
+                self._count(function, 'misses')
+                return None
+            path = self._path(key)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                entry = None
+            if entry is None or time.time() - entry.get('created', 0) > self.ttl:
+                self._remove(key)
+                self._count(function, 'misses')
+                return None
+            self._entries.move_to_end(key)
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            self._count(function, 'hits')
+            return entry['response']
+
+    def put(self, function, request, response):
+        """Stores a response that the caller has validated."""
+        if function not in self.functions:
+            return
+        key = self.key(request)
+        with self._lock:
+            if key in self._entries:
+                # Same request, same response: keep the original creation time
+                return
+        entry = {'created': time.time(), 'function': function, 'response': response}
+        raw = json.dumps(entry, ensure_ascii=False).encode('utf-8')
+        with self._lock:
+            path = self._path(key)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(raw)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                log(f"Response cache write failed: {e}", WARNING)
+                return
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(raw)
+            self._total_bytes += len(raw)
+            self.stats['stores'] += 1
+            self._evict()
+
+    def _remove(self, key):
+        self._total_bytes -= self._entries.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats, entries=len(self._entries), bytes=self._total_bytes)
+            stats['by_function'] = {name: dict(c) for name, c in self.stats['by_function'].items()}
+            return stats
+
+
+_response_cache = None
+
+
+def configure_response_cache(directory, **options):
+    """
+    Enables the response cache in `directory` (e.g. the app's user_data_dir).
+
+    Options are passed to ResponseCache (ttl, max_entries, max_bytes,
+    functions). Returns the cache; configure_response_cache(None) disables it.
+    """
+    global _response_cache
+    _response_cache = ResponseCache(directory, **options) if directory else None
+    return _response_cache
+
+
+def get_response_cache_stats():
+    """Returns hit/miss/eviction counters of the response cache, or None if it is off."""
+    cache = _response_cache
+    return cache.get_stats() if cache is not None else None
+
+
+def _cache_get(function, request):
+    """Cached response for a request of `function`; replays it to request.on_delta."""
+    cache = _response_cache
+    if cache is None:
+        return None
+    response = cache.get(function, request)
+    if response is not None:
+        log(f"Response cache hit ({function})", DEBUG)
+        if request.on_delta:
+            request.on_delta(response['choices'][0]['message']['content'])
+    return response
+
+
+def _cache_put(function, request, response):
+    cache = _response_cache
+    if cache is not None:
+        cache.put(function, request, {'choices': response['choices']})
+
+
+class AsyncConnection:
+    """
+    An HTTP/1.1 client connection on asyncio streams.
+
+    Idle connections are kept per event loop (see _async_acquire) and
+    reused like the ConnectionPool connections of the blocking transport,
+    including the proxy handling (see _proxy_for).
+    """
+
+    def __init__(self, key, reader, writer):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.last_used = time.monotonic()
+        self.keep_alive = False
+        self.timeout = 60
+        self.origin = ''  # "http://host:port" when requests go to a forward proxy
+        self.proxy_headers = {}
+        self._chunked = False
+        self._length = None
+
+    def is_usable(self):
+        return (not self.writer.is_closing() and not self.reader.at_eof()
+                and time.monotonic() - self.last_used < POOL_IDLE_TIMEOUT)
+
+    async def send(self, path, host, headers, body, timeout):
+        """Sends a POST request and reads the status line and headers; returns the status."""
+        self.timeout = timeout
+        lines = [f"POST {self.origin}{path} HTTP/1.1", f"Host: {host}", f"Content-Length: {len(body)}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()
+                  if name.lower() not in ('host', 'content-length')]
+        lines += [f"{name}: {value}" for name, value in self.proxy_headers.items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8') + body)
+        await asyncio.wait_for(self.writer.drain(), timeout)
+
+        status_line = await asyncio.wait_for(self.reader.readline(), timeout)
+        if not status_line:
+            raise ConnectionResetError("Server closed the connection")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await asyncio.wait_for(self.reader.readline(), timeout)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        self._chunked = response_headers.get('transfer-encoding', '').lower() == 'chunked'
+        self._length = int(response_headers['content-length']) if 'content-length' in response_headers else None
+        self.keep_alive = (response_headers.get('connection', '').lower() != 'close'
+                           and (self._chunked or self._length is not None))
+        return status
+
+    async def iter_body(self):
+        """Yields the response body as it arrives."""
+        read = lambda coro: asyncio.wait_for(coro, self.timeout)
+        if self._chunked:
+            while True:
+                size = int((await read(self.reader.readline())).split(b';')[0].strip(), 16)
+                if size == 0:
+                    # Skip trailers up to the final empty line
+                    while (await read(self.reader.readline())) not in (b'\r\n', b'\n', b''):
+                        pass
+                    return
+                chunk = await read(self.reader.readexactly(size + 2))
+                yield chunk[:-2]
+        elif self._length is not None:
+            if self._length:
+                yield await read(self.reader.readexactly(self._length))
+        else:
+            while True:
+                chunk = await read(self.reader.read(65536))
+                if not chunk:
+                    return
+                yield chunk
+
+    async def read_body(self):
+        return b''.join([chunk async for chunk in self.iter_body()])
+
+    def close(self):
+        self.keep_alive = False
+        self.writer.close()
+
+
+_async_idle = weakref.WeakKeyDictionary()  # event loop -> {endpoint key: [AsyncConnection]}
+
+
+def _close_async_idle():
+    """Closes idle asyncio connections of the running event loop."""
+    for idle in _async_idle.pop(asyncio.get_running_loop(), {}).values():
+        for conn in idle:
+            conn.close()
+
+
+async def _async_acquire(scheme, host, port, server_hostname, timeout):
+    """Returns (connection, reused) for an endpoint of the running event loop."""
+    key = (scheme, host, port, server_hostname)
+    idle = _async_idle.setdefault(asyncio.get_running_loop(), {}).setdefault(key, [])
+    while idle:
+        conn = idle.pop()
+        if conn.is_usable():
+            return conn, True
+        conn.close()
+    ssl_context = _SSL_CONTEXT if scheme == 'https' else None
+    proxy = _proxy_for(scheme, host)
+    if proxy is None:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=ssl_context,
+                                    server_hostname=(server_hostname or host) if ssl_context else None),
+            timeout)
+        return AsyncConnection(key, reader, writer), False
+
+    log(f"Connecting to {host}:{port} through proxy {proxy[0]}:{proxy[1]}", DEBUG)
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(proxy[0], proxy[1]), timeout)
+    try:
+        if ssl_context:
+            await asyncio.wait_for(_async_tunnel(reader, writer, host, port, proxy[2]), timeout)
+            await asyncio.wait_for(writer.start_tls(ssl_context, server_hostname=server_hostname or host), timeout)
+    except BaseException:
+        writer.close()
+        raise
+    conn = AsyncConnection(key, reader, writer)
+    if not ssl_context:
+        conn.origin = f"http://{host}:{port}"
+        conn.proxy_headers = proxy[2]
+    return conn, False
+
+
+async def _async_tunnel(reader, writer, host, port, headers):
+    """Opens a CONNECT tunnel to host:port on a connection to a proxy."""
+    lines = [f"CONNECT {host}:{port} HTTP/1.1", f"Host: {host}:{port}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+    await writer.drain()
+    status_line = await reader.readline()
+    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+        pass
+    parts = status_line.split()
+    if len(parts) < 2 or parts[1] != b'200':
+        raise OSError(f"Tunnel connection failed: {status_line.decode('latin-1').strip()}")
+
+
+def _async_release(conn):
+    """Keeps a connection whose response has been fully read for the next request."""
+    idle = _async_idle.setdefault(asyncio.get_running_loop(), {}).setdefault(conn.key, [])
+    if conn.keep_alive and len(idle) < POOL_MAX_IDLE_PER_HOST:
+        conn.last_used = time.monotonic()
+        idle.append(conn)
+    else:
+        conn.close()
+
+
+async def _async_open(url, headers, data, timeout, connect_host=None, server_hostname=None):
+    """
+    Sends a JSON POST over a pooled asyncio connection and returns (connection, status).
+
+    The caller must consume the body and then call _async_release() (or
+    close the connection).
+    """
+    parsed = urlparse(url)
+    path = parsed.path or "/"
+    if parsed.query:
+        path += "?" + parsed.query
+    port = parsed.port or (80 if parsed.scheme == 'http' else 443)
+    host_header = headers.get('Host') or parsed.netloc
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+    conn, reused = await _async_acquire(parsed.scheme, connect_host or parsed.hostname, port,
+                                        server_hostname, timeout)
+    try:
+        return conn, await conn.send(path, host_header, headers, body, timeout)
+    except (ConnectionError, asyncio.IncompleteReadError):
+        conn.close()
+        if not reused:
+            raise
+    except BaseException:
+        conn.close()
+        raise
+    # Server closed the idle keep-alive connection: reconnect once
+    conn, _ = await _async_acquire(parsed.scheme, connect_host or parsed.hostname, port,
+                                   server_hostname, timeout)
+    try:
+        return conn, await conn.send(path, host_header, headers, body, timeout)
+    except BaseException:
+        conn.close()
+        raise
+
+
+async def _async_post_json(url, headers, data, timeout, connect_host=None, server_hostname=None):
+    conn, status = await _async_open(url, headers, data, timeout, connect_host, server_hostname)
+    try:
+        raw = await conn.read_body()
+    except BaseException:
+        conn.close()
+        raise
+    _async_release(conn)
+    if status >= 400:
+        raise HTTPStatusError(status, raw.decode('utf-8', errors='replace'))
+    return json.loads(raw.decode('utf-8'))
+
+
+async def amake_request(url, headers, data, timeout=60):
+    """
+    asyncio counterpart of make_request().
+
+    Uses non-blocking keep-alive connections; if the host cannot be resolved,
+    the fallback IPs are tried with SNI=openrouter.ai. When the non-blocking
+    transport does not work at all (e.g. on Android where DNS may only work
+    through the Java stack), the request falls back to make_request() in a
+    worker thread. Cancelling the task closes the connection.
+    """
+    log(f"amake_request() starting...", DEBUG)
+    headers_copy = dict(headers)
+    headers_copy['Content-Type'] = 'application/json; charset=utf-8'
     try:
-        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
-        log(f"Request body prepared, length: {len(body)}")
-    except Exception as e:
-        log(f"Failed to serialize data: {e}")
+        return await _async_post_json(url, headers_copy, data, timeout)
+    except (HTTPStatusError, asyncio.TimeoutError):
         raise
-    
-    # Force Content-Type with charset
+    except Exception as e:
+        log(f"Async transport failed: {e}", WARNING)
+        if _is_dns_error(e):
+            host = urlparse(url).hostname
+            for ip in FALLBACK_OPENROUTER_IPS:
+                try:
+                    return await _async_post_json(url, headers_copy, data, timeout,
+                                                  connect_host=ip, server_hostname=host)
+                except HTTPStatusError:
+                    raise
+                except Exception as ip_err:
+                    log(f"Async fallback via {ip} failed: {ip_err}", WARNING)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, make_request, url, headers, data, timeout)
+
+
+async def aiter_stream_deltas(url, headers, data, timeout=60, stats=None):
+    """asyncio counterpart of iter_stream_deltas()."""
     headers_copy = dict(headers)
     headers_copy['Content-Type'] = 'application/json; charset=utf-8'
-    
+    headers_copy['Accept'] = 'text/event-stream'
+
+    if stats is None:
+        stats = {}
+    stats.update(time_to_first_token=None, total=None, chunks=0)
+    start_time = time.monotonic()
+    conn, status = await _async_open(url, headers_copy, dict(data, stream=True), timeout)
     try:
-        req = urllib.request.Request(
-            url,
-            data=body,
-            headers=headers_copy,
-            method='POST'
-        )
-        log("urllib.request.Request created")
-    except Exception as e:
-        log(f"Failed to create Request: {e}")
+        if status >= 400:
+            raw = await conn.read_body()
+            raise HTTPStatusError(status, raw.decode('utf-8', errors='replace'))
+        buffer = b''
+        done = False
+        async for chunk in conn.iter_body():
+            if done:
+                # Drain the rest of the body so the connection can be reused
+                continue
+            buffer += chunk
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                delta = _parse_stream_line(line)
+                if delta is _STREAM_DONE:
+                    done = True
+                    break
+                if delta:
+                    if stats['time_to_first_token'] is None:
+                        stats['time_to_first_token'] = time.monotonic() - start_time
+                    stats['chunks'] += 1
+                    yield delta
+    except BaseException:
+        conn.close()
         raise
-    
+    _async_release(conn)
+    _record_stream_stats(stats, start_time)
+
+
+async def amake_request_stream(url, headers, data, timeout=60, on_delta=None):
+    """asyncio counterpart of make_request_stream()."""
+    log(f"amake_request_stream() starting...", DEBUG)
+    parts = []
+    stats = {}
     try:
-        log("Opening URL...")
-        with urllib.request.urlopen(req, timeout=timeout, context=ctx) as response:
-            log(f"Response received, status: {response.status}")
-            result = json.loads(response.read().decode('utf-8'))
-            log(f"Response parsed successfully")
-            return result
-    except Exception as e:
-        log(f"urlopen failed: {e}")
-        log(f"Traceback: {traceback.format_exc()}")
+        async for delta in aiter_stream_deltas(url, headers, data, timeout, stats=stats):
+            parts.append(delta)
+            if on_delta:
+                on_delta(delta)
+    except (HTTPStatusError, asyncio.TimeoutError):
         raise
+    except Exception as e:
+        if parts:
+            raise
+        log(f"Async streaming failed ({e}), falling back to a regular request", WARNING)
+        result = await amake_request(url, headers, data, timeout)
+        if on_delta and result.get('choices'):
+            on_delta(result['choices'][0]['message']['content'])
+        return result
+    return {
+        'choices': [{'message': {'role': 'assistant', 'content': ''.join(parts)}}],
+        'stream_stats': stats,
+    }
 
 
-def make_request_urllib_ip(url, headers, data, timeout, ip_override):
-    """Attempt urllib request using a direct IP with Host header for openrouter.ai"""
-    import urllib.request
-    import ssl
+_background_loop = None
+_background_loop_lock = threading.Lock()
 
-    log(f"make_request_urllib_ip() starting with IP {ip_override}...")
 
-    # Clone headers and force Host
-    headers_ip = dict(headers)
-    headers_ip["Host"] = "openrouter.ai"
+def get_background_loop():
+    """Returns the shared asyncio event loop, starting its daemon thread on first use."""
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='llm-asyncio', daemon=True).start()
+            _background_loop = loop
+        return _background_loop
 
-    # Build URL with IP
-    request_url = url.replace("https://openrouter.ai", f"https://{ip_override}")
-    log(f"  Request URL: {request_url}")
 
-    # SSL context without verification (SNI will be IP, so we must disable checks)
-    ctx = ssl.create_default_context()
-    ctx.check_hostname = False
-    ctx.verify_mode = ssl.CERT_NONE
+def submit_async(coro, callback=None):
+    """
+    Runs a coroutine (e.g. agenerate_quiz(...)) on the shared background loop.
 
-    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
-    headers_ip["Content-Type"] = "application/json; charset=utf-8"
-    req = urllib.request.Request(
-        request_url,
-        data=body,
-        headers=headers_ip,
-        method='POST'
-    )
+    Returns a concurrent.futures.Future; future.cancel() cancels the
+    coroutine together with its in-flight HTTP request. callback(future), if
+    given, is called from the loop thread once the coroutine finishes or is
+    cancelled, so UI code has to hop back to its own thread.
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, get_background_loop())
+    if callback:
+        future.add_done_callback(callback)
+    return future
 
-    with urllib.request.urlopen(req, timeout=timeout, context=ctx) as response:
-        log(f"Response via IP {ip_override}, status: {response.status}")
-        return json.loads(response.read().decode('utf-8'))
 
+def _is_valid_question(item):
+    """Checks a multiple-choice question: text, exactly 4 options and answer index 0..3."""
+    return (isinstance(item, dict) and
+            'question' in item and isinstance(item['question'], str) and
+            'options' in item and isinstance(item['options'], list) and len(item['options']) == 4 and
+            'answer' in item and isinstance(item['answer'], int) and 0 <= item['answer'] <= 3)
 
-def make_request_socket_ip(url, headers, data, timeout, ip_override):
-    """Direct socket HTTPS request to IP with SNI set to openrouter.ai (bypasses DNS)."""
-    import ssl as ssl_module
-    from urllib.parse import urlparse
 
-    parsed = urlparse(url)
-    host = "openrouter.ai"
-    path = parsed.path or "/"
-    if parsed.query:
-        path += "?" + parsed.query
+_JSON_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
 
-    body = json.dumps(data, ensure_ascii=False).encode("utf-8")
 
-    ctx = ssl_module.create_default_context()
-    ctx.check_hostname = False
-    ctx.verify_mode = ssl_module.CERT_NONE
+class QuizStreamParser:
+    """
+    Incremental parser for the streamed {"theory": ..., "questions": [...]} quiz object.
 
-    log(f"make_request_socket_ip() connecting to {ip_override}:{parsed.port or 443} with SNI={host}")
+    feed() accepts text chunks as they arrive and looks at every character
+    only once. The theory string is decoded on the fly and reported through
+    on_theory(text_so_far); each element of "questions" is parsed as soon as
+    its closing brace arrives and, if it passes _is_valid_question(), is
+    reported through on_question(question). Other top-level values (e.g.
+    "meta") are parsed when they end. Text around the object (Markdown code
+    fences) is ignored.
+    """
 
-    sock = socket.create_connection((ip_override, parsed.port or 443), timeout=timeout)
-    ssl_sock = ctx.wrap_socket(sock, server_hostname=host)
+    def __init__(self, on_theory=None, on_question=None):
+        self.on_theory = on_theory
+        self.on_question = on_question
+        self.theory = ''
+        self.questions = []
+        self.values = {}
+        self.complete = False
+        self._buffer = []  # Raw text of the current question or top-level value
+        self._stack = []  # Open containers: '{' or '['
+        self._in_string = False
+        self._escape = ''
+        self._key = None
+        self._key_chars = None
+        self._expect_key = False
+        self._value_key = None  # Top-level key whose value is being read
+        self._mode = None  # 'theory', 'questions', 'value' or None
+        self._theory_pending = []
 
-    # Build HTTP/1.1 request manually
-    request_headers = {
-        "Host": host,
-        "User-Agent": headers.get("User-Agent", "SmartTest/1.0"),
-        "Content-Type": headers.get("Content-Type", "application/json; charset=utf-8"),
-        "Authorization": headers.get("Authorization", ""),
-        "HTTP-Referer": headers.get("HTTP-Referer", ""),
-        "X-Title": headers.get("X-Title", ""),
-        "Accept": "application/json",
-        "Content-Length": str(len(body)),
-        "Connection": "close",
-    }
+    def feed(self, chunk):
+        for ch in chunk:
+            self._feed_char(ch)
+        if self._theory_pending:
+            self._flush_theory()
 
-    header_lines = "\r\n".join([f"{k}: {v}" for k, v in request_headers.items() if v])
-    request_bytes = f"POST {path} HTTP/1.1\r\n{header_lines}\r\n\r\n".encode("utf-8") + body
+    def _flush_theory(self):
+        text = ''.join(self._theory_pending)
+        self._theory_pending = []
+        # Keep a high surrogate until its pair arrives (\uD83D\uDE00 escapes)
+        if text and '\ud800' <= text[-1] <= '\udbff':
+            self._theory_pending.append(text[-1])
+            text = text[:-1]
+        if not text:
+            return
+        text = text.encode('utf-16', 'surrogatepass').decode('utf-16', 'replace')
+        self.theory += text
+        if self.on_theory:
+            self.on_theory(self.theory)
 
-    ssl_sock.sendall(request_bytes)
+    def _feed_char(self, ch):
+        if self.complete:
+            return
+        depth = len(self._stack)
+        if self._mode in ('questions', 'value') and depth >= 2:
+            self._buffer.append(ch)
+        elif self._mode == 'value' and depth == 1 and (self._in_string or ch not in ',}'):
+            self._buffer.append(ch)
 
-    response = http.client.HTTPResponse(ssl_sock)
-    response.begin()
-    status = response.status
-    raw = response.read()
-    log(f"Response via socket IP {ip_override}, status: {status}, len={len(raw)}")
+        if self._in_string:
+            if self._escape:
+                self._escape += ch
+                if self._escape[1] == 'u' and len(self._escape) < 6:
+                    return
+                if self._mode == 'theory' and depth == 1:
+                    if self._escape[1] == 'u':
+                        self._theory_pending.append(chr(int(self._escape[2:], 16)))
+                    else:
+                        self._theory_pending.append(_JSON_ESCAPES.get(self._escape[1], self._escape[1]))
+                elif self._key_chars is not None:
+                    self._key_chars.append(self._escape)
+                self._escape = ''
+            elif ch == '\\':
+                self._escape = ch
+            elif ch == '"':
+                self._in_string = False
+                self._on_string_end(depth)
+            elif self._mode == 'theory' and depth == 1:
+                self._theory_pending.append(ch)
+            elif self._key_chars is not None:
+                self._key_chars.append(ch)
+            return
 
-    if status >= 400:
-        raise Exception(f"HTTP {status}: {raw[:200]}")
+        if ch.isspace():
+            return
+        if depth == 0:
+            if ch == '{':
+                self._stack.append('{')
+                self._expect_key = True
+            return
+
+        if depth == 1:
+            if self._expect_key:
+                if ch == '"':
+                    self._in_string = True
+                    self._key_chars = []
+                elif ch == '}':
+                    self._stack.pop()
+                    self.complete = True
+                return
+            if ch == ':':
+                return
+            if ch in ',}':
+                self._finish_value()
+                if ch == '}':
+                    self._stack.pop()
+                    self.complete = True
+                else:
+                    self._expect_key = True
+                return
+            if self._mode is None:
+                self._start_value(ch)
+            if ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                self._stack.append(ch)
+            return
 
-    return json.loads(raw.decode("utf-8"))
+        # Inside a nested container
+        if ch == '"':
+            self._in_string = True
+        elif ch in '{[':
+            if self._mode == 'questions' and depth == 2:
+                self._buffer = [ch]
+            self._stack.append(ch)
+        elif ch in '}]':
+            self._stack.pop()
+            if self._mode == 'questions' and depth == 3:
+                self._finish_question()
 
-def make_request(url, headers, data, timeout=60):
+    def _start_value(self, ch):
+        self._value_key = self._key
+        if self._key == 'theory' and ch == '"':
+            self._mode = 'theory'
+        elif self._key == 'questions' and ch == '[':
+            self._mode = 'questions'
+        else:
+            self._mode = 'value'
+            self._buffer = [ch]
+
+    def _on_string_end(self, depth):
+        if depth != 1:
+            return
+        if self._key_chars is not None:
+            self._key = json.loads('"' + ''.join(self._key_chars) + '"')
+            self._key_chars = None
+            self._expect_key = False
+        elif self._mode == 'theory':
+            self._flush_theory()
+
+    def _finish_question(self):
+        try:
+            item = json.loads(''.join(self._buffer))
+        except json.JSONDecodeError:
+            item = None
+        self._buffer = []
+        self.questions.append(item)
+        if _is_valid_question(item) and self.on_question:
+            self.on_question(item)
+
+    def _finish_value(self):
+        if self._mode == 'theory':
+            self.values[self._value_key] = self.theory
+        elif self._mode == 'questions':
+            self.values[self._value_key] = self.questions
+        elif self._mode == 'value':
+            try:
+                self.values[self._value_key] = json.loads(''.join(self._buffer))
+            except json.JSONDecodeError:
+                pass
+            self._buffer = []
+        self._mode = None
+        self._value_key = None
+
+    def result(self):
+        """The parsed top-level object (only meaningful once complete is True)."""
+        return dict(self.values)
+
+_IMAGE_MIME_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp'
+}
+
+# Format names people use that Pillow knows under another name
+_IMAGE_FORMAT_ALIASES = {'JPG': 'JPEG', 'TIF': 'TIFF'}
+
+# Multiple of 3, so chunks encode to base64 without padding and can be joined
+_BASE64_CHUNK = 3 * 64 * 1024
+
+
+class ImageCache:
     """
-    Make HTTP request using the best available method.
-    Priority on Android: Java HttpURLConnection -> Kivy UrlRequest -> urllib -> IP fallbacks
+    In-memory LRU of encoded images (data URLs).
+
+    Keyed by the SHA-256 of the file and the encoding settings, so an
+    edited file or other settings miss the cache. Holds at most max_bytes
+    of data URLs. Thread-safe.
     """
-    log(f"make_request() starting...")
-    errors = []
-    
-    # On Android, try Java HttpURLConnection FIRST (uses native Android network stack)
-    if IS_ANDROID:
-        log("Attempting Java HttpURLConnection (Android native)...")
-        try:
-            return make_request_java(url, headers, data, timeout)
-        except ImportError as e:
-            log(f"Java HTTP not available: {e}")
-        except Exception as e:
-            errors.append(f"Java: {e}")
-            log(f"Java HTTP failed: {e}")
-            log(f"Traceback: {traceback.format_exc()}")
-    
-    # Try Kivy UrlRequest
-    log("Attempting Kivy UrlRequest...")
-    try:
-        return make_request_kivy(url, headers, data, timeout)
-    except ImportError as e:
-        log(f"Kivy UrlRequest not available: {e}")
-    except Exception as e:
-        errors.append(f"Kivy: {e}")
-        log(f"Kivy UrlRequest failed: {e}")
-        log(f"Traceback: {traceback.format_exc()}")
-    
-    # Try urllib (standard library, should always work)
-    log("Attempting urllib...")
+
+    def __init__(self, max_bytes=IMAGE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'file_bytes': 0, 'wire_bytes': 0}
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> data URL, least recently used first
+        self._bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            data_url = self._entries.get(key)
+            if data_url is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return data_url
+
+    def put(self, key, data_url, file_bytes):
+        with self._lock:
+            self.stats['file_bytes'] += file_bytes
+            self.stats['wire_bytes'] += len(data_url)
+            if key in self._entries or len(data_url) > self.max_bytes:
+                return
+            self._entries[key] = data_url
+            self._bytes += len(data_url)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), bytes=self._bytes)
+
+
+_image_cache = ImageCache()
+
+
+def get_image_cache_stats():
+    """Returns hit/miss counters and file vs. on-the-wire bytes of encoded images."""
+    return _image_cache.get_stats()
+
+
+@functools.lru_cache(maxsize=None)
+def _pillow():
+    """(Image, ImageOps) from Pillow, or None if it is not installed."""
     try:
-        return make_request_urllib(url, headers, data, timeout)
-    except Exception as e:
-        errors.append(f"urllib: {e}")
-        log(f"urllib failed: {e}")
-        log(f"Traceback: {traceback.format_exc()}")
-        # If DNS resolution failed, try direct IP fallbacks
-        reason = getattr(e, "reason", None)
-        reason_msg = str(reason) if reason else ""
-        is_dns_error = (
-            isinstance(e, socket.gaierror)
-            or isinstance(reason, socket.gaierror)
-            or "No address associated with hostname" in str(e)
-            or "No address associated with hostname" in reason_msg
-        )
-        if reason:
-            log(f"urllib error reason: {reason} ({type(reason)})")
-        if is_dns_error:
-            log("Detected DNS error, trying direct IP fallbacks for openrouter.ai ...")
-            for ip in FALLBACK_OPENROUTER_IPS:
-                try:
-                    return make_request_urllib_ip(url, headers, data, timeout, ip_override=ip)
-                except Exception as ip_err:
-                    errors.append(f"ip {ip}: {ip_err}")
-                    log(f"Fallback via {ip} failed: {ip_err}")
-                    log(f"Traceback: {traceback.format_exc()}")
-                try:
-                    return make_request_socket_ip(url, headers, data, timeout, ip_override=ip)
-                except Exception as ip_err:
-                    errors.append(f"socket {ip}: {ip_err}")
-                    log(f"Socket fallback via {ip} failed: {ip_err}")
-                    log(f"Traceback: {traceback.format_exc()}")
-    
-    # All methods failed
-    error_msg = f"Все методы HTTP не сработали: {'; '.join(errors)}"
-    log(error_msg)
-    raise Exception(error_msg)
+        from PIL import Image, ImageOps
+    except ImportError:
+        log("Pillow not installed: images are sent without downscaling", WARNING)
+        return None
+    return Image, ImageOps
+
+
+def _base64_stream(f):
+    """Base64 of a file object, read and encoded chunk by chunk."""
+    parts = []
+    for chunk in iter(lambda: f.read(_BASE64_CHUNK), b''):
+        parts.append(base64.b64encode(chunk).decode('ascii'))
+    return ''.join(parts)
+
+
+def _recompress_image(image_path, max_side, quality, image_format):
+    """Downscaled copy of the image without EXIF: (BytesIO, MIME type, description), or None to send the file as is."""
+    Image, ImageOps = _pillow()
+    if image_format not in Image.SAVE:
+        Image.init()  # Loads every plugin (preinit covers only JPEG, PNG, GIF, BMP and PPM)
+        if image_format not in Image.SAVE:
+            raise ValueError(f"Pillow cannot write {image_format} images")
+    with Image.open(image_path) as source:
+        source_format = source.format
+        source_size = source.size
+        has_exif = bool(source.info.get('exif'))
+        # JPEG: decode directly at a reduced scale that still covers the target size
+        scale = min(1.0, max_side / max(source_size))
+        source.draft('RGB', (math.ceil(source_size[0] * scale), math.ceil(source_size[1] * scale)))
+        image = ImageOps.exif_transpose(source)
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        if image.mode in ('RGBA', 'LA', 'P', 'PA'):
+            # JPEG has no alpha: flatten onto white
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        else:
+            image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGBA')
+
+    buffer = io.BytesIO()
+    # Nothing from source.info is passed on: EXIF (location, camera) is dropped
+    image.save(buffer, format=image_format, quality=quality, optimize=True)
+    resized = image.size != source_size
+    if not resized and not has_exif and source_format == image_format \
+            and buffer.tell() >= os.path.getsize(image_path):
+        # Already small and clean: the re-encoded copy would only be bigger
+        return None
+    mime_type = Image.MIME.get(image_format, 'image/jpeg')
+    width, height = image.size
+    buffer.seek(0)
+    return buffer, mime_type, f"{width}x{height} {image_format} q{quality}"
 
-def encode_image_to_base64(image_path):
+
+def encode_image_to_base64(image_path, max_side=None, quality=None, image_format=None):
     """
     Кодирует изображение в base64 строку.
+
+    With Pillow installed the image is decoded, scaled down so that the
+    longer side is at most max_side, stripped of EXIF (orientation is
+    applied first) and re-encoded as image_format with the given quality;
+    without Pillow, or if recompressing fails for any reason (a file Pillow
+    cannot decode, a photo above its decompression-bomb limit, a format it
+    cannot write), the file is sent as is. Results are cached by file hash and settings (see ImageCache).
     
     Args:
         image_path: Путь к файлу изображения
+        max_side: Longer side in pixels (IMAGE_MAX_SIDE by default)
+        quality: JPEG/WEBP quality 1-95 (IMAGE_QUALITY by default)
+        image_format: Pillow format name, e.g. 'JPEG' ('JPG') or 'WEBP' (IMAGE_FORMAT by default)
         
     Returns:
         str: Base64-encoded строка изображения с префиксом data URL
     """
+    max_side = max_side or IMAGE_MAX_SIDE
+    quality = quality or IMAGE_QUALITY
+    image_format = (image_format or IMAGE_FORMAT).upper()
+    image_format = _IMAGE_FORMAT_ALIASES.get(image_format, image_format)
+    started = time.perf_counter()
     try:
+        digest = hashlib.sha256()
         with open(image_path, 'rb') as image_file:
-            encoded = base64.b64encode(image_file.read()).decode('utf-8')
-            # Определяем MIME тип по расширению
-            extension = Path(image_path).suffix.lower()
-            mime_types = {
-                '.jpg': 'image/jpeg',
-                '.jpeg': 'image/jpeg',
-                '.png': 'image/png',
-                '.gif': 'image/gif',
-                '.webp': 'image/webp'
-            }
-            mime_type = mime_types.get(extension, 'image/jpeg')
-            return f"data:{mime_type};base64,{encoded}"
+            for chunk in iter(lambda: image_file.read(1024 * 1024), b''):
+                digest.update(chunk)
+            file_bytes = image_file.tell()
+        use_pillow = _pillow() is not None
+        key = (digest.hexdigest(), use_pillow and (max_side, quality, image_format))
+        data_url = _image_cache.get(key)
+        if data_url is not None:
+            log(f"Image cache hit: {image_path}", DEBUG)
+            return data_url
+
+        recompressed = None
+        if use_pillow:
+            try:
+                recompressed = _recompress_image(image_path, max_side, quality, image_format)
+            except Exception as e:
+                # Not only OSError/ValueError: e.g. DecompressionBombError for very large photos
+                log(f"Cannot recompress {image_path}: {e!r}; sending the file as is", WARNING)
+        if recompressed is not None:
+            buffer, mime_type, description = recompressed
+            encoded = _base64_stream(buffer)
+        else:
+            with open(image_path, 'rb') as image_file:
+                encoded = _base64_stream(image_file)
+            mime_type = _IMAGE_MIME_TYPES.get(Path(image_path).suffix.lower(), 'image/jpeg')
+            description = 'original file'
+        data_url = f"data:{mime_type};base64,{encoded}"
     except Exception as e:
-        log(f"Error encoding image: {e}")
+        log(f"Error encoding image: {e}", WARNING)
         return None
+    _image_cache.put(key, data_url, file_bytes)
+    log(f"Image encoded ({description}): {file_bytes / 1024:.0f} KB file -> "
+        f"{len(data_url) / 1024:.0f} KB on the wire in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return data_url
 
-def chat_with_image(message, image_path=None, history=None, api_key=None, model="google/gemini-2.0-flash-exp:free"):
+def chat_with_image(message, image_path=None, history=None, api_key=None, model="google/gemini-2.0-flash-exp:free",
+                    on_delta=None):
     """
     Отправляет сообщение и опциональное изображение в чат с AI.
     
@@ -614,15 +2049,29 @@ def chat_with_image(message, image_path=None, history=None, api_key=None, model=
         history: История сообщений (список словарей)
         api_key: API ключ
         model: Модель для использования
+        on_delta: Если задан, ответ запрашивается потоково (SSE) и
+                  on_delta(text) вызывается для каждого нового фрагмента
         
     Returns:
         dict: Ответ от API
     """
-    log(f"=== chat_with_image() starting ===")
-    log(f"  Message length: {len(message)}")
-    log(f"  Image provided: {image_path is not None}")
+    return _run_sync(_chat_with_image_steps(message, image_path, history, api_key, model, on_delta))
+
+
+async def achat_with_image(message, image_path=None, history=None, api_key=None, model="google/gemini-2.0-flash-exp:free",
+                    on_delta=None):
+    """asyncio twin of chat_with_image(); runs the same request steps without blocking a thread."""
+    return await _run_async(_chat_with_image_steps(message, image_path, history, api_key, model, on_delta))
+
+
+def _chat_with_image_steps(message, image_path=None, history=None, api_key=None, model="google/gemini-2.0-flash-exp:free",
+                    on_delta=None):
+    """Request steps of chat_with_image() (see _run_sync)."""
+    log(f"=== chat_with_image() starting ===", DEBUG)
+    log(f"  Message length: {len(message)}", DEBUG)
+    log(f"  Image provided: {image_path is not None}", DEBUG)
     
-    url = "https://openrouter.ai/api/v1/chat/completions"
+    url = OPENROUTER_URL
     
     if not api_key:
         api_key = os.getenv("OPENROUTER_API_KEY")
@@ -654,7 +2103,7 @@ def chat_with_image(message, image_path=None, history=None, api_key=None, model=
                 }
             })
         else:
-            log("Failed to encode image, sending text only")
+            log("Failed to encode image, sending text only", WARNING)
             
     # Формируем историю сообщений
     messages = []
@@ -697,17 +2146,17 @@ def chat_with_image(message, image_path=None, history=None, api_key=None, model=
         }
         
         try:
-            log(f"Trying model: {try_model}...")
-            result = make_request(url, headers, data, timeout=60)
+            log(f"Trying model: {try_model}...", DEBUG)
+            result = yield _HTTPRequest(url, headers, data, 60, on_delta)
             
             if 'choices' in result and len(result['choices']) > 0:
                 content = result['choices'][0]['message']['content']
-                log(f"Success with model: {try_model}")
+                log(f"Success with model: {try_model}", DEBUG)
                 return {"content": content, "role": "assistant"}
             elif 'error' in result:
                 error_msg = result['error'].get('message', 'Unknown API error')
                 error_code = result['error'].get('code', 0)
-                log(f"Model {try_model} returned error {error_code}: {error_msg}")
+                log(f"Model {try_model} returned error {error_code}: {error_msg}", WARNING)
                 
                 # Если 429 (rate limit), пробуем следующую модель
                 if error_code == 429:
@@ -720,7 +2169,7 @@ def chat_with_image(message, image_path=None, history=None, api_key=None, model=
                 continue
                 
         except Exception as e:
-            log(f"Exception with model {try_model}: {e}")
+            log(f"Exception with model {try_model}: {e}", WARNING)
             last_error = str(e)
             # Если ошибка 429 в исключении, пробуем следующую модель
             if "429" in str(e):
@@ -731,28 +2180,48 @@ def chat_with_image(message, image_path=None, history=None, api_key=None, model=
     # Все модели не сработали
     return {"error": f"Все модели недоступны. Последняя ошибка: {last_error}"}
 
-def generate_quiz(topic, difficulty="средний", api_key=None):
-    """Generate a quiz using OpenRouter API"""
-    log(f"=== generate_quiz() starting ===")
-    log(f"  Topic: {topic}")
-    log(f"  Difficulty: {difficulty}")
-    log(f"  API key provided: {api_key is not None}")
-    log(f"  Platform: {sys.platform}")
-    log(f"  IS_ANDROID: {IS_ANDROID}")
+def generate_quiz(topic, difficulty="средний", api_key=None, on_theory=None, on_question=None, split=None):
+    """
+    Generate a quiz using OpenRouter API.
+
+    If on_theory or on_question is given, the response is streamed through
+    QuizStreamParser: on_theory(text) receives the theory text received so
+    far whenever it grows and on_question(question) each validated question
+    as soon as it is complete, so the UI can start before the model finishes.
+
+    With split=True (default: QUIZ_SPLIT_MODE) the theory and the questions
+    are requested concurrently, see _generate_quiz_split().
+    """
+    return _run_sync(_generate_quiz_steps(topic, difficulty, api_key, on_theory, on_question, split))
+
+
+async def agenerate_quiz(topic, difficulty="средний", api_key=None, on_theory=None, on_question=None, split=None):
+    """asyncio twin of generate_quiz(); runs the same request steps without blocking a thread."""
+    return await _run_async(_generate_quiz_steps(topic, difficulty, api_key, on_theory, on_question, split))
+
+
+def _generate_quiz_steps(topic, difficulty="средний", api_key=None, on_theory=None, on_question=None, split=None):
+    """Request steps of generate_quiz() (see _run_sync)."""
+    log(f"=== generate_quiz() starting ===", DEBUG)
+    log(f"  Topic: {topic}", DEBUG)
+    log(f"  Difficulty: {difficulty}", DEBUG)
+    log(f"  API key provided: {api_key is not None}", DEBUG)
+    log(f"  Platform: {sys.platform}", DEBUG)
+    log(f"  IS_ANDROID: {IS_ANDROID}", DEBUG)
     
-    url = "https://openrouter.ai/api/v1/chat/completions"
+    url = OPENROUTER_URL
     
     # Get API key
     if not api_key:
         api_key = os.getenv("OPENROUTER_API_KEY")
-        log(f"API key from env: {api_key is not None}")
+        log(f"API key from env: {api_key is not None}", DEBUG)
     
     if not api_key:
         msg = "API ключ не найден. Введите ключ в настройках."
         log(msg)
         return generate_mock_quiz(topic, difficulty, error=msg)
     
-    log(f"Using API Key: {api_key[:10]}...{api_key[-5:]}")
+    log(f"Using API Key: {api_key[:10]}...{api_key[-5:]}", DEBUG)
     
     headers = {
         "Authorization": f"Bearer {api_key}",
@@ -761,7 +2230,13 @@ def generate_quiz(topic, difficulty="средний", api_key=None):
         "HTTP-Referer": "https://github.com/bagdan13040/smarttest",
         "X-Title": "SmartTest"
     }
-    log(f"Headers prepared: {list(headers.keys())}")
+    log(f"Headers prepared: {list(headers.keys())}", DEBUG)
+
+    if split is None:
+        split = QUIZ_SPLIT_MODE
+    if split:
+        return (yield from _generate_quiz_split_steps(topic, difficulty, headers,
+                                                      on_theory=on_theory, on_question=on_question))
     
     prompt = (
         f"Тема: '{topic}'. Сложность: '{difficulty}'. "
@@ -787,44 +2262,50 @@ def generate_quiz(topic, difficulty="средний", api_key=None):
             }
         ]
     }
-    log(f"Model: {data['model']}")
+    log(f"Model: {data['model']}", DEBUG)
     
     try:
-        log(f"Sending request to OpenRouter...")
-        result = make_request(url, headers, data, timeout=60)
-        log(f"Got response from OpenRouter")
-        log(f"Response keys: {list(result.keys()) if isinstance(result, dict) else 'not a dict'}")
+        log(f"Sending request to OpenRouter...", DEBUG)
+        parser = None
+        if on_theory or on_question:
+            parser = QuizStreamParser(on_theory=on_theory, on_question=on_question)
+            request = _HTTPRequest(url, headers, data, 60, parser.feed)
+        else:
+            request = _HTTPRequest(url, headers, data, 60)
+        result = _cache_get('generate_quiz', request)
+        if result is None:
+            result = yield request
+        log(f"Got response from OpenRouter", DEBUG)
+        log(f"Response keys: {list(result.keys()) if isinstance(result, dict) else 'not a dict'}", DEBUG)
         
         if 'choices' in result and len(result['choices']) > 0:
             content = result['choices'][0]['message']['content']
-            log(f"Content length: {len(content)}")
-            log(f"Content preview: {content[:200]}...")
+            log(f"Content length: {len(content)}", DEBUG)
+            log(f"Content preview: {content[:200]}...", DEBUG)
             content = content.replace('```json', '').replace('```', '').strip()
             
             try:
-                log("Parsing JSON response...")
-                response_data = json.loads(content)
+                if parser is not None and parser.complete:
+                    # The object was already parsed while it was streaming
+                    response_data = parser.result()
+                else:
+                    log("Parsing JSON response...", DEBUG)
+                    response_data = json.loads(content)
                 
                 if not isinstance(response_data, dict) or 'theory' not in response_data or 'questions' not in response_data:
-                    log(f"Invalid response structure: {list(response_data.keys()) if isinstance(response_data, dict) else 'not a dict'}")
+                    log(f"Invalid response structure: {list(response_data.keys()) if isinstance(response_data, dict) else 'not a dict'}", WARNING)
                     return generate_mock_quiz(topic, difficulty, error="Неверная структура ответа API")
                 
                 quiz_data = response_data['questions']
-                log(f"Quiz has {len(quiz_data) if isinstance(quiz_data, list) else 0} questions")
+                log(f"Quiz has {len(quiz_data) if isinstance(quiz_data, list) else 0} questions", DEBUG)
                 if not isinstance(quiz_data, list):
-                    log(f"questions is not a list: {type(quiz_data)}")
+                    log(f"questions is not a list: {type(quiz_data)}", WARNING)
                     return generate_mock_quiz(topic, difficulty, error="questions не список")
                 
-                valid_quiz = []
-                for item in quiz_data:
-                    if (isinstance(item, dict) and 
-                        'question' in item and isinstance(item['question'], str) and
-                        'options' in item and isinstance(item['options'], list) and len(item['options']) == 4 and
-                        'answer' in item and isinstance(item['answer'], int) and 0 <= item['answer'] <= 3):
-                        valid_quiz.append(item)
+                valid_quiz = [item for item in quiz_data if _is_valid_question(item)]
                 
                 if not valid_quiz:
-                    log("No valid questions found after validation")
+                    log("No valid questions found after validation", WARNING)
                     return generate_mock_quiz(topic, difficulty, error="Нет валидных вопросов")
                 
                 log(f"Validated {len(valid_quiz)} questions")
@@ -833,25 +2314,143 @@ def generate_quiz(topic, difficulty="средний", api_key=None):
                 meta['difficulty'] = difficulty
                 
                 log("Quiz generated successfully!")
+                _cache_put('generate_quiz', request, result)
                 return {'theory': response_data['theory'], 'questions': valid_quiz, 'meta': meta}
                 
             except json.JSONDecodeError as e:
-                log(f"JSON parse error: {e}")
-                log(f"Content was: {content[:500]}...")
+                log(f"JSON parse error: {e}", WARNING)
+                log(f"Content was: {content[:500]}...", DEBUG)
                 return generate_mock_quiz(topic, difficulty, error=f"Ошибка парсинга JSON: {e}")
         else:
-            log(f"No choices in response: {result}")
+            log(f"No choices in response: {result}", WARNING)
             return generate_mock_quiz(topic, difficulty, error=f"Некорректный ответ API")
             
     except Exception as e:
-        log(f"Exception in generate_quiz: {e}")
-        log(f"Traceback: {traceback.format_exc()}")
+        log(f"Exception in generate_quiz: {e}", WARNING)
+        log(f"Traceback: {traceback.format_exc()}", DEBUG)
+        return generate_mock_quiz(topic, difficulty, error=str(e))
+
+def _generate_quiz_split_steps(topic, difficulty, headers, on_theory=None, on_question=None):
+    """
+    Pipelined variant of generate_quiz() (request steps, see _run_sync).
+
+    The theory and the questions are requested concurrently and merged into
+    the same {theory, questions, meta} result, so the wall-clock time is that
+    of the longer answer instead of the sum of both. The questions prompt is
+    conditioned on the topic and difficulty only. Failed questions produce a
+    mock quiz as usual; a failed theory request leaves the theory empty.
+    """
+    log(f"Split mode: requesting theory and questions concurrently")
+    url = OPENROUTER_URL
+    model = "xiaomi/mimo-v2-flash:free"
+
+    theory_data = {
+        "model": model,
+        "messages": [
+            {
+                "role": "system",
+                "content": "Ты — автор учебных статей. Используй Kivy markup ([b], [i], [color]) вместо Markdown."
+            },
+            {
+                "role": "user",
+                "content": (
+                    f"Тема: '{topic}'. Сложность: '{difficulty}'. "
+                    "Напиши теоретический материал объемом не менее 1000 слов, с глубиной и детализацией, как в полноценной статье Википедии. "
+                    "Раздели его на логические разделы и подразделы, поясняй термины, приводи примеры, сравнения и исторический контекст там, где это уместно. "
+                    "Используй теги [b]...[/b] для важных понятий и \n для параграфов/списков. "
+                    "НЕ используй Markdown (**, ##). "
+                    "Верни только текст материала, без JSON и без вступлений."
+                )
+            }
+        ]
+    }
+    questions_data = {
+        "model": model,
+        "messages": [
+            {
+                "role": "system",
+                "content": "Ты — API, возвращающий только сырой JSON."
+            },
+            {
+                "role": "user",
+                "content": (
+                    f"Тема: '{topic}'. Сложность: '{difficulty}'. "
+                    "Сгенерируй 10 вопросов с 4 вариантами ответов, проверяющих понимание ключевых понятий темы. "
+                    "Верни ТОЛЬКО JSON объект, без пояснений по ответам. "
+                    "Структура: {\"questions\": [{\"question\": \"...\", \"options\": [\"...\", ...], \"answer\": 0}]}"
+                )
+            }
+        ]
+    }
+
+    theory_parts = []
+
+    def on_theory_delta(delta):
+        theory_parts.append(delta)
+        on_theory(''.join(theory_parts))
+
+    parser = QuizStreamParser(on_question=on_question) if on_question else None
+    requests = [
+        _HTTPRequest(url, headers, theory_data, 60, on_theory_delta if on_theory else None),
+        _HTTPRequest(url, headers, questions_data, 60, parser.feed if parser else None),
+    ]
+    # Only the parts that are not cached go to the network
+    results = [_cache_get('generate_quiz', request) for request in requests]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        fetched = yield [requests[i] for i in missing]
+        for i, result in zip(missing, fetched):
+            results[i] = result
+    theory_result, questions_result = results
+
+    try:
+        if isinstance(questions_result, Exception):
+            raise questions_result
+        if parser is not None and parser.complete:
+            response_data = parser.result()
+        else:
+            content = questions_result['choices'][0]['message']['content']
+            content = content.replace('```json', '').replace('```', '').strip()
+            response_data = json.loads(content)
+        quiz_data = response_data.get('questions') if isinstance(response_data, dict) else response_data
+        if not isinstance(quiz_data, list):
+            raise ValueError("questions не список")
+        valid_quiz = [item for item in quiz_data if _is_valid_question(item)]
+    except json.JSONDecodeError as e:
+        log(f"JSON parse error (split questions): {e}", WARNING)
+        return generate_mock_quiz(topic, difficulty, error=f"Ошибка парсинга JSON: {e}")
+    except Exception as e:
+        log(f"Exception in split questions request: {e}", WARNING)
+        log(f"Traceback: {traceback.format_exc()}", DEBUG)
         return generate_mock_quiz(topic, difficulty, error=str(e))
+    if not valid_quiz:
+        log("No valid questions found after validation", WARNING)
+        return generate_mock_quiz(topic, difficulty, error="Нет валидных вопросов")
+    log(f"Validated {len(valid_quiz)} questions")
+    _cache_put('generate_quiz', requests[1], questions_result)
+
+    theory = ''
+    try:
+        if isinstance(theory_result, Exception):
+            raise theory_result
+        # A 2xx body may still be {"error": ...} or carry a null content
+        content = theory_result['choices'][0]['message']['content']
+        if not isinstance(content, str):
+            raise TypeError(f"theory content is {type(content).__name__}")
+    except Exception as e:
+        log(f"Theory request failed, continuing without theory: {e!r}", WARNING)
+    else:
+        theory = content.replace('```', '').strip()
+        if theory:
+            _cache_put('generate_quiz', requests[0], theory_result)
+
+    log("Quiz generated successfully (split mode)!")
+    return {'theory': theory, 'questions': valid_quiz, 'meta': {'topic': topic, 'difficulty': difficulty}}
 
 def generate_mock_quiz(topic, difficulty, error=None):
     """Generate a mock quiz when API is unavailable"""
-    log(f"generate_mock_quiz() called")
-    log(f"  Error: {error}")
+    log(f"generate_mock_quiz() called", DEBUG)
+    log(f"  Error: {error}", WARNING)
     
     theory = f"[b]Оффлайн режим[/b]\n\n"
     if error:
@@ -875,10 +2474,20 @@ def generate_mock_quiz(topic, difficulty, error=None):
 
 def generate_open_questions(topic, n=5, difficulty='средний', api_key=None):
     """Generate open-ended questions for the 'Teacher' mode."""
-    log(f"=== generate_open_questions() starting ===")
-    log(f"  Topic: {topic}")
+    return _run_sync(_generate_open_questions_steps(topic, n, difficulty, api_key))
+
+
+async def agenerate_open_questions(topic, n=5, difficulty='средний', api_key=None):
+    """asyncio twin of generate_open_questions(); runs the same request steps without blocking a thread."""
+    return await _run_async(_generate_open_questions_steps(topic, n, difficulty, api_key))
+
+
+def _generate_open_questions_steps(topic, n=5, difficulty='средний', api_key=None):
+    """Request steps of generate_open_questions() (see _run_sync)."""
+    log(f"=== generate_open_questions() starting ===", DEBUG)
+    log(f"  Topic: {topic}", DEBUG)
     
-    url = "https://openrouter.ai/api/v1/chat/completions"
+    url = OPENROUTER_URL
     if not api_key:
         api_key = os.getenv("OPENROUTER_API_KEY")
     
@@ -910,37 +2519,100 @@ def generate_open_questions(topic, n=5, difficulty='средний', api_key=Non
     }
 
     try:
-        result = make_request(url, headers, data, timeout=60)
+        request = _HTTPRequest(url, headers, data, 60)
+        result = _cache_get('generate_open_questions', request)
+        if result is None:
+            result = yield request
         if 'choices' in result and len(result['choices']) > 0:
             content = result['choices'][0]['message']['content']
             content = content.replace('```json', '').replace('```', '').strip()
             try:
                 questions = json.loads(content)
                 if isinstance(questions, list):
+                    _cache_put('generate_open_questions', request, result)
                     return questions
             except json.JSONDecodeError:
-                log(f"JSON parse error in open questions: {content[:200]}")
+                log(f"JSON parse error in open questions: {content[:200]}", WARNING)
     except Exception as e:
-        log(f"Error generating open questions: {e}")
+        log(f"Error generating open questions: {e}", WARNING)
 
     return generate_mock_open_questions(topic, n, error="Ошибка генерации")
 
 def evaluate_answer(question_text, user_answer, notes="", api_key=None):
     """Evaluate a user's answer to an open-ended question."""
-    log(f"=== evaluate_answer() starting ===")
+    return _run_sync(_evaluate_answer_steps(question_text, user_answer, notes, api_key))
+
+
+async def aevaluate_answer(question_text, user_answer, notes="", api_key=None):
+    """asyncio twin of evaluate_answer(); runs the same request steps without blocking a thread."""
+    return await _run_async(_evaluate_answer_steps(question_text, user_answer, notes, api_key))
+
+
+def _evaluate_answer_steps(question_text, user_answer, notes="", api_key=None):
+    """Request steps of evaluate_answer() (see _run_sync)."""
+    log(f"=== evaluate_answer() starting ===", DEBUG)
     
-    url = "https://openrouter.ai/api/v1/chat/completions"
     if not api_key:
         api_key = os.getenv("OPENROUTER_API_KEY")
     
     if not api_key:
-        return {
-            "score": 0,
-            "max_score": 10,
-            "commentary": "Оффлайн режим: не удалось проверить ответ через AI.",
-            "errors": [],
-            "suggested_improvements": "Проверьте подключение к интернету."
-        }
+        return _offline_evaluation()
+
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json; charset=utf-8",
+        "User-Agent": "SmartTest/1.0",
+        "HTTP-Referer": "https://github.com/bagdan13040/smarttest",
+        "X-Title": "SmartTest"
+    }
+
+    try:
+        request = _evaluation_request(question_text, user_answer, notes, headers)
+        result = _cache_get('evaluate_answer', request)
+        if result is None:
+            result = yield request
+        evaluation = _parse_evaluation(result)
+        if evaluation is not None:
+            _cache_put('evaluate_answer', request, result)
+            return evaluation
+    except Exception as e:
+        log(f"Error evaluating answer: {e}", WARNING)
+
+    return _failed_evaluation()
+
+
+def evaluate_answers_batch(items, api_key=None):
+    """
+    Evaluate several open answers with one request.
+
+    Args:
+        items: List of (question_text, user_answer, notes) tuples
+
+    Returns:
+        List of evaluations in the evaluate_answer() format, in the order of
+        items. Answers the batch response does not cover with a valid
+        evaluation (wrong length, broken JSON, failed request) are graded
+        one by one, concurrently.
+    """
+    return _run_sync(_evaluate_answers_batch_steps(items, api_key))
+
+
+async def aevaluate_answers_batch(items, api_key=None):
+    """asyncio twin of evaluate_answers_batch(); runs the same request steps without blocking a thread."""
+    return await _run_async(_evaluate_answers_batch_steps(items, api_key))
+
+
+def _evaluate_answers_batch_steps(items, api_key=None):
+    """Request steps of evaluate_answers_batch() (see _run_sync)."""
+    log(f"=== evaluate_answers_batch() starting: {len(items)} answers ===", DEBUG)
+    if not items:
+        return []
+
+    if not api_key:
+        api_key = os.getenv("OPENROUTER_API_KEY")
+
+    if not api_key:
+        return [_offline_evaluation() for _ in items]
 
     headers = {
         "Authorization": f"Bearer {api_key}",
@@ -950,6 +2622,57 @@ def evaluate_answer(question_text, user_answer, notes="", api_key=None):
         "X-Title": "SmartTest"
     }
 
+    answers = "\n\n".join(
+        f"#{i + 1}\n"
+        f"Вопрос: \"{question_text}\"\n"
+        f"Ожидаемые моменты (notes): \"{notes}\"\n"
+        f"Ответ студента: \"{user_answer}\""
+        for i, (question_text, user_answer, notes) in enumerate(items)
+    )
+    prompt = (
+        f"Оцени каждый из {len(items)} ответов студента по шкале от 0 до 10. "
+        "Для каждого дай комментарий, список ошибок (если есть) и предложения по улучшению. "
+        f"Верни ТОЛЬКО JSON массив из {len(items)} объектов в том же порядке, что и ответы. "
+        "Структура элемента: {\"score\": int, \"max_score\": 10, \"commentary\": \"...\", \"errors\": [\"...\"], \"suggested_improvements\": \"...\"}\n\n"
+        + answers
+    )
+
+    data = {
+        "model": "xiaomi/mimo-v2-flash:free",
+        "messages": [
+            {"role": "system", "content": "Ты — строгий, но справедливый преподаватель. Верни только JSON."},
+            {"role": "user", "content": prompt}
+        ]
+    }
+
+    evaluations = [None] * len(items)
+    try:
+        result = yield _HTTPRequest(OPENROUTER_URL, headers, data, 60)
+        content = result['choices'][0]['message']['content']
+        content = content.replace('```json', '').replace('```', '').strip()
+        batch = json.loads(content)
+        if isinstance(batch, dict):
+            batch = batch.get('evaluations')
+        if isinstance(batch, list) and len(batch) == len(items):
+            for i, evaluation in enumerate(batch):
+                if _is_valid_evaluation(evaluation):
+                    evaluations[i] = evaluation
+        else:
+            log(f"Batch evaluation has wrong shape: {content[:200]}", WARNING)
+    except Exception as e:
+        log(f"Error in batch evaluation: {e}", WARNING)
+
+    missing = [i for i, evaluation in enumerate(evaluations) if evaluation is None]
+    if missing:
+        log(f"Grading {len(missing)} of {len(items)} answers one by one")
+        results = yield [_evaluation_request(*items[i], headers) for i in missing]
+        for i, result in zip(missing, results):
+            evaluation = None if isinstance(result, Exception) else _parse_evaluation(result)
+            evaluations[i] = evaluation if evaluation is not None else _failed_evaluation()
+    return evaluations
+
+
+def _evaluation_request(question_text, user_answer, notes, headers):
     prompt = (
         f"Вопрос: \"{question_text}\"\n"
         f"Ожидаемые моменты (notes): \"{notes}\"\n"
@@ -967,21 +2690,40 @@ def evaluate_answer(question_text, user_answer, notes="", api_key=None):
             {"role": "user", "content": prompt}
         ]
     }
+    return _HTTPRequest(OPENROUTER_URL, headers, data, 60)
+
+
+def _parse_evaluation(result):
+    """Returns the evaluation dict from a response, or None if there is none."""
+    if 'choices' in result and len(result['choices']) > 0:
+        content = result['choices'][0]['message']['content']
+        content = content.replace('```json', '').replace('```', '').strip()
+        try:
+            evaluation = json.loads(content)
+            if isinstance(evaluation, dict):
+                return evaluation
+        except json.JSONDecodeError:
+            log(f"JSON parse error in evaluation: {content[:200]}", WARNING)
+    return None
+
+
+def _is_valid_evaluation(item):
+    """Checks an evaluation from a batch response: a dict with a numeric score."""
+    return (isinstance(item, dict) and isinstance(item.get('score'), (int, float))
+            and not isinstance(item.get('score'), bool))
+
+
+def _offline_evaluation():
+    return {
+        "score": 0,
+        "max_score": 10,
+        "commentary": "Оффлайн режим: не удалось проверить ответ через AI.",
+        "errors": [],
+        "suggested_improvements": "Проверьте подключение к интернету."
+    }
 
-    try:
-        result = make_request(url, headers, data, timeout=60)
-        if 'choices' in result and len(result['choices']) > 0:
-            content = result['choices'][0]['message']['content']
-            content = content.replace('```json', '').replace('```', '').strip()
-            try:
-                evaluation = json.loads(content)
-                if isinstance(evaluation, dict):
-                    return evaluation
-            except json.JSONDecodeError:
-                log(f"JSON parse error in evaluation: {content[:200]}")
-    except Exception as e:
-        log(f"Error evaluating answer: {e}")
 
+def _failed_evaluation():
     return {
         "score": 0,
         "max_score": 10,
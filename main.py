@@ -11,6 +11,9 @@ SmartTest - Приложение для интеллектуального те
 - Полный отчёт с работой над ошибками
 """
 
+import startup_profile  # Замер фаз запуска (SMARTTEST_STARTUP_PROFILE=1)
+startup_profile.mark('interpreter')
+
 print("[MAIN] === Application Starting ===")
 import sys
 import traceback as tb_module
@@ -40,11 +43,9 @@ try:
     from kivymd.app import MDApp # KivyMD App
     from kivymd.uix.button import MDIconButton # KivyMD Icon Button
     from kivymd.uix.label import MDIcon # KivyMD Icon
-    from kivy.lang import Builder  # Парсер KV языка для описания UI
     from kivy.core.window import Window  # Управление окном приложения
     from kivy.uix.screenmanager import ScreenManager, Screen  # Менеджер экранов
     from kivy.uix.boxlayout import BoxLayout  # Линейный layout
-    from kivy.uix.anchorlayout import AnchorLayout  # Layout для центрирования
     from kivy.uix.gridlayout import GridLayout  # Табличный layout
     from kivy.uix.label import Label  # Текстовые метки
     from kivy.uix.image import Image  # Изображения
@@ -52,9 +53,11 @@ try:
     from kivy.uix.button import Button  # Стандартные кнопки
     from kivy.uix.togglebutton import ToggleButton  # Переключаемые кнопки
     from kivy.uix.scrollview import ScrollView  # Прокручиваемые области
+    from kivy.uix.recycleview.views import RecycleDataViewBehavior  # Виджет-строка RecycleView
     from kivy.uix.textinput import TextInput  # Поля ввода текста
     from kivy.uix.widget import Widget  # Базовый виджет
-    from kivy.metrics import dp  # Density-independent pixels для кросс-платформенности
+    from kivy.metrics import dp, sp  # Density-independent pixels для кросс-платформенности
+    from kivy.core.text.markup import MarkupLabel  # Отрисовка текста в текстуру (сообщения чата)
     from kivy.properties import StringProperty, ListProperty, NumericProperty, BooleanProperty  # Реактивные свойства
 
     print("[MAIN] graphics imported")
@@ -66,6 +69,7 @@ except Exception as e:
     print(f"[MAIN] ERROR importing kivy: {e}")
     print(f"[MAIN] Traceback: {tb_module.format_exc()}")
     raise
+startup_profile.mark('kivy_imports')
 
 # ========================================
 # СТАНДАРТНЫЕ БИБЛИОТЕКИ
@@ -77,8 +81,45 @@ import random  # Генерация случайных чисел
 import json  # Работа с JSON
 import os  # Работа с файловой системой
 import uuid  # Генерация уникальных идентификаторов
+import sqlite3  # Хранилище курсов (SQLiteCourseStorage)
+from collections import OrderedDict, deque  # Индекс курсов, последние строки лога для UI
 print("[MAIN] Standard modules imported")
 
+import applog  # Буферизованный лог (фоновый поток записи)
+from topic_match import TopicIndex, DEFAULT_THRESHOLD as TOPIC_SIMILARITY_THRESHOLD  # Нечёткий поиск тем в кеше
+import task_scheduler  # Общий пул фоновых задач с приоритетами
+from task_scheduler import TaskScheduler
+import kv_cache  # Разобранные KV правила кешируются на диске
+import screen_registry  # Экраны создаются при первом переходе (ScreenRegistry в KV)
+
+# Метка с логом на экране настроек обновляется не чаще раза в LOG_UI_INTERVAL секунд
+LOG_UI_INTERVAL = 0.5
+
+# Потоков для блокирующих фоновых задач (генерация, предзагрузка, чат)
+BACKGROUND_WORKERS = 3
+# Сколько секунд после MC теста ждать предзагрузку открытых вопросов до повторной генерации
+OPEN_QUESTIONS_PRELOAD_TIMEOUT = 30
+
+# Упреждающая генерация курсов по рекомендованным темам (включается в настройках):
+# сколько первых тем готовить заранее и сколько токенов (оценка) можно потратить за сеанс
+FOLLOWUP_PREFETCH_TOPICS = 2
+FOLLOWUP_PREFETCH_TOKEN_BUDGET = 30000
+# Столько токенов резервируется из бюджета при запуске генерации, пока размер курса неизвестен
+FOLLOWUP_PREFETCH_TOKEN_ESTIMATE = 3000
+CHARS_PER_TOKEN = 3  # Грубая оценка числа токенов по длине ответа (русский текст)
+
+# Экраны курса и теста выгружаются (ScreenRegistry.release_idle) при возврате на
+# главный экран, если процесс занимает больше SCREEN_RELEASE_RSS_MB (None - никогда),
+# и при сворачивании приложения. Выгружаются экраны, не показанные SCREEN_RELEASE_IDLE секунд
+SCREEN_RELEASE_RSS_MB = 250
+SCREEN_RELEASE_IDLE = 60
+
+# Чат: сколько сообщений держать в памяти (вся история - в chat_history.db), сколько
+# подгружать при прокрутке к краю окна и сколько МБ текстур текста сообщений кешировать
+CHAT_WINDOW_MESSAGES = 200
+CHAT_PAGE_MESSAGES = 50
+CHAT_TEXTURE_CACHE_MB = 32
+
 # ========================================
 # ИМПОРТ LLM МОДУЛЯ
 # ========================================
@@ -87,30 +128,128 @@ print("[MAIN] Standard modules imported")
 # - generate_open_questions: генерация открытых вопросов
 # - evaluate_answer: оценка развёрнутых ответов
 # - generate_next_topics: предложение тем для углубления
-print("[MAIN] Importing llm module...")
-try:
-    from llm import generate_quiz, generate_next_topics, get_course_topics, generate_open_questions, evaluate_answer, chat_with_image
-    print("[MAIN] llm module imported successfully")
-except Exception as e:
-    print(f"[MAIN] Error importing llm: {e}")
-    print(f"[MAIN] Traceback: {tb_module.format_exc()}")
-    # Fallback функции если LLM модуль не загружен
-    def chat_with_image(message, image_path=None, history=None, api_key=None, model="google/gemini-2.0-flash-exp:free"):
+# - aevaluate_answer/agenerate_next_topics/agenerate_quiz + submit_async: те же запросы
+#   корутинами в общем фоновом event loop (с возможностью отмены)
+# llm.py (asyncio, ssl, http.client, .env, пул соединений) импортируется
+# не при старте, а при первом обращении - обычно фоновой задачей сразу
+# после первого кадра (MyApp.on_start). Имена ниже - тонкие обёртки,
+# которые загружают модуль и вызывают одноимённую функцию.
+_llm_module = None
+_llm_lock = threading.Lock()
+_llm_pending_cache = None  # Аргументы configure_response_cache до загрузки llm
+
+
+class _LLMFallback:
+    """Заглушки на случай, если модуль llm не загрузился"""
+
+    def __init__(self, error):
+        self.error = error
+
+    def chat_with_image(self, message, image_path=None, history=None, api_key=None,
+                        model="google/gemini-2.0-flash-exp:free", **kwargs):
         return {"content": "Ошибка: модуль LLM не загружен.", "role": "assistant"}
 
-    def generate_quiz(topic, difficulty):
+    def generate_quiz(self, topic, difficulty, *args, **kwargs):
         return {
-            "theory": f"Ошибка загрузки модуля LLM: {e}. Проверьте логи.",
+            "theory": f"Ошибка загрузки модуля LLM: {self.error}. Проверьте логи.",
             "questions": [
                 {"question": "Ошибка", "options": ["Ок", "Ок", "Ок", "Ок"], "answer": 0}
             ]
         }
-    def generate_next_topics(prev_material, n=5, api_key=None, memory_file='course_topics.json'):
+
+    def generate_next_topics(self, prev_material, n=5, api_key=None, memory_file='course_topics.json'):
+        return []
+
+    def get_course_topics(self, memory_file='course_topics.json'):
+        return []
+
+    def generate_open_questions(self, *args, **kwargs):
         return []
 
-    def get_course_topics(memory_file='course_topics.json'):
+    def evaluate_answer(self, *args, **kwargs):
+        return None
+
+    async def aevaluate_answer(self, question_text, user_answer, notes="", api_key=None):
+        return None
+
+    async def aevaluate_answers_batch(self, items, api_key=None):
         return []
 
+    async def agenerate_next_topics(self, prev_material, n=5, api_key=None, memory_file='course_topics.json'):
+        return []
+
+    async def agenerate_quiz(self, topic, difficulty, *args, **kwargs):
+        return self.generate_quiz(topic, difficulty)
+
+    def configure_response_cache(self, directory, **options):
+        return None
+
+    def submit_async(self, coro, callback=None):
+        import asyncio
+        import concurrent.futures
+        future = concurrent.futures.Future()
+        future.set_result(asyncio.run(coro))
+        if callback:
+            callback(future)
+        return future
+
+
+def load_llm():
+    """
+    Возвращает модуль llm, импортируя его при первом вызове.
+    
+    Если импорт не удался - возвращает _LLMFallback с заглушками.
+    """
+    global _llm_module
+    if _llm_module is not None:
+        return _llm_module
+    with _llm_lock:
+        if _llm_module is None:
+            print("[MAIN] Importing llm module...")
+            try:
+                import llm as module
+                print("[MAIN] llm module imported successfully")
+            except Exception as e:
+                print(f"[MAIN] Error importing llm: {e}")
+                print(f"[MAIN] Traceback: {tb_module.format_exc()}")
+                module = _LLMFallback(e)
+            if _llm_pending_cache is not None:
+                directory, options = _llm_pending_cache
+                module.configure_response_cache(directory, **options)
+            _llm_module = module
+    return _llm_module
+
+
+def _lazy_llm(name):
+    """Функция, вызывающая llm.<name> (модуль загружается при первом вызове)"""
+    def call(*args, **kwargs):
+        return getattr(load_llm(), name)(*args, **kwargs)
+    call.__name__ = name
+    return call
+
+
+generate_quiz = _lazy_llm('generate_quiz')
+generate_next_topics = _lazy_llm('generate_next_topics')
+get_course_topics = _lazy_llm('get_course_topics')
+generate_open_questions = _lazy_llm('generate_open_questions')
+evaluate_answer = _lazy_llm('evaluate_answer')
+chat_with_image = _lazy_llm('chat_with_image')
+aevaluate_answer = _lazy_llm('aevaluate_answer')
+aevaluate_answers_batch = _lazy_llm('aevaluate_answers_batch')
+agenerate_next_topics = _lazy_llm('agenerate_next_topics')
+agenerate_quiz = _lazy_llm('agenerate_quiz')
+submit_async = _lazy_llm('submit_async')
+
+
+def configure_response_cache(directory, **options):
+    """Настраивает кеш ответов llm; до загрузки модуля - запоминает настройки"""
+    global _llm_pending_cache
+    with _llm_lock:
+        if _llm_module is None:
+            _llm_pending_cache = (directory, options)
+            return None
+    return _llm_module.configure_response_cache(directory, **options)
+
 # ========================================
 # НАСТРОЙКА ОКНА
 # ========================================
@@ -207,6 +346,11 @@ class CourseStorage:
     - Историю прохождения
     - Краткие заметки
     
+    В памяти курсы лежат в OrderedDict, ключ - нормализованная пара
+    (тема, сложность), порядок - от давно использованных к недавним.
+    Поиск, обновление, удаление и перенос курса в начало списка
+    выполняются за O(1) без просмотра всех курсов.
+    
     Файл: courses.json в директории пользовательских данных приложения
     """
     
@@ -218,7 +362,23 @@ class CourseStorage:
             filename: Путь к JSON файлу для хранения курсов
         """
         self.filename = filename
-        self.courses = self.load()  # Загружаем существующие курсы
+        self._index = OrderedDict()
+        # В файле курсы идут от недавних к старым, в индексе - наоборот
+        for course in reversed(self.load()):
+            meta = course.get('meta', {})
+            key = self._key(meta.get('topic'), meta.get('difficulty'))
+            self._index[key] = course
+            self._index.move_to_end(key)
+
+    @staticmethod
+    def _key(topic, difficulty):
+        """Ключ индекса: регистр и пробелы по краям не учитываются"""
+        return ((topic or '').strip().casefold(), (difficulty or '').strip().casefold())
+
+    @property
+    def courses(self):
+        """Список курсов от недавних к старым (как в файле)"""
+        return self.get_all()
 
     def load(self):
         """
@@ -248,18 +408,9 @@ class CourseStorage:
         topic = course.get('meta', {}).get('topic', '')
         difficulty = course.get('meta', {}).get('difficulty', '')
         
-        # Ищем существующий курс с такими же параметрами
-        for idx, c in enumerate(self.courses):
-            if c.get('meta', {}).get('topic') == topic and \
-               c.get('meta', {}).get('difficulty') == difficulty:
-                # Обновляем существующий курс и перемещаем в начало списка
-                self.courses[idx] = course
-                self.courses.insert(0, self.courses.pop(idx))
-                self._write()
-                return
-
-        # Если курс не найден, добавляем новый в начало списка
-        self.courses.insert(0, course)
+        key = self._key(topic, difficulty)
+        self._index[key] = course
+        self._index.move_to_end(key)
         self._write()
 
     def find(self, topic, difficulty):
@@ -273,11 +424,7 @@ class CourseStorage:
         Returns:
             dict|None: Найденный курс или None если курс не найден
         """
-        for c in self.courses:
-            meta = c.get('meta', {})
-            if meta.get('topic') == topic and meta.get('difficulty') == difficulty:
-                return c
-        return None
+        return self._index.get(self._key(topic, difficulty))
 
     def update_entry(self, topic, difficulty, updater):
         """
@@ -291,15 +438,15 @@ class CourseStorage:
         Returns:
             dict|None: Обновленный курс или None если курс не найден
         """
-        for idx, c in enumerate(self.courses):
-            meta = c.get('meta', {})
-            if meta.get('topic') == topic and meta.get('difficulty') == difficulty:
-                updater(c)  # Вызываем функцию обновления
-                # Перемещаем обновленный курс в начало списка
-                self.courses.insert(0, self.courses.pop(idx))
-                self._write()
-                return c
-        return None
+        key = self._key(topic, difficulty)
+        c = self._index.get(key)
+        if c is None:
+            return None
+        updater(c)  # Вызываем функцию обновления
+        # Перемещаем обновленный курс в начало списка
+        self._index.move_to_end(key)
+        self._write()
+        return c
 
     def delete(self, topic, difficulty):
         """
@@ -312,13 +459,7 @@ class CourseStorage:
         Returns:
             bool: True если курс был удален, False если курс не найден
         """
-        removed = False
-        for idx, c in enumerate(self.courses):
-            meta = c.get('meta', {})
-            if meta.get('topic') == topic and meta.get('difficulty') == difficulty:
-                self.courses.pop(idx)
-                removed = True
-                break
+        removed = self._index.pop(self._key(topic, difficulty), None) is not None
         if removed:
             self._write()
         return removed
@@ -330,17 +471,907 @@ class CourseStorage:
         Внутренний метод для сохранения состояния хранилища на диск.
         """
         with open(self.filename, 'w', encoding='utf-8') as f:
-            json.dump(self.courses, f, ensure_ascii=False, indent=2)
+            json.dump(self.get_all(), f, ensure_ascii=False, indent=2)
             
     def get_all(self):
         """
         Возвращает список всех курсов.
         
         Returns:
-            list: Список всех сохраненных курсов
+            list: Список всех сохраненных курсов (сначала недавние)
+        """
+        return list(reversed(self._index.values()))
+
+    def list_meta(self):
+        """
+        Возвращает метаданные курсов для списка сохранённых (сначала недавние).
+        
+        Returns:
+            list: Словари meta (тема, сложность, заметки) без теории и вопросов
+        """
+        return [course.get('meta', {}) for course in self.get_all()]
+
+
+class JournalCourseStorage(CourseStorage):
+    """
+    Хранилище курсов в виде журнала изменений (append-only).
+    
+    Вместо перезаписи всего courses.json каждое изменение дописывается
+    в конец файла одной JSON-строкой:
+    - {"op": "put", "course": {...}} - новый или заменённый курс
+    - {"op": "update", "topic", "difficulty", "fields": {...}, "removed": [...]} -
+      только изменённые поля курса (обычно результаты теста, без теории)
+    - {"op": "delete", "topic", "difficulty"}
+    
+    При загрузке журнал проигрывается заново. Строка дописывается одним
+    write() с fsync, поэтому сбой при записи оставляет только недописанную
+    последнюю строку (без перевода строки) - она отрезается. Повреждённые
+    строки в середине журнала пропускаются и считаются в damaged, а записи
+    после них загружаются как обычно. Когда устаревших записей становится больше
+    порога, журнал сжимается в фоновом потоке: снимок записывается во
+    временный файл, который атомарно заменяет журнал (os.replace).
+    
+    Атрибуты:
+        legacy_filename: courses.json, из которого курсы переносятся при первом запуске
+        damaged: Число пропущенных при загрузке нечитаемых строк
+    """
+    # Сжимаем, когда устаревших записей больше COMPACT_MIN_GARBAGE
+    # и больше, чем COMPACT_RATIO * число курсов
+    COMPACT_MIN_GARBAGE = 50
+    COMPACT_RATIO = 1.0
+
+    def __init__(self, filename='courses.journal', legacy_filename=None):
+        """
+        Args:
+            filename: Путь к файлу журнала
+            legacy_filename: Старый courses.json для миграции (если журнала ещё нет)
+        """
+        self.legacy_filename = legacy_filename
+        self._lock = threading.Lock()
+        self._journal = None  # Открытый на дозапись файл журнала
+        self._records = 0  # Записей в журнале
+        self.damaged = 0
+        self._pending = None  # Строки, дописанные во время фонового сжатия
+        self._compact_thread = None
+        super().__init__(filename)
+
+    def load(self):
+        """
+        Проигрывает журнал (или переносит курсы из legacy_filename).
+        
+        Returns:
+            list: Список курсов (сначала недавние)
         """
-        return self.courses
+        if not os.path.exists(self.filename):
+            courses = []
+            if self.legacy_filename and os.path.exists(self.legacy_filename):
+                courses = CourseStorage(self.legacy_filename).get_all()
+            self._rewrite(self._snapshot_lines(reversed(courses)))
+            self._records = len(courses)
+            return courses
+
+        index = OrderedDict()
+        records = 0
+        damaged = 0
+        size = 0
+        torn_tail = False
+        with open(self.filename, 'rb') as f:
+            for raw in f:
+                try:
+                    record = json.loads(raw.decode('utf-8'))
+                    self._apply(index, record)
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    if not raw.endswith(b'\n'):
+                        # Недописанная последняя строка после сбоя
+                        torn_tail = True
+                        break
+                    # Повреждённая строка в середине: пропускаем, остальные записи целы
+                    damaged += 1
+                records += 1
+                size += len(raw)
+        if torn_tail:
+            with open(self.filename, 'r+b') as f:
+                f.truncate(size)
+        if damaged:
+            print(f"[MAIN] Skipped {damaged} damaged line(s) in {self.filename}")
+        # Пропущенные строки - тоже мусор, их уберёт сжатие
+        self._records = records
+        self.damaged = damaged
+        return list(reversed(index.values()))
+
+    def _apply(self, index, record):
+        """Применяет одну запись журнала к индексу"""
+        op = record.get('op')
+        if op == 'put':
+            course = record['course']
+            meta = course.get('meta', {})
+            key = self._key(meta.get('topic'), meta.get('difficulty'))
+            index[key] = course
+            index.move_to_end(key)
+        elif op == 'update':
+            key = self._key(record.get('topic'), record.get('difficulty'))
+            course = index.get(key)
+            if course is not None:
+                course.update(record.get('fields', {}))
+                for name in record.get('removed', []):
+                    course.pop(name, None)
+                index.move_to_end(key)
+        elif op == 'delete':
+            index.pop(self._key(record.get('topic'), record.get('difficulty')), None)
+
+    def save(self, course):
+        """Сохраняет курс и дописывает его в журнал"""
+        meta = course.get('meta', {})
+        key = self._key(meta.get('topic', ''), meta.get('difficulty', ''))
+        self._index[key] = course
+        self._index.move_to_end(key)
+        self._append({'op': 'put', 'course': course})
 
+    def update_entry(self, topic, difficulty, updater):
+        """Обновляет курс; в журнал попадают только изменённые поля"""
+        key = self._key(topic, difficulty)
+        c = self._index.get(key)
+        if c is None:
+            return None
+        before = {name: json.dumps(value, ensure_ascii=False, sort_keys=True) for name, value in c.items()}
+        updater(c)
+        self._index.move_to_end(key)
+        fields = {name: value for name, value in c.items()
+                  if before.get(name) != json.dumps(value, ensure_ascii=False, sort_keys=True)}
+        removed = [name for name in before if name not in c]
+        self._append({'op': 'update', 'topic': topic, 'difficulty': difficulty,
+                      'fields': fields, 'removed': removed})
+        return c
+
+    def delete(self, topic, difficulty):
+        """Удаляет курс и дописывает запись об удалении"""
+        if self._index.pop(self._key(topic, difficulty), None) is None:
+            return False
+        self._append({'op': 'delete', 'topic': topic, 'difficulty': difficulty})
+        return True
+
+    def _append(self, record):
+        """Дописывает запись в журнал и при необходимости запускает сжатие"""
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            if self._journal is None:
+                self._journal = open(self.filename, 'a', encoding='utf-8')
+            self._journal.write(line)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._records += 1
+            if self._pending is not None:
+                self._pending.append(line)
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        garbage = self._records - len(self._index)
+        if garbage <= max(self.COMPACT_MIN_GARBAGE, len(self._index) * self.COMPACT_RATIO):
+            return
+        if self._compact_thread is not None and self._compact_thread.is_alive():
+            return
+        # Снимок делаем в вызывающем потоке: курсы меняются только здесь
+        with self._lock:
+            lines = self._snapshot_lines(self._index.values())
+            self._pending = []
+        self._compact_thread = threading.Thread(target=self._compact, args=(lines,), daemon=True)
+        self._compact_thread.start()
+
+    @staticmethod
+    def _snapshot_lines(courses):
+        """Журнал из одних записей put (от старых курсов к недавним)"""
+        return [json.dumps({'op': 'put', 'course': c}, ensure_ascii=False) + '\n' for c in courses]
+
+    def _compact(self, lines):
+        """Фоновое сжатие журнала до снимка + записей, дописанных за это время"""
+        tmp_path = self.filename + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            with self._lock:
+                pending, self._pending = self._pending, None
+                with open(tmp_path, 'a', encoding='utf-8') as f:
+                    f.writelines(pending)
+                    f.flush()
+                    os.fsync(f.fileno())
+                if self._journal is not None:
+                    self._journal.close()
+                    self._journal = None
+                os.replace(tmp_path, self.filename)
+                self._records = len(lines) + len(pending)
+        except OSError as e:
+            print(f"[MAIN] Journal compaction failed: {e}")
+            with self._lock:
+                self._pending = None
+
+    def _rewrite(self, lines):
+        """Атомарно заменяет журнал готовыми строками"""
+        tmp_path = self.filename + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            os.replace(tmp_path, self.filename)
+            self._records = len(lines)
+
+    def _write(self):
+        """Синхронное сжатие журнала до текущего состояния"""
+        self.compact()
+
+    def compact(self):
+        """Сжимает журнал сразу (дожидается фонового сжатия, если оно идёт)"""
+        if self._compact_thread is not None:
+            self._compact_thread.join()
+        self._rewrite(self._snapshot_lines(self._index.values()))
+
+    def close(self):
+        """Дожидается фонового сжатия и закрывает файл журнала"""
+        if self._compact_thread is not None:
+            self._compact_thread.join()
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+
+class SQLiteCourseStorage(CourseStorage):
+    """
+    Хранилище курсов в базе SQLite.
+    
+    Курс разложен по таблицам, чтобы список сохранённых курсов не читал
+    теорию и вопросы:
+    - courses - метаданные (тема, сложность, meta без истории) и порядок использования
+    - theory - текст теории
+    - questions - вопросы теста (JSON)
+    - attempts - история прохождения, по строке на попытку
+    
+    Полный курс собирается только в find() (при открытии курса). Результат
+    теста дописывает одну строку в attempts и обновляет meta, не трогая
+    теорию и вопросы. При первом запуске курсы переносятся из
+    legacy_filename (courses.json или журнал JournalCourseStorage).
+    
+    Атрибуты:
+        legacy_filename: Старое хранилище для однократной миграции
+    """
+    SCHEMA_VERSION = 1
+
+    def __init__(self, filename='courses.db', legacy_filename=None):
+        """
+        Args:
+            filename: Путь к файлу базы данных
+            legacy_filename: courses.json или courses.journal для миграции
+        """
+        self.filename = filename
+        self.legacy_filename = legacy_filename
+        self._lock = threading.RLock()
+        # Хранилище вызывается из UI-потока и из фоновых потоков генерации
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.execute('PRAGMA foreign_keys = ON')
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        with self._lock:
+            version = self._db.execute('PRAGMA user_version').fetchone()[0]
+            if version < self.SCHEMA_VERSION:
+                self._create_schema()
+                self._migrate()
+
+    def _create_schema(self):
+        with self._db:
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS courses (
+                    id INTEGER PRIMARY KEY,
+                    topic_key TEXT NOT NULL,
+                    difficulty_key TEXT NOT NULL,
+                    topic TEXT NOT NULL,
+                    difficulty TEXT NOT NULL,
+                    meta TEXT NOT NULL,
+                    extra TEXT NOT NULL,
+                    last_used INTEGER NOT NULL
+                );
+                CREATE UNIQUE INDEX IF NOT EXISTS courses_key ON courses (topic_key, difficulty_key);
+                CREATE INDEX IF NOT EXISTS courses_difficulty ON courses (difficulty_key);
+                CREATE INDEX IF NOT EXISTS courses_last_used ON courses (last_used);
+                CREATE TABLE IF NOT EXISTS theory (
+                    course_id INTEGER PRIMARY KEY REFERENCES courses (id) ON DELETE CASCADE,
+                    text TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS questions (
+                    course_id INTEGER PRIMARY KEY REFERENCES courses (id) ON DELETE CASCADE,
+                    data TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS attempts (
+                    id INTEGER PRIMARY KEY,
+                    course_id INTEGER NOT NULL REFERENCES courses (id) ON DELETE CASCADE,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS attempts_course ON attempts (course_id);
+            """)
+
+    def _migrate(self):
+        """Однократный перенос курсов из старого хранилища"""
+        courses = []
+        legacy = self.legacy_filename
+        if legacy and os.path.exists(legacy):
+            try:
+                if legacy.endswith('.journal'):
+                    old = JournalCourseStorage(legacy)
+                    courses = old.get_all()
+                    old.close()
+                else:
+                    courses = CourseStorage(legacy).get_all()
+            except Exception as e:
+                print(f"[MAIN] Course migration failed: {e}")
+                courses = []
+        with self._db:
+            # Старые курсы - первыми, чтобы порядок использования сохранился
+            for course in reversed(courses):
+                self._put(course)
+            self._db.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+        if courses:
+            print(f"[MAIN] Migrated {len(courses)} courses from {legacy}")
+
+    @staticmethod
+    def _dumps(value):
+        return json.dumps(value, ensure_ascii=False)
+
+    def _split(self, course):
+        """Раскладывает курс на (meta без истории, история, прочие поля)"""
+        meta = dict(course.get('meta', {}))
+        history = meta.pop('history', None)
+        extra = {name: value for name, value in course.items() if name not in ('meta', 'theory', 'questions')}
+        return meta, history, extra
+
+    def _next_used(self):
+        """Следующий номер в порядке использования (больше - недавнее)"""
+        return self._db.execute('SELECT COALESCE(MAX(last_used), 0) + 1 FROM courses').fetchone()[0]
+
+    def _course_id(self, topic, difficulty):
+        row = self._db.execute('SELECT id FROM courses WHERE topic_key = ? AND difficulty_key = ?',
+                               self._key(topic, difficulty)).fetchone()
+        return row[0] if row else None
+
+    def _put(self, course):
+        """Записывает курс целиком (вызывается внутри транзакции)"""
+        meta, history, extra = self._split(course)
+        topic = meta.get('topic') or ''
+        difficulty = meta.get('difficulty') or ''
+        topic_key, difficulty_key = self._key(topic, difficulty)
+        self._db.execute('DELETE FROM courses WHERE topic_key = ? AND difficulty_key = ?',
+                         (topic_key, difficulty_key))
+        cursor = self._db.execute(
+            'INSERT INTO courses (topic_key, difficulty_key, topic, difficulty, meta, extra, last_used) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (topic_key, difficulty_key, topic, difficulty, self._dumps(meta), self._dumps(extra),
+             self._next_used()))
+        course_id = cursor.lastrowid
+        if course.get('theory') is not None:
+            self._db.execute('INSERT INTO theory (course_id, text) VALUES (?, ?)', (course_id, course['theory']))
+        if 'questions' in course:
+            self._db.execute('INSERT INTO questions (course_id, data) VALUES (?, ?)',
+                             (course_id, self._dumps(course['questions'])))
+        if history is not None:
+            self._insert_attempts(course_id, history)
+
+    def _insert_attempts(self, course_id, history):
+        # История хранится от новых попыток к старым, id растёт от старых к новым
+        self._db.executemany('INSERT INTO attempts (course_id, data) VALUES (?, ?)',
+                             [(course_id, self._dumps(entry)) for entry in reversed(history)])
+
+    def _load_history(self, course_id):
+        rows = self._db.execute('SELECT data FROM attempts WHERE course_id = ? ORDER BY id DESC',
+                                (course_id,)).fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def load(self):
+        """
+        Загружает все курсы целиком.
+        
+        Returns:
+            list: Список курсов (сначала недавние)
+        """
+        return self.get_all()
+
+    def save(self, course):
+        """Сохраняет курс (заменяет курс с той же темой и сложностью)"""
+        with self._lock, self._db:
+            self._put(course)
+
+    def find(self, topic, difficulty):
+        """
+        Собирает курс целиком: метаданные, теорию, вопросы и историю.
+        
+        Returns:
+            dict|None: Найденный курс или None если курс не найден
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT c.id, c.meta, c.extra, t.text, q.data, '
+                '(SELECT COUNT(*) FROM attempts a WHERE a.course_id = c.id) '
+                'FROM courses c LEFT JOIN theory t ON t.course_id = c.id '
+                'LEFT JOIN questions q ON q.course_id = c.id '
+                'WHERE c.topic_key = ? AND c.difficulty_key = ?',
+                self._key(topic, difficulty)).fetchone()
+            if row is None:
+                return None
+            course_id, meta, extra, theory, questions, attempts = row
+            course = json.loads(extra)
+            if theory is not None:
+                course['theory'] = theory
+            if questions is not None:
+                course['questions'] = json.loads(questions)
+            course['meta'] = json.loads(meta)
+            if attempts:
+                course['meta']['history'] = self._load_history(course_id)
+            return course
+
+    def update_entry(self, topic, difficulty, updater):
+        """
+        Обновляет курс функцией-обновителем.
+        
+        В базу записываются только изменившиеся части: обычно это meta и
+        новые попытки в attempts, теория и вопросы не перезаписываются.
+        
+        Returns:
+            dict|None: Обновленный курс или None если курс не найден
+        """
+        with self._lock:
+            course = self.find(topic, difficulty)
+            if course is None:
+                return None
+            course_id = self._course_id(topic, difficulty)
+            _, old_history, _ = self._split(course)
+            old_history = list(old_history or [])  # Обновитель меняет список на месте
+            old_theory = course.get('theory')
+            old_questions = self._dumps(course.get('questions'))
+            updater(course)
+            meta, history, extra = self._split(course)
+            new_key = self._key(meta.get('topic'), meta.get('difficulty'))
+            with self._db:
+                if new_key != self._key(topic, difficulty):
+                    # Сменилась тема или сложность - записываем курс заново
+                    self._db.execute('DELETE FROM courses WHERE id = ?', (course_id,))
+                    self._put(course)
+                    return course
+                self._db.execute('UPDATE courses SET meta = ?, extra = ?, topic = ?, difficulty = ?, '
+                                 'last_used = ? WHERE id = ?',
+                                 (self._dumps(meta), self._dumps(extra), meta.get('topic') or '',
+                                  meta.get('difficulty') or '', self._next_used(), course_id))
+                if course.get('theory') != old_theory:
+                    self._db.execute('DELETE FROM theory WHERE course_id = ?', (course_id,))
+                    if course.get('theory') is not None:
+                        self._db.execute('INSERT INTO theory (course_id, text) VALUES (?, ?)',
+                                         (course_id, course['theory']))
+                if self._dumps(course.get('questions')) != old_questions:
+                    self._db.execute('DELETE FROM questions WHERE course_id = ?', (course_id,))
+                    if 'questions' in course:
+                        self._db.execute('INSERT INTO questions (course_id, data) VALUES (?, ?)',
+                                         (course_id, self._dumps(course['questions'])))
+                history = history or []
+                added = len(history) - len(old_history)
+                if added >= 0 and history[added:] == old_history:
+                    # Обычный случай: новые попытки добавлены в начало
+                    self._insert_attempts(course_id, history[:added])
+                else:
+                    self._db.execute('DELETE FROM attempts WHERE course_id = ?', (course_id,))
+                    self._insert_attempts(course_id, history)
+            return course
+
+    def delete(self, topic, difficulty):
+        """Удаляет курс вместе с теорией, вопросами и историей"""
+        with self._lock, self._db:
+            cursor = self._db.execute('DELETE FROM courses WHERE topic_key = ? AND difficulty_key = ?',
+                                      self._key(topic, difficulty))
+            return cursor.rowcount > 0
+
+    def list_meta(self):
+        """
+        Метаданные курсов для списка сохранённых (сначала недавние).
+        
+        Читает только таблицу courses: теория, вопросы и история не загружаются.
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT meta FROM courses ORDER BY last_used DESC').fetchall()
+        return [json.loads(meta) for meta, in rows]
+
+    def get_all(self):
+        """
+        Возвращает список всех курсов целиком (сначала недавние).
+        
+        Для списка курсов в интерфейсе достаточно list_meta().
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT topic, difficulty FROM courses ORDER BY last_used DESC').fetchall()
+            return [self.find(topic, difficulty) for topic, difficulty in rows]
+
+    def _write(self):
+        """Изменения записываются сразу в каждой операции"""
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+class OpenQuestionsCache:
+    """
+    Кеш открытых вопросов с отложенной записью на диск.
+    
+    Чтение и изменение идут только в памяти под блокировкой (кеш
+    заполняется из фоновых потоков генерации). Изменение лишь помечает
+    кеш "грязным"; фоновый поток ждёт write_delay секунд, собирая все
+    изменения за это время, и записывает один снимок: во временный файл,
+    который затем атомарно заменяет основной (os.replace).
+    
+    Размер ограничен max_entries: при переполнении вытесняются давно
+    не использованные темы (LRU). В файле записи идут от старых к новым.
+    
+    Ключ - "{тема}|{сложность}". Кроме точного совпадения find_similar()
+    ищет похожую тему той же сложности ("Python", "основы Python",
+    "Питон") по индексу триграмм topic_match.TopicIndex.
+    
+    Атрибуты:
+        stats: Счётчики записей в кеш, записей на диск, вытеснений и нечётких попаданий
+    """
+    MAX_ENTRIES = 200
+    WRITE_DELAY = 1.0  # Секунды, за которые изменения собираются в одну запись
+
+    def __init__(self, filename, max_entries=MAX_ENTRIES, write_delay=WRITE_DELAY,
+                 similarity_threshold=TOPIC_SIMILARITY_THRESHOLD):
+        """
+        Args:
+            filename: Путь к JSON файлу кеша
+            max_entries: Максимальное число тем в кеше
+            write_delay: Задержка перед записью на диск
+            similarity_threshold: Минимальное сходство тем (0..1) для find_similar()
+        """
+        self.filename = filename
+        self.max_entries = max_entries
+        self.write_delay = write_delay
+        self.stats = {'puts': 0, 'writes': 0, 'evictions': 0, 'similar_hits': 0}
+        self._entries = OrderedDict()
+        self._topics = TopicIndex(similarity_threshold)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # Не даёт flush() и фоновому потоку писать одновременно
+        self._changed = threading.Condition(self._lock)
+        self._dirty = False
+        self._closing = threading.Event()
+        self._thread = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.filename):
+            return
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"[MAIN] Failed to load open questions cache: {e}")
+            return
+        if isinstance(data, dict):
+            self._entries.update(data)
+            for key in self._entries:
+                self._index_key(key)
+            # Старый файл мог вырасти сверх лимита - лишнее вытесним при первой записи
+            if self._evict():
+                self._dirty = True
+
+    def _index_key(self, key):
+        topic, _, difficulty = key.rpartition('|')
+        self._topics.add(key, topic, difficulty)
+
+    def _evict(self):
+        evicted = 0
+        while len(self._entries) > self.max_entries:
+            key, _ = self._entries.popitem(last=False)
+            self._topics.remove(key)
+            evicted += 1
+        self.stats['evictions'] += evicted
+        return evicted
+
+    def get(self, key):
+        """Возвращает вопросы по ключу (или None) и отмечает тему как недавнюю"""
+        with self._lock:
+            questions = self._entries.get(key)
+            if questions is not None:
+                self._entries.move_to_end(key)
+            return questions
+
+    def put(self, key, questions):
+        """Кладёт вопросы в кеш; на диск они попадут в фоновой записи"""
+        with self._lock:
+            self._entries[key] = questions
+            self._entries.move_to_end(key)
+            self._index_key(key)
+            self._evict()
+            self.stats['puts'] += 1
+            self._dirty = True
+            self._changed.notify()
+        self._start()
+
+    def find_similar(self, topic, difficulty):
+        """
+        Ищет вопросы для похожей темы той же сложности.
+        
+        Returns:
+            list|None: Вопросы самой похожей темы, если сходство не ниже порога
+        """
+        with self._lock:
+            match = self._topics.lookup(topic, difficulty)
+            if match is None:
+                return None
+            key, _ = match
+            self._entries.move_to_end(key)
+            self.stats['similar_hits'] += 1
+            return self._entries[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='open-questions-cache', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._closing.is_set():
+            with self._lock:
+                while not self._dirty and not self._closing.is_set():
+                    self._changed.wait()
+            # Изменения, пришедшие за время ожидания, уйдут в ту же запись
+            self._closing.wait(self.write_delay)
+            self.flush()
+
+    def flush(self):
+        """Сразу записывает несохранённые изменения"""
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                snapshot = dict(self._entries)
+                self._dirty = False
+            tmp_path = self.filename + '.tmp'
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, ensure_ascii=False)
+                os.replace(tmp_path, self.filename)
+                self.stats['writes'] += 1
+            except OSError as e:
+                print(f"[MAIN] Failed to save open questions cache: {e}")
+
+    def close(self):
+        """Останавливает фоновую запись и сохраняет последние изменения"""
+        self._closing.set()
+        with self._lock:
+            self._changed.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+class SettingsService:
+    """
+    Настройки пользователя, прочитанные один раз и отдаваемые из памяти.
+    
+    Единственное место, где определяется API ключ: сохранённый в настройках,
+    иначе переменная окружения OPENROUTER_API_KEY, иначе None. Чтения
+    потокобезопасны (ключ нужен фоновым потокам генерации и чата);
+    save() записывает JsonStore и обновляет значения в памяти.
+    """
+
+    def __init__(self, store):
+        """
+        Args:
+            store: JsonStore с настройками
+        """
+        self._store = store
+        self._lock = threading.Lock()
+        self._values = {}
+        self.reload()
+
+    def reload(self):
+        """Перечитывает настройки из хранилища"""
+        with self._lock:
+            api = self._store.get('api') if self._store.exists('api') else {}
+            grading = self._store.get('grading') if self._store.exists('grading') else {}
+            prefetch = self._store.get('prefetch') if self._store.exists('prefetch') else {}
+            self._values = {
+                'api_key': (api.get('api_key', api.get('key')) or '').strip(),
+                'deferred_grading': bool(grading.get('deferred', False)),
+                'prefetch_followups': bool(prefetch.get('enabled', False)),
+            }
+
+    @property
+    def stored_api_key(self):
+        """Ключ из настроек (для поля ввода); '' если не сохранён"""
+        with self._lock:
+            return self._values['api_key']
+
+    @property
+    def api_key(self):
+        """Ключ для запросов: настройки -> OPENROUTER_API_KEY -> None"""
+        with self._lock:
+            key = self._values['api_key']
+        if not key:
+            load_llm()  # llm.py загружает .env
+            key = (os.getenv('OPENROUTER_API_KEY') or '').strip()
+        return key or None
+
+    @property
+    def deferred_grading(self):
+        with self._lock:
+            return self._values['deferred_grading']
+
+    @property
+    def prefetch_followups(self):
+        """Готовить ли заранее курсы по рекомендованным темам"""
+        with self._lock:
+            return self._values['prefetch_followups']
+
+    def save(self, api_key=None, deferred_grading=None, prefetch_followups=None):
+        """Сохраняет переданные настройки и обновляет их в памяти"""
+        with self._lock:
+            if api_key is not None:
+                self._store.put('api', api_key=api_key.strip())
+            if deferred_grading is not None:
+                self._store.put('grading', deferred=bool(deferred_grading))
+            if prefetch_followups is not None:
+                self._store.put('prefetch', enabled=bool(prefetch_followups))
+        self.reload()
+
+class ChatHistory:
+    """
+    История чата на диске с ограниченным окном в памяти.
+    
+    Все сообщения лежат в SQLite, в памяти - только окно из не более чем
+    window подряд идущих сообщений (messages, от старых к новым), которое
+    показывает RecycleView чата. Когда пользователь долистывает до края
+    окна, load_older()/load_newer() сдвигают его на page сообщений,
+    отбрасывая сообщения с противоположного края. add() дописывает
+    сообщение в конец истории (и возвращает окно к последним сообщениям).
+    
+    Атрибуты:
+        messages: Окно - словари {'id', 'role', 'text', 'image'}
+        has_older/has_newer: Есть ли на диске сообщения за краями окна
+        stats: Счётчики добавленных, подгруженных и выгруженных из окна сообщений
+    """
+
+    def __init__(self, filename=':memory:', window=200, page=50):
+        """
+        Args:
+            filename: Путь к файлу базы данных
+            window: Максимум сообщений в памяти
+            page: Сколько сообщений подгружать за раз
+        """
+        self.filename = filename
+        self.window = max(window, 2 * page)
+        self.page = page
+        self.messages = []
+        self.has_older = False
+        self.has_newer = False
+        self.stats = {'added': 0, 'loaded': 0, 'dropped': 0}
+        # recent() вызывается из фонового потока запроса к модели
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        with self._db:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY,
+                    role TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    image TEXT
+                )""")
+        self.load_latest()
+
+    @staticmethod
+    def _message(row):
+        return {'id': row[0], 'role': row[1], 'text': row[2], 'image': row[3]}
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+
+    def _select(self, where, args, order, limit):
+        rows = self._db.execute(
+            f'SELECT id, role, text, image FROM messages {where} ORDER BY id {order} LIMIT ?',
+            (*args, limit)).fetchall()
+        if order == 'DESC':
+            rows.reverse()
+        return [self._message(row) for row in rows]
+
+    def _exists(self, where, args):
+        return self._db.execute(f'SELECT 1 FROM messages {where} LIMIT 1', args).fetchone() is not None
+
+    def load_latest(self):
+        """Окно - последние page сообщений"""
+        with self._lock:
+            self.messages = self._select('', (), 'DESC', self.page)
+            self.has_newer = False
+            self.has_older = bool(self.messages) and self._exists('WHERE id < ?', (self.messages[0]['id'],))
+
+    def add(self, role, text, image=None):
+        """Сохраняет сообщение и добавляет его в конец окна; возвращает словарь сообщения"""
+        with self._lock:
+            if self.has_newer:
+                self.load_latest()
+            with self._db:
+                cursor = self._db.execute('INSERT INTO messages (role, text, image) VALUES (?, ?, ?)',
+                                          (role, text or '', image))
+            message = {'id': cursor.lastrowid, 'role': role, 'text': text or '', 'image': image}
+            self.messages.append(message)
+            self.stats['added'] += 1
+            if len(self.messages) > self.window:
+                dropped = len(self.messages) - self.window
+                del self.messages[:dropped]
+                self.stats['dropped'] += dropped
+                self.has_older = True
+            return message
+
+    def update(self, message_id, text):
+        """Заменяет текст сообщения (окончательный текст потокового ответа)"""
+        with self._lock:
+            with self._db:
+                self._db.execute('UPDATE messages SET text = ? WHERE id = ?', (text, message_id))
+            for message in reversed(self.messages):
+                if message['id'] == message_id:
+                    message['text'] = text
+                    break
+
+    def load_older(self):
+        """Подгружает page сообщений перед окном; возвращает их число"""
+        with self._lock:
+            if not self.has_older or not self.messages:
+                return 0
+            older = self._select('WHERE id < ?', (self.messages[0]['id'],), 'DESC', self.page)
+            self.messages[:0] = older
+            self.has_older = bool(older) and self._exists('WHERE id < ?', (older[0]['id'],))
+            if len(self.messages) > self.window:
+                dropped = len(self.messages) - self.window
+                del self.messages[-dropped:]
+                self.stats['dropped'] += dropped
+                self.has_newer = True
+            self.stats['loaded'] += len(older)
+            return len(older)
+
+    def load_newer(self):
+        """Подгружает page сообщений после окна; возвращает их число"""
+        with self._lock:
+            if not self.has_newer or not self.messages:
+                return 0
+            newer = self._select('WHERE id > ?', (self.messages[-1]['id'],), 'ASC', self.page)
+            self.messages.extend(newer)
+            self.has_newer = bool(newer) and self._exists('WHERE id > ?', (newer[-1]['id'],))
+            if len(self.messages) > self.window:
+                dropped = len(self.messages) - self.window
+                del self.messages[:dropped]
+                self.stats['dropped'] += dropped
+                self.has_older = True
+            self.stats['loaded'] += len(newer)
+            return len(newer)
+
+    def recent(self, count):
+        """Последние count сообщений истории (контекст для модели)"""
+        with self._lock:
+            return self._select('', (), 'DESC', count)
+
+    def clear(self):
+        with self._lock:
+            with self._db:
+                self._db.execute('DELETE FROM messages')
+            self.messages = []
+            self.has_older = self.has_newer = False
+
+    def close(self):
+        with self._lock:
+            self._db.close()
 
 # ============================================================================
 # KV MARKUP LANGUAGE - ДЕКЛАРАТИВНОЕ ОПИСАНИЕ ИНТЕРФЕЙСА
@@ -372,13 +1403,12 @@ KV = """
             radius: [dp(20)]
 
 # Главный менеджер экранов - переключает между основными экранами приложения
-ScreenManager:
+# Для первого кадра нужен только главный экран, остальные строятся при
+# первом переходе. Экраны курса и теста могут выгружаться (release_idle_screens)
+ScreenRegistry:
+    lazy_screens: {'loading': 'LoadingScreen', 'theory': 'TheoryScreen', 'quiz': 'QuizScreen', 'open_answer': 'OpenAnswerScreen', 'final': 'FinalScreen'}
+    releasable: ['loading', 'theory', 'quiz', 'open_answer', 'final']
     MainScreen:
-    LoadingScreen:
-    TheoryScreen:
-    QuizScreen:
-    OpenAnswerScreen:
-    FinalScreen:
 
 # NavButton - Кнопка нижней навигации (табы)
 # Унаследована от ToggleButton для поддержки выбора активного таба
@@ -430,17 +1460,13 @@ ScreenManager:
             Widget:
 
         # Менеджер табов - переключает между сохраненными, поиском, настройками
-        ScreenManager:
+        # Табы кроме первого строятся при первом открытии
+        ScreenRegistry:
             id: tab_manager
             size_hint: (1, 1)
+            lazy_screens: {'search': 'SearchScreen', 'chat': 'ChatScreen', 'settings': 'SettingsScreen'}
             SavedScreen:
                 name: 'saved'
-            SearchScreen:
-                name: 'search'
-            ChatScreen:
-                name: 'chat'
-            SettingsScreen:
-                name: 'settings'
                 
         # Нижняя навигация - фиксированная панель с кнопками табов
         BoxLayout:
@@ -517,10 +1543,21 @@ ScreenManager:
             halign: 'left'
             text_size: (self.width, None)
 
-        ScrollView:
-            GridLayout:
-                id: courses_grid
-                cols: 1
+        Label:
+            id: empty_label
+            text: 'Нет сохраненных курсов'
+            color: 0.5, 0.5, 0.5, 1
+            size_hint_y: None
+            height: dp(40) if not courses_list.data else 0
+            opacity: 1 if not courses_list.data else 0
+
+        RecycleView:
+            id: courses_list
+            viewclass: 'CourseCard'
+            RecycleBoxLayout:
+                orientation: 'vertical'
+                default_size: None, dp(110)
+                default_size_hint: 1, None
                 size_hint_y: None
                 height: self.minimum_height
                 spacing: 10
@@ -646,6 +1683,40 @@ ScreenManager:
             foreground_color: 0, 0, 0, 1
             cursor_color: 0.15, 0.55, 0.9, 1
 
+        BoxLayout:
+            size_hint_y: None
+            height: dp(40)
+            spacing: dp(8)
+            CheckBox:
+                id: deferred_grading_checkbox
+                size_hint_x: None
+                width: dp(40)
+                color: 0.15, 0.55, 0.9, 1
+            Label:
+                text: 'Проверять развёрнутые ответы в конце'
+                color: 0.4, 0.4, 0.4, 1
+                font_size: '15sp'
+                halign: 'left'
+                valign: 'middle'
+                text_size: self.size
+
+        BoxLayout:
+            size_hint_y: None
+            height: dp(40)
+            spacing: dp(8)
+            CheckBox:
+                id: prefetch_checkbox
+                size_hint_x: None
+                width: dp(40)
+                color: 0.15, 0.55, 0.9, 1
+            Label:
+                text: 'Готовить рекомендованные курсы заранее'
+                color: 0.4, 0.4, 0.4, 1
+                font_size: '15sp'
+                halign: 'left'
+                valign: 'middle'
+                text_size: self.size
+
         RoundedButton:
             text: 'СОХРАНИТЬ'
             font_size: '18sp'
@@ -768,7 +1839,8 @@ ScreenManager:
             padding: [0, 0, 0, 0]
             Widget:
             RoundedButton:
-                text: 'ПЕРЕЙТИ К ТЕСТУ'
+                text: 'ПЕРЕЙТИ К ТЕСТУ' if root.questions_ready else 'ВОПРОСЫ ГОТОВЯТСЯ...'
+                disabled: not root.questions_ready
                 font_size: '18sp'
                 bold: True
                 size_hint: None, None
@@ -1076,12 +2148,15 @@ ScreenManager:
                 valign: 'middle'
                 text_size: self.size
 
-        # Chat History
-        ScrollView:
-            id: chat_scroll
-            BoxLayout:
-                id: chat_list
+        # Chat History: виджеты только для видимых сообщений (ChatMessageView),
+        # в data - окно ChatHistory с заранее посчитанной высотой строк
+        RecycleView:
+            id: chat_list
+            viewclass: 'ChatMessageView'
+            RecycleBoxLayout:
                 orientation: 'vertical'
+                default_size: None, dp(60)
+                default_size_hint: 1, None
                 size_hint_y: None
                 height: self.minimum_height
                 padding: [dp(10), dp(10)]
@@ -1370,24 +2445,28 @@ ScreenManager:
 # ПОЛЬЗОВАТЕЛЬСКИЕ ВИДЖЕТЫ - ПЕРЕИСПОЛЬЗУЕМЫЕ UI КОМПОНЕНТЫ
 # ============================================================================
 
-class CourseCard(ButtonBehavior, BoxLayout):
+class CourseCard(RecycleDataViewBehavior, ButtonBehavior, BoxLayout):
     """
     Карточка курса для отображения в списке сохранённых курсов.
     
     Показывает название темы, уровень сложности и кнопку удаления.
     Кликабельная - при нажатии открывает курс для прохождения.
     
+    Используется как viewclass в RecycleView: карточки создаются только
+    для видимых строк и переиспользуются при прокрутке, RecycleView
+    лишь подставляет новые topic и difficulty из записи data.
+    
     Атрибуты:
         topic: Название темы курса
         difficulty: Уровень сложности ('легкий', 'средний', 'эксперт')
         bg_color: Цвет фона карточки
     """
     bg_color = ListProperty([1, 1, 1, 1])
+    topic = StringProperty('')
+    difficulty = StringProperty('')
     
-    def __init__(self, topic, difficulty, **kwargs):
+    def __init__(self, topic='', difficulty='', **kwargs):
         super().__init__(**kwargs)
-        self.topic = topic
-        self.difficulty = difficulty
         self.orientation = 'vertical'
         self.padding = [dp(16), dp(12)]
         self.spacing = dp(4)
@@ -1401,8 +2480,7 @@ class CourseCard(ButtonBehavior, BoxLayout):
         self.bind(pos=self._update_rect, size=self._update_rect)
         
         top_row = BoxLayout(size_hint_y=None, height=dp(32))
-        topic_label = Label(
-            text=topic,
+        self._topic_label = Label(
             color=(0.2, 0.2, 0.2, 1),
             font_size='18sp',
             bold=True,
@@ -1410,33 +2488,48 @@ class CourseCard(ButtonBehavior, BoxLayout):
             valign='middle',
             text_size=(self.width, None),
         )
-        topic_label.bind(size=lambda inst, size: setattr(inst, 'text_size', (size[0], None)))
-        topic_label.size_hint_x = 0.85
-        top_row.add_widget(topic_label)
+        self._topic_label.bind(size=lambda inst, size: setattr(inst, 'text_size', (size[0], None)))
+        self._topic_label.size_hint_x = 0.85
+        top_row.add_widget(self._topic_label)
         delete_btn = IconButton(
             size_hint=(None, None),
             size=(dp(26), dp(26)),
             default_source='trash-can',
             pressed_source='trash-can'
         )
-        delete_btn.bind(on_release=lambda inst, t=topic, d=difficulty: App.get_running_app().delete_saved_course(t, d))
+        # Тема берётся в момент нажатия: карточка могла быть переиспользована для другого курса
+        delete_btn.bind(on_release=lambda inst: App.get_running_app().delete_saved_course(self.topic, self.difficulty))
         top_row.add_widget(delete_btn)
         self.add_widget(top_row)
         
-        diff_color = (0.3, 0.7, 0.3, 1) if 'легкий' in difficulty.lower() else \
-                     (0.9, 0.6, 0.2, 1) if 'средний' in difficulty.lower() else \
-                     (0.9, 0.3, 0.3, 1)
-                     
-        self.add_widget(Label(
-            text=difficulty,
-            color=diff_color,
+        self._difficulty_label = Label(
             font_size='14sp',
             halign='left',
             valign='middle',
             text_size=(self.width, None),
             size_hint_y=None,
             height=dp(20)
-        ))
+        )
+        self.add_widget(self._difficulty_label)
+
+        self.bind(topic=self._update_topic, difficulty=self._update_difficulty)
+        self.topic = topic
+        self.difficulty = difficulty
+        self._update_topic()
+        self._update_difficulty()
+
+    def _update_topic(self, *args):
+        self._topic_label.text = self.topic or 'Без темы'
+
+    def _update_difficulty(self, *args):
+        difficulty = self.difficulty.lower()
+        self._difficulty_label.color = (0.3, 0.7, 0.3, 1) if 'легкий' in difficulty else \
+                                       (0.9, 0.6, 0.2, 1) if 'средний' in difficulty else \
+                                       (0.9, 0.3, 0.3, 1)
+        self._difficulty_label.text = self.difficulty
+
+    def on_release(self):
+        App.get_running_app().start_saved_course(self.topic, self.difficulty)
 
     def _update_rect(self, *args):
         self._rect.pos = self.pos
@@ -1445,6 +2538,215 @@ class CourseCard(ButtonBehavior, BoxLayout):
             child.text_size = (self.width - dp(32), None)
 
 
+class ChatTextureCache:
+    """
+    Кеш текстур текста сообщений чата.
+    
+    Текст сообщения рисуется в текстуру один раз для данной ширины: по её
+    высоте считается высота строки списка, и её же показывает виджет
+    сообщения, когда строка попадает на экран, в том числе после
+    прокрутки назад. Старые текстуры вытесняются, когда их суммарный
+    объём превышает max_bytes.
+    """
+    FONT_SIZE = '15sp'
+    COLOR = (0, 0, 0, 1)
+
+    def __init__(self, max_bytes=CHAT_TEXTURE_CACHE_MB * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._textures = OrderedDict()  # (текст, ширина) -> текстура
+        self._bytes = 0
+
+    @classmethod
+    def render(cls, text, width):
+        """Рисует текст (с разметкой) шириной width; None для пустого текста"""
+        if not text:
+            return None
+        label = MarkupLabel(text=text, text_size=(max(width, 1), None), font_size=sp(15), color=cls.COLOR)
+        label.refresh()
+        texture = label.texture
+        # Текстура всегда шириной width; короткому сообщению хватает ширины
+        # самой длинной строки, по ней ChatMessageView строит узкий "пузырь"
+        lines = getattr(label, '_cached_lines', None)
+        if texture is not None and lines:
+            content_width = min(int(max(line.w for line in lines)) + 1, texture.width)
+            if content_width < texture.width:
+                texture = texture.get_region(0, 0, content_width, texture.height)
+        return texture
+
+    @staticmethod
+    def _texture_bytes(texture):
+        """Память текстуры (у обрезанной - всей исходной текстуры)"""
+        owner = getattr(texture, 'owner', None) or texture
+        return owner.width * owner.height * 4
+
+    def estimate_height(self, text, width):
+        """
+        Высота текста без вёрстки: по средней ширине символа шрифта.
+        
+        Вёрстка длинного сообщения занимает миллисекунды, поэтому строки,
+        подгружаемые страницей, получают оценку, а точную высоту - при
+        первой отрисовке (ChatMessageView._redraw).
+        """
+        if not text:
+            return 0
+        if not hasattr(self, '_char_width'):
+            sample = 'Съешь же ещё этих мягких французских булок, да выпей чаю. The quick brown fox'
+            label = MarkupLabel(font_size=sp(15))
+            sample_width, self._line_height = label.get_extents(sample)
+            self._char_width = sample_width / len(sample)
+        chars_per_line = max(int(width / self._char_width), 1)
+        lines = sum(max(-(-len(paragraph) // chars_per_line), 1) for paragraph in text.split('\n'))
+        return lines * self._line_height
+
+    def get(self, text, width):
+        key = (text, int(width))
+        texture = self._textures.get(key)
+        if texture is not None:
+            self._textures.move_to_end(key)
+            self.stats['hits'] += 1
+            return texture
+        self.stats['misses'] += 1
+        texture = self.render(text, key[1])
+        if texture is None:
+            return None
+        self._textures[key] = texture
+        self._bytes += self._texture_bytes(texture)
+        while self._bytes > self.max_bytes and len(self._textures) > 1:
+            _, old = self._textures.popitem(last=False)
+            self._bytes -= self._texture_bytes(old)
+            self.stats['evictions'] += 1
+        return texture
+
+
+CHAT_TEXTURES = ChatTextureCache()
+
+
+class ChatMessageView(RecycleDataViewBehavior, Widget):
+    """
+    Сообщение чата - строка RecycleView.
+    
+    Виджеты создаются только для видимых сообщений и переиспользуются при
+    прокрутке: refresh_view_attrs подставляет данные записи (role, text,
+    image, height), фон и текст рисуются инструкциями canvas, текст - из
+    ChatTextureCache. Высоту строки заранее считает ChatMessageView.measure.
+    Фон ("пузырь") шириной по тексту, но не шире BUBBLE_WIDTH от строки:
+    сообщения пользователя прижаты вправо, остальные - влево.
+    
+    Атрибуты:
+        role: 'user', 'assistant' или 'system'
+        text: Текст сообщения (разметка Kivy)
+        image: Путь к приложенному изображению или ''
+        streaming: Ответ ещё приходит - текстура не кешируется
+    """
+    PADDING = dp(10)
+    SPACING = dp(5)
+    BUBBLE_WIDTH = 0.8  # Наибольшая ширина пузыря - доля ширины строки
+    IMAGE_HEIGHT = dp(200)
+    USER_COLOR = (0.8, 0.9, 1, 1)
+    OTHER_COLOR = (1, 1, 1, 1)
+
+    message_id = NumericProperty(0)
+    role = StringProperty('assistant')
+    text = StringProperty('')
+    image = StringProperty('')
+    streaming = BooleanProperty(False)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        with self.canvas:
+            self._bg_color = Color(*self.OTHER_COLOR)
+            self._bg = RoundedRectangle(radius=[dp(10)])
+            Color(1, 1, 1, 1)
+            self._text_rect = Rectangle()
+        self._image = Image(size_hint=(None, None), allow_stretch=True, keep_ratio=True, opacity=0)
+        self.add_widget(self._image)
+        self._trigger_redraw = Clock.create_trigger(self._redraw, -1)
+        self.bind(pos=self._trigger_redraw, size=self._trigger_redraw, role=self._trigger_redraw,
+                  text=self._trigger_redraw, image=self._trigger_redraw, streaming=self._trigger_redraw)
+
+    @classmethod
+    def bubble_width(cls, width):
+        return width * cls.BUBBLE_WIDTH
+
+    @classmethod
+    def text_width(cls, width):
+        return cls.bubble_width(width) - 2 * cls.PADDING
+
+    @classmethod
+    def texture_for(cls, text, width, streaming=False):
+        text_width = cls.text_width(width)
+        if streaming:
+            return ChatTextureCache.render(text, text_width)
+        return CHAT_TEXTURES.get(text, text_width)
+
+    @classmethod
+    def measure(cls, text, image, width, streaming=False, exact=True):
+        """Высота строки для сообщения при ширине строки width (exact=False - оценка)"""
+        if exact:
+            texture = cls.texture_for(text, width, streaming)
+            text_height = texture.height if texture is not None else 0
+        else:
+            text_height = CHAT_TEXTURES.estimate_height(text, cls.text_width(width))
+        return cls._row_height(text_height, image, text)
+
+    @classmethod
+    def _row_height(cls, text_height, image, text):
+        height = 2 * cls.PADDING + text_height
+        if image:
+            height += cls.IMAGE_HEIGHT + (cls.SPACING if text else 0)
+        return height
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.index = index
+        self._rv = rv
+        return super().refresh_view_attrs(rv, index, data)
+
+    def _fix_height(self, height):
+        """Заменяет оценку высоты строки на точную, посчитанную по текстуре"""
+        rv = getattr(self, '_rv', None)
+        message_id = self.message_id
+
+        def fix(dt):
+            if rv is None or self.index >= len(rv.data):
+                return
+            row = rv.data[self.index]
+            if row['message_id'] == message_id and row['height'] != height:
+                rv.data[self.index] = dict(row, height=height)
+        # Не меняем data посреди раскладки RecycleView
+        Clock.schedule_once(fix)
+
+    def _redraw(self, *args):
+        texture = self.texture_for(self.text, self.width, self.streaming)
+        # Пузырь по ширине текста (с картинкой - наибольшей ширины)
+        bubble_width = self.bubble_width(self.width)
+        if texture is not None and not self.image:
+            bubble_width = min(texture.width + 2 * self.PADDING, bubble_width)
+        x = self.right - bubble_width if self.role == 'user' else self.x
+        self._bg_color.rgba = self.USER_COLOR if self.role == 'user' else self.OTHER_COLOR
+        self._bg.pos = (x, self.y)
+        self._bg.size = (bubble_width, self.height)
+        top = self.top - self.PADDING
+        if self.image:
+            self._image.source = self.image
+            self._image.opacity = 1
+            self._image.size = (bubble_width - 2 * self.PADDING, self.IMAGE_HEIGHT)
+            self._image.pos = (x + self.PADDING, top - self.IMAGE_HEIGHT)
+            top -= self.IMAGE_HEIGHT + self.SPACING
+        else:
+            self._image.opacity = 0
+            self._image.source = ''
+        self._text_rect.texture = texture
+        if texture is None:
+            self._text_rect.size = (0, 0)
+        else:
+            self._text_rect.size = texture.size
+            self._text_rect.pos = (x + self.PADDING, top - texture.height)
+        height = self._row_height(texture.height if texture is not None else 0, self.image, self.text)
+        if abs(height - self.height) >= 1:
+            self._fix_height(height)
+
+
 class RoundedButton(Button):
     """
     Кнопка со скруглёнными углами и настраиваемым цветом фона.
@@ -1764,12 +3066,12 @@ class MainScreen(Screen):
                 import socket
                 # Проверяем доступность DNS Google (быстро и надёжно)
                 socket.create_connection(("8.8.8.8", 53), timeout=2)
-                Clock.schedule_once(lambda dt: self._update_network_status(True))
+                return True
             except:
-                Clock.schedule_once(lambda dt: self._update_network_status(False))
+                return False
         
-        import threading
-        threading.Thread(target=_check, daemon=True).start()
+        App.get_running_app().run_task(_check, priority=task_scheduler.LOW, name='network_check',
+                                       on_done=lambda online: self._update_network_status(bool(online)))
     
     def _update_network_status(self, is_online):
         """Обновляет иконку статуса сети в UI"""
@@ -1859,10 +3161,12 @@ class TheoryScreen(Screen):
         theory_content: Текст теории (HTML разметка поддерживается)
         meta_title: Название темы
         meta_sub: Уровень сложности
+        questions_ready: False пока теория ещё поступает потоком, а вопросы не готовы
     """
     theory_content = StringProperty('')
     meta_title = StringProperty('')
     meta_sub = StringProperty('')
+    questions_ready = BooleanProperty(True)
 
 
 class DotSpinner(BoxLayout):
@@ -1911,12 +3215,15 @@ class QuizScreen(Screen):
         result_text: Текст результата после ответа
         current_question_text: Текст текущего вопроса
         wrong_explanations: Список ошибок для финального экрана
+        questions_complete: False пока вопросы ещё поступают потоком от LLM
     """
     question_index = NumericProperty(0)
     score = NumericProperty(0)
     result_text = StringProperty('')
     current_question_text = StringProperty('')
+    questions_complete = BooleanProperty(True)
     wrong_explanations = []
+    waiting_for_question = False
 
     questions = [
         {"question": "Какого цвета небо?",
@@ -1936,7 +3243,10 @@ class QuizScreen(Screen):
         app = App.get_running_app()
         if not getattr(app, 'open_questions_preloading', False):
             app.open_questions_preloading = True
-            threading.Thread(target=app.preload_open_questions).start()
+            # Низкий приоритет: не мешает генерации, которую ждёт пользователь.
+            # Задача привязана к тесту и отменяется при запуске нового (start_quiz)
+            app._preload_task = app.run_task(app.preload_open_questions, priority=task_scheduler.LOW, screen='quiz',
+                                             on_done=app.on_open_questions_preloaded)
 
     def load_question(self):
         if not self.questions or self.question_index >= len(self.questions):
@@ -2001,20 +3311,35 @@ class QuizScreen(Screen):
         if not getattr(self, 'answered', False):
             self.result_text = 'Сначала выберите вариант.'
             return
-        if self.question_index + 1 < len(self.questions):
-            self.question_index += 1
-            self.load_question()
-        else:
-            self.finish_test()
+        self.auto_next_question()
 
     def auto_next_question(self):
         """Автоматический переход к следующему вопросу"""
         if self.question_index + 1 < len(self.questions):
             self.question_index += 1
             self.load_question()
+        elif not self.questions_complete:
+            # Следующий вопрос ещё генерируется - покажем его, как только он придёт
+            self.waiting_for_question = True
+            self.result_text = 'Загружаем следующий вопрос...'
         else:
             self.finish_test()
 
+    def add_streamed_question(self, question):
+        """Добавляет вопрос, полученный из потока, пока тест уже идёт"""
+        self.questions.append(question)
+        if self.waiting_for_question:
+            self.waiting_for_question = False
+            self.auto_next_question()
+
+    def finish_questions(self, questions):
+        """Устанавливает окончательный список вопросов после завершения генерации"""
+        self.questions = questions
+        self.questions_complete = True
+        if self.waiting_for_question:
+            self.waiting_for_question = False
+            self.auto_next_question()
+
     def finish_test(self):
         percent = 0
         if self.questions:
@@ -2039,6 +3364,7 @@ class QuizScreen(Screen):
         self.selected = None
         self.highlighted_button = None
         self.answered = False
+        self.waiting_for_question = False
         self.wrong_explanations = []
         self.load_question()
 
@@ -2055,7 +3381,10 @@ class OpenAnswerScreen(Screen):
     который оценивается LLM по шкале 0-10.
     Полная оценка и рекомендации показываются на финальном экране.
     """
-    pass
+
+    def on_leave(self):
+        """Отменяем оценку ответа, если пользователь ушёл с экрана"""
+        App.get_running_app().cancel_screen_requests(self.name)
 
 
 class FinalScreen(Screen):
@@ -2079,6 +3408,10 @@ class FinalScreen(Screen):
     note_text = StringProperty('')
     nav_visible = BooleanProperty(False)
 
+    def on_leave(self):
+        """Отменяем подбор следующих тем, если пользователь ушёл с экрана"""
+        App.get_running_app().cancel_screen_requests(self.name)
+
     def set_test_score(self, percent):
         if hasattr(self.ids, 'score_percent'):
             self.ids.score_percent.text = f"{percent}%"
@@ -2208,9 +3541,38 @@ class FinalScreen(Screen):
 
 
 class ChatScreen(Screen):
-    chat_history = ListProperty([])
+    """
+    Чат с моделью (текст и изображения).
+    
+    Сообщения хранит ChatHistory: вся история - в chat_history.db, в
+    памяти - окно из CHAT_WINDOW_MESSAGES сообщений. Окно показывает
+    RecycleView: data - словари-записи (без виджетов) с заранее
+    посчитанной высотой, виджеты ChatMessageView есть только у видимых
+    строк. При прокрутке к верхнему/нижнему краю окна подгружается
+    следующая страница истории с диска.
+    
+    Атрибуты:
+        history: ChatHistory текущего сеанса
+        selected_image: Изображение, приложенное к следующему сообщению
+    """
     selected_image = StringProperty(None, allownone=True)
 
+    LIST_PADDING = dp(10)  # padding и spacing RecycleBoxLayout в KV
+    LIST_SPACING = dp(10)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        app = App.get_running_app()
+        data_dir = app.user_data_dir if app else '.'
+        self.history = ChatHistory(os.path.join(data_dir, 'chat_history.db'),
+                                   window=CHAT_WINDOW_MESSAGES, page=CHAT_PAGE_MESSAGES)
+        # Чат живёт один сеанс, как и раньше
+        self.history.clear()
+        self._paging = False
+        self._row_width = None
+        chat_list = self.ids.chat_list
+        chat_list.bind(width=self._on_list_width, scroll_y=self._on_scroll)
+
     def send_message(self):
         text_input = self.ids.message_input
         message = text_input.text.strip()
@@ -2225,23 +3587,13 @@ class ChatScreen(Screen):
         self.selected_image = None
         # Иконка автоматически сбрасывается на default_source
         
-        threading.Thread(target=self._send_request_thread, args=(message, image_path)).start()
+        App.get_running_app().run_task(self._send_request_thread, message, image_path,
+                                       priority=task_scheduler.HIGH, name='chat')
 
     def _send_request_thread(self, message, image_path):
         app = App.get_running_app()
-        api_key = None
-        
-        # Получаем API ключ из настроек (правильный путь к хранилищу)
-        if hasattr(app, 'settings_store') and app.settings_store.exists('api'):
-            data = app.settings_store.get('api')
-            api_key = data.get('api_key', data.get('key'))
-        
-        if not api_key:
-            api_key = os.getenv("OPENROUTER_API_KEY")
-
-        # Fallback/Cleanup
-        if api_key:
-            api_key = api_key.strip()
+        # Ключ из настроек или OPENROUTER_API_KEY (SettingsService)
+        api_key = app._get_api_key()
         
         # Проверяем корректность ключа
         if not api_key or not api_key.startswith("sk-or-"):
@@ -2250,72 +3602,159 @@ class ChatScreen(Screen):
              return
 
         history = []
-        for msg in self.chat_history[-10:]:
+        for msg in self.history.recent(10):
              history.append({'role': msg['role'], 'content': msg['text']})
 
         print(f"[Chat] Sending request with key: {api_key[:10]}...")
-        response = chat_with_image(message, image_path, history=history, api_key=api_key)
+        # Ответ приходит потоком: текст копится здесь, а UI обновляется не чаще раза в 50 мс
+        stream = {'text': '', 'scheduled': False, 'done': False, 'message_id': None}
+
+        def on_delta(delta):
+            stream['text'] += delta
+            if not stream['scheduled']:
+                stream['scheduled'] = True
+                Clock.schedule_once(lambda dt: self._render_stream(stream), 0.05)
+
+        response = chat_with_image(message, image_path, history=history, api_key=api_key, on_delta=on_delta)
         
-        Clock.schedule_once(lambda dt: self.on_response(response))
+        Clock.schedule_once(lambda dt: self.on_response(response, stream))
 
-    def on_response(self, response):
+    def _render_stream(self, stream):
+        """Показывает накопленный текст потокового ответа"""
+        stream['scheduled'] = False
+        if stream['done'] or not stream['text']:
+            return
+        if stream['message_id'] is None:
+            stream['message_id'] = self.add_message(stream['text'], "assistant", streaming=True)
+        else:
+            self._update_message(stream['message_id'], stream['text'], streaming=True)
+
+    def on_response(self, response, stream=None):
+        message_id = stream['message_id'] if stream else None
+        if stream:
+            stream['done'] = True
         if 'error' in response:
             self.add_message(f"Ошибка: {response['error']}", "system")
+        elif message_id is not None:
+            # Сообщение уже создано потоком - записываем окончательный текст
+            self.history.update(message_id, response['content'])
+            self._update_message(message_id, response['content'])
         else:
             self.add_message(response['content'], "assistant")
 
-    def add_message(self, text, role, image=None):
-        self.chat_history.append({'role': role, 'text': text, 'image': image})
-        
-        # Контейнер для сообщения
-        msg_box = BoxLayout(orientation='vertical', size_hint_y=None, padding=[10, 10], spacing=5)
+    def add_message(self, text, role, image=None, streaming=False):
+        """Добавляет сообщение в историю и список; возвращает id сообщения"""
+        chat_list = self.ids.chat_list
+        at_bottom = chat_list.scroll_y <= 0.01 or not chat_list.data
+        first_id = self.history.messages[0]['id'] if self.history.messages else None
+        message = self.history.add(role, text, image)
+        messages = self.history.messages
+        if chat_list.data and messages[0]['id'] == first_id and len(messages) == len(chat_list.data) + 1:
+            chat_list.data.append(self._row(message, streaming))
+        else:
+            # Окно сдвинулось (отброшены старые сообщения или был возврат к последним)
+            self._refresh_rows()
+        if at_bottom or role == 'user':
+            Clock.schedule_once(lambda dt: setattr(chat_list, 'scroll_y', 0))
+        return message['id']
+
+    def _update_message(self, message_id, text, streaming=False):
+        """Меняет текст сообщения в окне и его строку в списке"""
+        for message in reversed(self.history.messages):
+            if message['id'] == message_id:
+                message['text'] = text
+                break
+        else:
+            return
+        data = self.ids.chat_list.data
+        for index in range(len(data) - 1, -1, -1):
+            if data[index]['message_id'] == message_id:
+                data[index] = self._row(message, streaming)
+                break
+
+    def _row(self, message, streaming=False, exact=True):
+        """Запись data для сообщения; exact=False - высота по оценке (уточнится при отрисовке)"""
+        width = self._row_width or ChatMessageView.PADDING * 2 + dp(100)
+        return {
+            'message_id': message['id'],
+            'role': message['role'],
+            'text': message['text'],
+            'image': message['image'] or '',
+            'streaming': streaming,
+            'height': ChatMessageView.measure(message['text'], message['image'], width, streaming, exact),
+        }
+
+    def _refresh_rows(self, remeasure=False):
+        """
+        Пересобирает data из окна истории.
         
-        # Фон сообщения (визуальное выделение)
-        with msg_box.canvas.before:
-            Color(*((0.8, 0.9, 1, 1) if role == 'user' else (1, 1, 1, 1)))
-            RoundedRectangle(pos=msg_box.pos, size=msg_box.size, radius=[10])
-            
-        # Обновление фона при изменении размера/позиции
-        def update_rect(instance, value):
-            instance.canvas.before.children[2].pos = instance.pos
-            instance.canvas.before.children[2].size = instance.size
-        msg_box.bind(pos=update_rect, size=update_rect)
+        Записи сообщений, оставшихся в окне, переиспользуются; для новых
+        (или для всех, если remeasure) высота оценивается без вёрстки.
+        """
+        chat_list = self.ids.chat_list
+        rows = {} if remeasure else {r['message_id']: r for r in chat_list.data}
+        chat_list.data = [rows.get(m['id']) or self._row(m, exact=False) for m in self.history.messages]
+
+    def _on_list_width(self, chat_list, width):
+        """Ширина списка изменилась - высота строк пересчитывается"""
+        row_width = int(width - 2 * self.LIST_PADDING)
+        if row_width <= 0 or row_width == self._row_width:
+            return
+        self._row_width = row_width
+        if self.history.messages:
+            self._refresh_rows(remeasure=True)
+
+    def _content_height(self, rows):
+        if not rows:
+            return 0
+        return sum(r['height'] for r in rows) + self.LIST_SPACING * (len(rows) - 1) + 2 * self.LIST_PADDING
+
+    def _offset_of(self, rows, message_id):
+        """Расстояние от верха списка до строки сообщения"""
+        offset = self.LIST_PADDING
+        for row in rows:
+            if row['message_id'] == message_id:
+                return offset
+            offset += row['height'] + self.LIST_SPACING
+        return offset
+
+    def _on_scroll(self, chat_list, scroll_y):
+        """У края окна подгружает следующую страницу истории"""
+        if self._paging or not chat_list.data:
+            return
+        if scroll_y >= 1 and self.history.has_older:
+            self._load_page(older=True)
+        elif scroll_y <= 0 and self.history.has_newer:
+            self._load_page(older=False)
 
-        total_height = dp(20) # Padding
+    def _load_page(self, older):
+        """
+        Сдвигает окно на страницу и сохраняет видимое место списка.
+        
+        Видимая область задаётся расстоянием от верха содержимого; оно
+        меняется на высоту строк, добавленных или убранных сверху.
+        """
+        chat_list = self.ids.chat_list
+        old_rows = list(chat_list.data)
+        viewport = chat_list.height
+        top = (1 - chat_list.scroll_y) * max(self._content_height(old_rows) - viewport, 0)
+        old_first = old_rows[0]['message_id']
+        loaded = self.history.load_older() if older else self.history.load_newer()
+        if not loaded:
+            return
+        self._paging = True
+        self._refresh_rows()
+        rows = chat_list.data
+        if older:
+            top += self._offset_of(rows, old_first) - self.LIST_PADDING
+        else:
+            top -= self._offset_of(old_rows, rows[0]['message_id']) - self.LIST_PADDING
+        scrollable = self._content_height(rows) - viewport
 
-        if image:
-            try:
-                img = Image(source=image, size_hint_y=None, height=dp(200), allow_stretch=True, keep_ratio=True)
-                msg_box.add_widget(img)
-                total_height += dp(200) + dp(5)
-            except Exception as e:
-                print(f"Error loading image: {e}")
-
-        if text:
-            lbl = Label(text=text, size_hint_y=None, color=(0,0,0,1), markup=True)
-            lbl.bind(width=lambda *x: setattr(lbl, 'text_size', (lbl.width, None)))
-            lbl.bind(texture_size=lambda *x: setattr(lbl, 'height', lbl.texture_size[1]))
-            msg_box.add_widget(lbl)
-            # Мы не знаем высоту сразу, поэтому используем bind
-            def update_height(instance, value):
-                # Пересчитываем высоту контейнера
-                h = dp(20)
-                for child in msg_box.children:
-                    h += child.height + msg_box.spacing
-                msg_box.height = h
-            lbl.bind(texture_size=update_height)
-            total_height += dp(40) # Начальная оценка
-
-        msg_box.height = total_height
-
-        # Обертка для выравнивания
-        wrapper = AnchorLayout(anchor_x='right' if role == 'user' else 'left', size_hint_y=None)
-        wrapper.add_widget(msg_box)
-        
-        # Связываем высоту обертки с высотой сообщения
-        msg_box.bind(height=lambda *x: setattr(wrapper, 'height', msg_box.height))
-        
-        self.ids.chat_list.add_widget(wrapper)
+        def restore(dt):
+            chat_list.scroll_y = min(max(1 - top / scrollable, 0), 1) if scrollable > 0 else 1
+            self._paging = False
+        Clock.schedule_once(restore)
 
     def show_image_chooser(self):
         """Показывает выбор изображения: галерея на Android, диалог на Desktop"""
@@ -2536,6 +3975,7 @@ class MyApp(MDApp):
         difficulty: Текущая сложность ('легкий', 'средний', 'сложный')
         storage: CourseStorage для сохранения курсов
         settings_store: JsonStore для настроек пользователя
+        settings_service: SettingsService - настройки и API ключ из памяти
         open_questions_cache: Кеш открытых вопросов для быстрого доступа
         mc_test_score/mc_test_total: Результаты MC теста для финального отчёта
         preloaded_open_questions: Предзагруженные открытые вопросы
@@ -2567,29 +4007,61 @@ class MyApp(MDApp):
             self.topic_memory_file = os.path.join(data_dir, 'course_topics.json')  # История тем
             self._last_api_key = None
             self.last_material = ''  # Последний загруженный материал
+            # Запросы к LLM в фоновом event loop, привязанные к экранам
+            self._screen_requests = {}
+            self._screen_requests_lock = threading.Lock()
+            # Блокирующие фоновые задачи - в общем пуле потоков с приоритетами
+            self.scheduler = TaskScheduler(workers=BACKGROUND_WORKERS, name='app-task')
+            self._preload_task = None  # Предзагрузка открытых вопросов (task_scheduler.Task)
+            self._preload_timeout_event = None
+            # Курсы, заранее сгенерированные по рекомендованным темам: ключ темы -> запись
+            self._prefetched = {}
+            self._prefetch_stats = {'started': 0, 'hits': 0, 'misses': 0, 'wasted': 0, 'failed': 0,
+                                    'tokens_spent': 0, 'tokens_wasted': 0}
+            # Резерв токенов на курс до получения ответа: размер последнего готового курса
+            self._prefetch_reserve = FOLLOWUP_PREFETCH_TOKEN_ESTIMATE
             
+            # Дисковый кеш ответов LLM: одинаковые запросы не уходят в сеть повторно
+            configure_response_cache(os.path.join(data_dir, 'llm_cache'))
+
             # Путь к кешу открытых вопросов для ускорения генерации
             self.open_questions_cache_path = os.path.join(data_dir, 'open_questions_cache.json')
-            self.open_questions_cache = self._load_open_questions_cache()
+            # Запись на диск - в фоновом потоке, несколько изменений одной записью
+            self.open_questions_cache = OpenQuestionsCache(self.open_questions_cache_path)
             
             print(f"[MAIN] courses_path: {courses_path}")
             print(f"[MAIN] settings_path: {settings_path}")
             
             # Создаём хранилище курсов
             print("[MAIN] Creating CourseStorage...")
-            self.storage = CourseStorage(filename=courses_path)
+            # SQLite: список курсов читает только метаданные, теория и вопросы -
+            # при открытии курса. Курсы переносятся из журнала или courses.json
+            journal_path = os.path.join(data_dir, 'courses.journal')
+            self.storage = SQLiteCourseStorage(
+                filename=os.path.join(data_dir, 'courses.db'),
+                legacy_filename=journal_path if os.path.exists(journal_path) else courses_path)
             self._last_saved_meta = None
+            # Список сохранённых курсов читается один раз, дальше обновляется точечно
+            self._saved_courses_loaded = False
             print("[MAIN] CourseStorage created")
             
             # Создаём хранилище настроек
             print("[MAIN] Creating JsonStore...")
             self.settings_store = JsonStore(settings_path)
+            # Настройки читаются один раз, дальше - из памяти
+            self.settings_service = SettingsService(self.settings_store)
             print("[MAIN] JsonStore created")
+            startup_profile.mark('build_storage')
             
-            # Загружаем и строим UI из KV разметки
+            # Загружаем и строим UI из KV разметки. Разобранные правила
+            # кешируются в kv_cache/ - при повторных запусках KV не парсится
             print("[MAIN] Loading KV string...")
-            root = Builder.load_string(KV)
+            root = kv_cache.load_string(KV, os.path.join(data_dir, 'kv_cache'))
             print("[MAIN] KV loaded successfully")
+            # Число виджетов и память при запуске и после переходов (get_screen_stats)
+            self._screen_metrics = {}
+            root.bind(current=self._on_screen_changed)
+            startup_profile.mark('build_kv')
             
             self.log("App started. Storage initialized.")
             print("[MAIN] build() complete!")
@@ -2599,42 +4071,72 @@ class MyApp(MDApp):
             print(f"[MAIN] Traceback: {tb_module.format_exc()}")
             raise
 
-    def _load_open_questions_cache(self):
+    def on_start(self):
+        """Ждёт первого кадра, чтобы отложить всё, что не нужно для него"""
+        Window.bind(on_flip=self._on_first_frame)
+
+    def _on_first_frame(self, *args):
         """
-        Загружает кеш открытых вопросов из файла.
-        
-        Кеш позволяет избежать повторной генерации одинаковых вопросов
-        для одной и той же темы и сложности.
+        Вызывается после вывода первого кадра.
         
-        Returns:
-            dict: Словарь с кешированными вопросами {ключ: вопросы}
-                  Ключ имеет формат "{topic}|{difficulty}"
+        Закрывает замер запуска (startup_profile) и загружает llm.py в
+        фоне, чтобы к первому запросу модуль уже был импортирован.
         """
-        if not getattr(self, 'open_questions_cache_path', None):
-            return {}
-        try:
-            if os.path.exists(self.open_questions_cache_path):
-                with open(self.open_questions_cache_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    if isinstance(data, dict):
-                        return data
-        except Exception as e:
-            self.log(f"Ошибка загрузки кеша открытых вопросов: {e}")
-        return {}
+        Window.unbind(on_flip=self._on_first_frame)
+        if startup_profile.first_frame():
+            self.stop()
+            return
+        self._screen_metrics['startup'] = screen_registry.snapshot(self.root)
+        self.log(f"Screens at startup: {self._screen_metrics['startup']}", applog.DEBUG)
+        self.run_task(load_llm, priority=task_scheduler.LOW, name='llm_import')
+
+    def on_pause(self):
+        """Приложение свёрнуто: выгружаем ненужные экраны, пока ОС не выгрузила нас"""
+        self.release_idle_screens()
+        return True
+
+    def _on_screen_changed(self, root, current):
+        """После перехода: на главном экране при нехватке памяти выгружает старые экраны"""
+        if current != 'main' or SCREEN_RELEASE_RSS_MB is None:
+            return
+        rss = screen_registry.rss_bytes()
+        if rss is not None and rss > SCREEN_RELEASE_RSS_MB * 2 ** 20:
+            self.release_idle_screens(SCREEN_RELEASE_IDLE)
 
-    def _save_open_questions_cache(self):
+    def release_idle_screens(self, min_idle=0):
         """
-        Сохраняет кеш открытых вопросов в файл.
+        Выгружает экраны курса и теста, не показанные min_idle секунд.
+        
+        Только на главном экране: пока курс открыт, экраны хранят его
+        состояние (теорию, ответы). Экраны с незавершёнными фоновыми
+        задачами (run_task с screen=...) тоже остаются. Выгруженный экран
+        создаётся заново при следующем переходе.
         
-        Вызывается автоматически после добавления новых вопросов в кеш.
+        Returns:
+            list: Имена выгруженных экранов
         """
-        if not getattr(self, 'open_questions_cache_path', None):
-            return
-        try:
-            with open(self.open_questions_cache_path, 'w', encoding='utf-8') as f:
-                json.dump(self.open_questions_cache, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            self.log(f"Ошибка сохранения кеша открытых вопросов: {e}")
+        if not self.root or self.root.current != 'main':
+            return []
+        with self._screen_requests_lock:
+            busy = {name for name, futures in self._screen_requests.items() if futures}
+        released = self.root.release_idle(min_idle, keep=busy)
+        if released:
+            self.log(f"Выгружены экраны: {', '.join(released)}", applog.DEBUG)
+        return released
+
+    def get_screen_stats(self):
+        """
+        Метрики экранов: число виджетов, память (RSS) и построенные экраны
+        при запуске ('startup') и сейчас ('current'), счётчики создания и
+        выгрузки экранов.
+        """
+        tabs = self.root.get_screen('main').ids.tab_manager
+        return {
+            'startup': self._screen_metrics.get('startup'),
+            'current': screen_registry.snapshot(self.root),
+            'screens': dict(self.root.stats),
+            'tabs': dict(tabs.stats),
+        }
 
     def _get_open_questions_cache_key(self, topic):
         """
@@ -2656,14 +4158,22 @@ class MyApp(MDApp):
         """
         Получает кешированные открытые вопросы для темы.
         
+        Сначала ищется точный ключ, затем похожая тема той же сложности
+        ("Python" найдёт вопросы, сохранённые для "основы Python" или "Питон").
+        
         Args:
             topic: Тема курса
             
         Returns:
             list|None: Список вопросов если найдены в кеше, иначе None
         """
-        key = self._get_open_questions_cache_key(topic)
-        return self.open_questions_cache.get(key)
+        questions = self.open_questions_cache.get(self._get_open_questions_cache_key(topic))
+        if questions is None:
+            difficulty = getattr(self, 'difficulty', 'легкий') or 'легкий'
+            questions = self.open_questions_cache.find_similar(topic, difficulty)
+            if questions is not None:
+                self.log(f"Open questions for '{topic}' taken from a similar cached topic")
+        return questions
 
     def cache_open_questions(self, topic, questions):
         """
@@ -2675,24 +4185,49 @@ class MyApp(MDApp):
         """
         if not questions:
             return
-        key = self._get_open_questions_cache_key(topic)
-        self.open_questions_cache[key] = questions
-        self._save_open_questions_cache()
+        self.open_questions_cache.put(self._get_open_questions_cache_key(topic), questions)
 
-    def log(self, message):
+    def on_stop(self):
+        """Сохраняет отложенные изменения кеша при закрытии приложения"""
+        cache = getattr(self, 'open_questions_cache', None)
+        if cache is not None:
+            cache.close()
+
+    def log(self, message, level=applog.INFO):
         """
-        Логирует сообщение в консоль и UI.
+        Логирует сообщение в консоль, файл лога и UI.
+        
+        Запись в консоль и файл выполняет фоновый поток applog.
+        Метка на экране настроек перерисовывается не чаще раза в
+        LOG_UI_INTERVAL секунд, сколько бы сообщений ни пришло.
+        Можно вызывать из любого потока.
         
         Args:
             message: Текст сообщения для логирования
+            level: Уровень (applog.DEBUG/INFO/WARNING/ERROR)
         """
-        print(message)
+        applog.write('MAIN', message, level)
+        if not applog.enabled(level):
+            return
+        if not hasattr(self, '_ui_log_lines'):
+            self._ui_log_lines = deque(maxlen=100)
+            self._ui_log_scheduled = False
+        self._ui_log_lines.appendleft(str(message))
+        if not self._ui_log_scheduled:
+            self._ui_log_scheduled = True
+            Clock.schedule_once(self._update_log_label, LOG_UI_INTERVAL)
+
+    def _update_log_label(self, dt=None):
+        """Показывает накопленные строки лога на экране настроек"""
+        self._ui_log_scheduled = False
         try:
-            main_screen = self.root.get_screen('main')
-            settings_screen = main_screen.ids.tab_manager.get_screen('settings')
-            log_label = settings_screen.ids.debug_log
+            tab_manager = self.root.get_screen('main').ids.tab_manager
+            # Экран настроек строится при первом открытии - тогда и покажет лог
+            if not tab_manager.is_built('settings'):
+                return
+            settings_screen = tab_manager.get_screen('settings')
             # Сохраняем последние 2000 символов логов
-            log_label.text = f"{message}\n{log_label.text}"[:2000]
+            settings_screen.ids.debug_log.text = '\n'.join(self._ui_log_lines)[:2000]
         except Exception:
             pass
 
@@ -2705,11 +4240,11 @@ class MyApp(MDApp):
         main_screen = self.root.get_screen('main')
         settings_screen = main_screen.ids.tab_manager.get_screen('settings')
         
-        if self.settings_store.exists('api'):
-            # Загружаем API ключ из настроек
-            data = self.settings_store.get('api')
-            key = data.get('api_key', data.get('key', ''))
-            settings_screen.ids.api_key_input.text = key
+        # Загружаем API ключ из настроек
+        settings_screen.ids.api_key_input.text = self.settings_service.stored_api_key
+        settings_screen.ids.deferred_grading_checkbox.active = self.is_grading_deferred()
+        settings_screen.ids.prefetch_checkbox.active = self.settings_service.prefetch_followups
+        settings_screen.ids.debug_log.text = '\n'.join(getattr(self, '_ui_log_lines', ()))[:2000]
     
     def save_settings(self):
         """
@@ -2723,7 +4258,9 @@ class MyApp(MDApp):
             key = settings_screen.ids.api_key_input.text.strip()
             
             # Сохраняем API ключ
-            self.settings_store.put('api', api_key=key)
+            self.settings_service.save(api_key=key,
+                                       deferred_grading=settings_screen.ids.deferred_grading_checkbox.active,
+                                       prefetch_followups=settings_screen.ids.prefetch_checkbox.active)
             settings_screen.ids.status_label.text = "Настройки сохранены!"
             # Очищаем сообщение через 2 секунды
             Clock.schedule_once(lambda dt: setattr(settings_screen.ids.status_label, 'text', ''), 2)
@@ -2736,16 +4273,17 @@ class MyApp(MDApp):
             except:
                 pass
 
+    def is_grading_deferred(self):
+        """True, если развёрнутые ответы оцениваются одним запросом в конце сессии"""
+        return self.settings_service.deferred_grading
+
     def set_difficulty(self, level):
         self.difficulty = level
 
     def start_generation(self):
         try:
             # Check if API key is set
-            api_key = None
-            if self.settings_store.exists('api'):
-                data = self.settings_store.get('api')
-                api_key = data.get('api_key', data.get('key'))
+            api_key = self._get_api_key()
             self._last_api_key = api_key
             
             if not api_key:
@@ -2768,11 +4306,11 @@ class MyApp(MDApp):
             
             # Переходим на экран загрузки и запускаем генерацию в отдельном потоке
             self.root.current = 'loading'
-            threading.Thread(target=self.generate_quiz_thread, args=(topic, self.difficulty), daemon=True).start()
+            self.run_task(self.generate_quiz_thread, topic, self.difficulty, priority=task_scheduler.HIGH)
             
         except Exception as e:
             self.log(f"ERROR in start_generation: {e}")
-            self.log(f"Traceback: {tb_module.format_exc()}")
+            self.log(f"Traceback: {tb_module.format_exc()}", applog.DEBUG)
             self._show_generation_error(f"Ошибка запуска генерации: {str(e)}")
 
     def generate_quiz_thread(self, topic, difficulty):
@@ -2791,10 +4329,7 @@ class MyApp(MDApp):
         
         try:
             # Получаем API ключ из настроек
-            api_key = None
-            if self.settings_store.exists('api'):
-                data = self.settings_store.get('api')
-                api_key = data.get('api_key', data.get('key'))
+            api_key = self._get_api_key()
             
             if not api_key:
                 error_message = "API ключ не найден в настройках"
@@ -2805,8 +4340,20 @@ class MyApp(MDApp):
                 self.log(f"Difficulty: {difficulty}")
                 self.log(f"API key available: Yes (length: {len(api_key)})")
                 
-                # Вызываем LLM для генерации курса
-                result = generate_quiz(topic, difficulty, api_key=api_key)
+                # Вызываем LLM для генерации курса; теория показывается по мере поступления
+                stream = {'text': '', 'scheduled': False, 'topic': topic, 'difficulty': difficulty}
+                self._theory_stream = stream
+
+                def on_theory(text):
+                    stream['text'] = text
+                    if not stream['scheduled']:
+                        stream['scheduled'] = True
+                        Clock.schedule_once(lambda dt: self._render_theory_stream(stream), 0.2)
+
+                def on_question(question):
+                    Clock.schedule_once(lambda dt: self._on_streamed_question(stream, question))
+
+                result = generate_quiz(topic, difficulty, api_key=api_key, on_theory=on_theory, on_question=on_question)
                 
                 if result:
                     if 'error' in result:
@@ -2827,12 +4374,49 @@ class MyApp(MDApp):
         except Exception as e:
             error_message = f"Ошибка при генерации: {str(e)}"
             self.log(f"EXCEPTION in generate_quiz_thread: {e}")
-            self.log(f"Traceback: {tb_module.format_exc()}")
+            self.log(f"Traceback: {tb_module.format_exc()}", applog.DEBUG)
             result = {'error': error_message}
         
         # Возвращаемся в главный поток для обновления UI
         Clock.schedule_once(lambda dt: self.on_generation_complete(result))
 
+    def _render_theory_stream(self, stream):
+        """
+        Показывает теорию, пока курс ещё генерируется.
+
+        При первом фрагменте переключает экран загрузки на экран теории;
+        кнопка перехода к тесту остаётся неактивной до получения вопросов.
+        """
+        stream['scheduled'] = False
+        if getattr(self, '_theory_stream', None) is not stream or not stream['text']:
+            return
+        theory_screen = self.root.get_screen('theory')
+        if self.root.current == 'loading':
+            theory_screen.meta_title = f"Тема: {stream['topic']}"
+            theory_screen.meta_sub = f"Сложность: {stream['difficulty']}"
+            theory_screen.questions_ready = False
+            self.root.current = 'theory'
+        elif self.root.current != 'theory':
+            return
+        theory_screen.theory_content = stream['text']
+
+    def _on_streamed_question(self, stream, question):
+        """
+        Передаёт в QuizScreen вопрос, полученный до завершения генерации.
+
+        После первого вопроса тест можно начинать; остальные вопросы
+        добавляются по мере поступления.
+        """
+        if getattr(self, '_theory_stream', None) is not stream:
+            return
+        quiz_screen = self.root.get_screen('quiz')
+        if not stream.get('questions_started'):
+            stream['questions_started'] = True
+            quiz_screen.questions = []
+            quiz_screen.questions_complete = False
+            self.root.get_screen('theory').questions_ready = True
+        quiz_screen.add_streamed_question(question)
+
     def on_generation_complete(self, result):
         """
         Обрабатывает результат генерации теста.
@@ -2843,7 +4427,13 @@ class MyApp(MDApp):
         Args:
             result: Словарь с сгенерированным курсом {questions, theory, meta}
         """
+        # Поток теории завершён - запоздавшие фрагменты больше не показываем
+        self._theory_stream = None
         try:
+            # Тест мог начаться по первым вопросам из потока
+            quiz_screen = self.root.get_screen('quiz')
+            streamed_quiz = self.root.current == 'quiz' and not quiz_screen.questions_complete
+
             # Проверяем наличие результата
             if not result:
                 self.log("ERROR: No result from generation")
@@ -2854,6 +4444,10 @@ class MyApp(MDApp):
             if 'error' in result:
                 error_msg = result.get('error', 'Неизвестная ошибка')
                 self.log(f"Generation error: {error_msg}")
+                if streamed_quiz:
+                    # Доводим тест до конца с уже полученными вопросами
+                    quiz_screen.finish_questions(quiz_screen.questions)
+                    return
                 self._show_generation_error(f"Ошибка генерации: {error_msg}")
                 return
             
@@ -2869,14 +4463,14 @@ class MyApp(MDApp):
             # Сохраняем сгенерированный курс в хранилище
             try:
                 self.storage.save(result)
+                self._on_saved_course_changed(result.get('meta', {}))
                 self.log("Course saved to storage")
             except Exception as e:
                 self.log(f"WARNING: Failed to save course: {e}")
                 # Continue anyway - saving is not critical
             
             # Загружаем вопросы в QuizScreen
-            quiz_screen = self.root.get_screen('quiz')
-            quiz_screen.questions = result['questions']
+            quiz_screen.finish_questions(result['questions'])
             
             # Сохраняем метаданные курса
             meta = result.get('meta', {})
@@ -2895,9 +4489,14 @@ class MyApp(MDApp):
             # Если есть теория, показываем её перед тестом
             if 'theory' in result and result['theory']:
                 theory_screen = self.root.get_screen('theory')
+                theory_screen.questions_ready = True
                 theory_screen.theory_content = result['theory']
                 theory_screen.meta_title = f"Тема: {topic}" if topic else ''
                 theory_screen.meta_sub = f"Сложность: {difficulty}" if difficulty else ''
+                if streamed_quiz:
+                    # Пользователь уже проходит тест - не уводим его с экрана
+                    self.log("Generation finished while the quiz is in progress")
+                    return
                 self.root.current = 'theory'
                 self.log("Switched to theory screen")
             else:
@@ -2907,7 +4506,7 @@ class MyApp(MDApp):
                 
         except Exception as e:
             self.log(f"EXCEPTION in on_generation_complete: {e}")
-            self.log(f"Traceback: {tb_module.format_exc()}")
+            self.log(f"Traceback: {tb_module.format_exc()}", applog.DEBUG)
             self._show_generation_error(f"Внутренняя ошибка: {str(e)}")
 
     def prepare_followup_topics(self):
@@ -2917,15 +4516,18 @@ class MyApp(MDApp):
         final_screen.set_followup_topics([], loading=True)
         prev_material = self.last_material or ''
 
-        def worker():
-            topics = generate_next_topics(prev_material, n=5, api_key=self._last_api_key, memory_file=self.topic_memory_file)
+        def on_topics(topics):
             if not topics:
                 topics = get_course_topics(self.topic_memory_file)
             if topics:
                 topics = topics[:5]
-            Clock.schedule_once(lambda dt: final_screen.set_followup_topics(topics, loading=False))
+            final_screen.set_followup_topics(topics, loading=False)
+            if topics and self.settings_service.prefetch_followups:
+                self.prefetch_followup_courses(topics[:FOLLOWUP_PREFETCH_TOPICS])
 
-        threading.Thread(target=worker, daemon=True).start()
+        self.submit_request(
+            agenerate_next_topics(prev_material, n=5, api_key=self._last_api_key, memory_file=self.topic_memory_file),
+            on_topics, screen='final')
 
     def show_combined_results(self, open_score, open_max, open_percent, open_errors):
         """
@@ -3045,7 +4647,8 @@ class MyApp(MDApp):
                 history = meta.setdefault('history', [])
                 history.insert(0, entry)
                 meta.setdefault('notes', {})['quick_hint'] = note_text
-            self.storage.update_entry(topic, difficulty, updater)
+            if self.storage.update_entry(topic, difficulty, updater) is not None:
+                self._on_saved_course_changed({'topic': topic, 'difficulty': difficulty})
 
         self.adjust_difficulty(total_percent)
         self.prepare_followup_topics()
@@ -3077,7 +4680,8 @@ class MyApp(MDApp):
                 history = meta.setdefault('history', [])
                 history.insert(0, entry)
                 meta.setdefault('notes', {})['quick_hint'] = note_text
-            self.storage.update_entry(topic, difficulty, updater)
+            if self.storage.update_entry(topic, difficulty, updater) is not None:
+                self._on_saved_course_changed({'topic': topic, 'difficulty': difficulty})
 
         self.adjust_difficulty(percent)
         self.prepare_followup_topics()
@@ -3114,9 +4718,12 @@ class MyApp(MDApp):
         """
         Предзагружает открытые вопросы во время прохождения MC теста.
         
-        Запускается в отдельном потоке сразу при входе на экран MC теста.
+        Запускается фоновой задачей сразу при входе на экран MC теста.
         Сначала проверяет кеш, затем генерирует новые вопросы если нужно.
         Значительно ускоряет переход к развёрнутым ответам.
+        
+        Returns:
+            list: Вопросы (пустой список при ошибке); их принимает on_open_questions_preloaded
         """
         topic = ''
         if self._last_saved_meta:
@@ -3125,10 +4732,7 @@ class MyApp(MDApp):
             topic = 'Общие знания'
         
         # Получаем API ключ для генерации
-        api_key = None
-        if self.settings_store.exists('api'):
-            data = self.settings_store.get('api')
-            api_key = data.get('api_key', data.get('key'))
+        api_key = self._get_api_key()
         
         self.log(f"Предзагрузка открытых вопросов по теме: {topic}...")
         
@@ -3136,48 +4740,78 @@ class MyApp(MDApp):
         cached = self.get_cached_open_questions(topic)
         if cached:
             # Вопросы найдены в кеше - используем их
-            self.preloaded_open_questions = cached
             self.log("Открытые вопросы загружены из кеша")
-            return
+            return cached
         
         # Кеша нет - генерируем новые вопросы
         try:
             questions = generate_open_questions(topic, n=3, difficulty=self.difficulty, api_key=api_key)
-            self.preloaded_open_questions = questions
             # Сохраняем в кеш для будущих использований
             self.cache_open_questions(topic, questions)
             self.log(f"Открытые вопросы предзагружены успешно")
+            return questions
         except Exception as e:
             self.log(f"Ошибка предзагрузки открытых вопросов: {e}")
-            self.preloaded_open_questions = []
+            return []
 
-    def transition_to_open_questions(self):
+    def on_open_questions_preloaded(self, questions):
         """
-        Переход к открытым вопросам с проверкой готовности.
+        Принимает предзагруженные вопросы в UI-потоке.
         
-        Проверяет, загрузились ли вопросы в фоне. Если да - сразу показывает их,
-        если нет - показывает экран загрузки и ждёт готовности.
+        Если пользователь уже ждёт на экране загрузки - сразу показывает
+        вопросы; если предзагрузка ничего не дала - запускает обычную генерацию.
         """
-        if hasattr(self, 'preloaded_open_questions'):
-            # Вопросы уже предзагружены - сразу показываем
-            self.on_open_questions_generated(self.preloaded_open_questions)
+        self._preload_task = None
+        if questions:
+            self.preloaded_open_questions = questions
+        if not self._cancel_preload_wait():
+            return
+        if questions:
+            self.on_open_questions_generated(questions)
         else:
-            # Показываем экран загрузки и ждём завершения предзагрузки
-            self.root.current = 'loading'
-            Clock.schedule_once(lambda dt: self.check_preload_ready(), 0.5)
-    
-    def check_preload_ready(self):
+            self.log("Предзагрузка открытых вопросов не удалась, генерируем заново")
+            self.start_open_questions()
+
+    def _cancel_preload_wait(self):
+        """Снимает ожидание предзагрузки; True, если пользователь её ждал"""
+        event = getattr(self, '_preload_timeout_event', None)
+        if event is None:
+            return False
+        event.cancel()
+        self._preload_timeout_event = None
+        return True
+
+    def transition_to_open_questions(self):
         """
-        Периодически проверяет готовность предзагруженных вопросов.
+        Переход к открытым вопросам с проверкой готовности.
         
-        Вызывается каждые 0.5 секунд до тех пор, пока вопросы не будут готовы.
+        Если вопросы уже предзагружены - сразу показывает их. Если
+        предзагрузка ещё идёт - показывает экран загрузки, и вопросы
+        появятся, как только задача завершится (on_open_questions_preloaded).
+        Если предзагрузки нет или она не уложилась в
+        OPEN_QUESTIONS_PRELOAD_TIMEOUT - генерирует вопросы заново.
         """
         if hasattr(self, 'preloaded_open_questions'):
-            # Вопросы готовы - показываем экран с ними
+            # Вопросы уже предзагружены - сразу показываем
             self.on_open_questions_generated(self.preloaded_open_questions)
-        else:
-            # Продолжаем ждать
-            Clock.schedule_once(lambda dt: self.check_preload_ready(), 0.5)
+            return
+        task = getattr(self, '_preload_task', None)
+        if task is None or task.token.cancelled or task.future.cancelled():
+            self.start_open_questions()
+            return
+        # Показываем экран загрузки и ждём завершения предзагрузки
+        self.root.current = 'loading'
+        self._cancel_preload_wait()
+        self._preload_timeout_event = Clock.schedule_once(self._on_preload_timeout, OPEN_QUESTIONS_PRELOAD_TIMEOUT)
+
+    def _on_preload_timeout(self, dt):
+        """Предзагрузка зависла - отменяем её и генерируем вопросы заново"""
+        self._preload_timeout_event = None
+        self.log(f"Предзагрузка открытых вопросов не завершилась за {OPEN_QUESTIONS_PRELOAD_TIMEOUT}s", applog.WARNING)
+        if self._preload_task is not None:
+            self._preload_task.cancel()
+            self._preload_task = None
+        self.start_open_questions()
 
     def start_open_questions(self):
         """
@@ -3194,14 +4828,11 @@ class MyApp(MDApp):
         if not topic:
             topic = 'Общие знания'
         
-        threading.Thread(target=self.generate_open_questions_thread, args=(topic,)).start()
+        self.run_task(self.generate_open_questions_thread, topic, priority=task_scheduler.HIGH)
 
     def generate_open_questions_thread(self, topic):
         """Генерируем открытые вопросы в отдельном потоке"""
-        api_key = None
-        if self.settings_store.exists('api'):
-            data = self.settings_store.get('api')
-            api_key = data.get('api_key', data.get('key'))
+        api_key = self._get_api_key()
         
         self.log(f"Генерация открытых вопросов по теме: {topic}...")
         cached = self.get_cached_open_questions(topic)
@@ -3263,6 +4894,19 @@ class MyApp(MDApp):
             answer = screen.ids.answer_input.text.strip()
             if not answer:
                 return
+
+            if self.is_grading_deferred():
+                # Оценим все ответы одним запросом в finish_open_session
+                self.open_answers_history.append({
+                    'question': self.open_questions[self.current_open_idx],
+                    'answer': answer,
+                    'evaluation': None
+                })
+                screen.ids.answer_input.readonly = True
+                screen.ids.skip_button.disabled = True
+                screen.ids.feedback_label.text = "[color=666666]Ответ сохранён. Оценка будет в работе над ошибками[/color]"
+                screen.ids.action_button.text = 'ДАЛЕЕ →'
+                return
             
             # Блокируем интерфейс во время оценки
             screen.ids.answer_input.readonly = True
@@ -3274,36 +4918,117 @@ class MyApp(MDApp):
             q = self.open_questions[self.current_open_idx]
             notes = q.get('notes', '')
             
-            # Запускаем оценку в отдельном потоке
-            threading.Thread(target=self.evaluate_answer_thread, args=(q['question'], answer, notes)).start()
+            # Запускаем оценку в фоновом event loop (отменяется при уходе с экрана)
+            self.submit_request(
+                aevaluate_answer(q['question'], answer, notes, api_key=self._get_api_key()),
+                lambda result: self.on_answer_evaluated(result, answer), screen='open_answer')
             
         elif 'ДАЛЕЕ' in btn_text:
             # Режим перехода к следующему вопросу
             self.next_open_question()
 
-    def evaluate_answer_thread(self, question, answer, notes):
+    def _get_api_key(self):
+        """API ключ: из настроек, иначе из OPENROUTER_API_KEY (None, если не задан)"""
+        return self.settings_service.api_key
+
+    def submit_request(self, coro, on_done, screen=None):
         """
-        Оценивает развёрнутый ответ через LLM в отдельном потоке.
-        
-        Не блокирует UI во время оценки, которая может занять несколько секунд.
-        
+        Выполняет корутину llm в общем фоновом event loop.
+
+        Вместо отдельного потока на каждый запрос - одна корутина.
+        on_done(result) вызывается в UI-потоке; при ошибке result = None.
+        Запрос, привязанный к экрану, отменяется при уходе с него
+        (см. cancel_screen_requests), и тогда on_done не вызывается.
+
         Args:
-            question: Текст вопроса
-            answer: Ответ пользователя
-            notes: Дополнительные заметки для оценки
-        """
-        api_key = None
-        if self.settings_store.exists('api'):
-            data = self.settings_store.get('api')
-            api_key = data.get('api_key', data.get('key'))
-            
-        try:
-            # Вызываем LLM для оценки ответа
-            result = evaluate_answer(question, answer, notes, api_key=api_key)
-            Clock.schedule_once(lambda dt: self.on_answer_evaluated(result, answer))
-        except Exception as e:
-            self.log(f"Ошибка оценки ответа: {e}")
-            Clock.schedule_once(lambda dt: self.on_answer_evaluated(None, answer))
+            coro: Корутина, например aevaluate_answer(...)
+            on_done: Обработчик результата
+            screen: Имя экрана, к которому относится запрос
+
+        Returns:
+            concurrent.futures.Future запроса
+        """
+        def done(future):
+            if screen:
+                with self._screen_requests_lock:
+                    self._screen_requests.get(screen, set()).discard(future)
+            if future.cancelled():
+                return
+            try:
+                result = future.result()
+            except Exception as e:
+                self.log(f"Ошибка фонового запроса: {e}")
+                result = None
+            Clock.schedule_once(lambda dt: on_done(result))
+
+        future = submit_async(coro)
+        if screen:
+            with self._screen_requests_lock:
+                self._screen_requests.setdefault(screen, set()).add(future)
+        future.add_done_callback(done)
+        return future
+
+    def run_task(self, fn, *args, priority=task_scheduler.NORMAL, screen=None, on_done=None, name=None):
+        """
+        Выполняет блокирующую функцию в общем пуле фоновых потоков.
+
+        Задачи с большим приоритетом (task_scheduler.HIGH - то, чего ждёт
+        пользователь) берутся из очереди раньше фоновых (LOW - предзагрузка).
+        on_done(result) вызывается в UI-потоке; при ошибке result = None.
+        Задача, привязанная к экрану, отменяется cancel_screen_requests:
+        если она ещё в очереди - не запускается, если уже выполняется -
+        её результат не доставляется.
+
+        Args:
+            fn: Функция, выполняемая в фоновом потоке
+            *args: Аргументы fn
+            priority: task_scheduler.HIGH, NORMAL или LOW
+            screen: Имя экрана, к которому относится задача
+            on_done: Обработчик результата (необязательно)
+            name: Имя задачи для статистики
+
+        Returns:
+            task_scheduler.Task (token - флаг отмены для fn)
+        """
+        task = self.scheduler.submit(fn, *args, priority=priority, name=name)
+
+        def done(future):
+            if screen:
+                with self._screen_requests_lock:
+                    self._screen_requests.get(screen, set()).discard(task)
+            if task.started is not None:
+                self.log(f"Задача {task.name}: ожидание {task.started - task.submitted:.2f}s, "
+                         f"выполнение {task.finished - task.started:.2f}s", applog.DEBUG)
+            if future.cancelled() or task.token.cancelled:
+                return
+            try:
+                result = future.result()
+            except Exception as e:
+                self.log(f"Ошибка фоновой задачи {task.name}: {e}")
+                self.log(f"Traceback: {''.join(tb_module.format_exception(e))}", applog.DEBUG)
+                result = None
+            if on_done is not None:
+                # Токен проверяется ещё раз: экран могли покинуть, пока колбэк ждал кадра
+                Clock.schedule_once(lambda dt: None if task.token.cancelled else on_done(result))
+
+        if screen:
+            with self._screen_requests_lock:
+                self._screen_requests.setdefault(screen, set()).add(task)
+        task.future.add_done_callback(done)
+        return task
+
+    def get_task_stats(self):
+        """Глубина очереди и задержки фоновых задач (см. TaskScheduler.get_stats)"""
+        return self.scheduler.get_stats()
+
+    def cancel_screen_requests(self, screen):
+        """Отменяет незавершённые запросы и фоновые задачи, запущенные для экрана"""
+        with self._screen_requests_lock:
+            futures = self._screen_requests.pop(screen, set())
+        for future in futures:
+            future.cancel()
+        if futures:
+            self.log(f"Отменено запросов для экрана {screen}: {len(futures)}")
 
     def on_answer_evaluated(self, result, answer_text):
         """
@@ -3360,6 +5085,26 @@ class MyApp(MDApp):
 
     def finish_open_session(self):
         """Завершает сессию открытых вопросов и показывает комбинированный отчёт"""
+        # Отложенные ответы оцениваем одним пакетным запросом
+        pending = [item for item in self.open_answers_history if item['evaluation'] is None]
+        if pending:
+            self.root.current = 'loading'
+            items = [(item['question'].get('question', ''), item['answer'], item['question'].get('notes', ''))
+                     for item in pending]
+
+            def on_evaluated(evaluations):
+                evaluations = evaluations or []
+                for i, item in enumerate(pending):
+                    item['evaluation'] = evaluations[i] if i < len(evaluations) else {
+                        'score': 0, 'max_score': 10,
+                        'commentary': 'Ошибка при оценке ответа.', 'suggested_improvements': ''
+                    }
+                self.finish_open_session()
+
+            self.log(f"Пакетная оценка {len(items)} ответов...")
+            self.submit_request(aevaluate_answers_batch(items, api_key=self._get_api_key()), on_evaluated)
+            return
+
         # Подсчитываем баллы за открытые вопросы
         open_score = sum([item['evaluation'].get('score', 0) for item in self.open_answers_history])
         open_max = len(self.open_answers_history) * 10
@@ -3385,6 +5130,9 @@ class MyApp(MDApp):
         """
         Начинает новый курс по рекомендованной теме.
         
+        Если курс по этой теме уже сгенерирован заранее - открывает его сразу,
+        если ещё генерируется - дожидается его вместо нового запроса.
+        
         Args:
             topic: Название темы для изучения
         """
@@ -3392,8 +5140,143 @@ class MyApp(MDApp):
         main_screen.ids.tab_manager.current = 'search'
         search_screen = main_screen.ids.tab_manager.get_screen('search')
         search_screen.ids.topic_input.text = topic
+        entry = self._take_prefetched_course(topic)
+        if entry is not None and entry['result'] is not None:
+            self.on_generation_complete(entry['result'])
+            return
         self.root.current = 'loading'
-        threading.Thread(target=self.generate_quiz_thread, args=(topic, self.difficulty)).start()
+        if entry is not None:
+            # Генерация уже идёт - результат откроет on_prefetch_done
+            entry['waiting'] = True
+            self._prefetched[self._prefetch_key(topic)] = entry
+            return
+        self.run_task(self.generate_quiz_thread, topic, self.difficulty, priority=task_scheduler.HIGH)
+
+    def _prefetch_key(self, topic):
+        return CourseStorage._key(topic, self.difficulty)
+
+    @staticmethod
+    def _estimate_tokens(course):
+        """Оценка числа токенов ответа модели по длине теории и вопросов"""
+        text = (course.get('theory') or '') + json.dumps(course.get('questions') or [], ensure_ascii=False)
+        return len(text) // CHARS_PER_TOKEN
+
+    def prefetch_followup_courses(self, topics):
+        """
+        Заранее генерирует курсы по первым рекомендованным темам.
+        
+        Запросы идут корутинами в общем event loop (submit_request) и не
+        занимают потоки BACKGROUND_WORKERS; при отмене раунда запрос
+        действительно прерывается. На каждый запущенный курс сразу
+        резервируется оценка токенов (после ответа - уточняется), и
+        генерация останавливается, когда потраченное за сеанс достигает
+        FOLLOWUP_PREFETCH_TOKEN_BUDGET. Курсы прошлого раунда, которые так
+        и не открыли (в том числе прерванные после отправки запроса),
+        считаются потраченными зря; резерв возвращается, только если запрос
+        не успел уйти.
+        
+        Args:
+            topics: Темы в порядке рекомендации
+        """
+        self._discard_prefetched()
+        api_key = self._get_api_key()
+        if not api_key:
+            return
+        stats = self._prefetch_stats
+        for topic in topics:
+            if stats['tokens_spent'] >= FOLLOWUP_PREFETCH_TOKEN_BUDGET:
+                self.log("Бюджет упреждающей генерации курсов исчерпан")
+                break
+            key = self._prefetch_key(topic)
+            if key in self._prefetched:
+                continue
+            entry = {'topic': topic, 'difficulty': self.difficulty, 'result': None, 'waiting': False,
+                     'sent': False, 'tokens': self._prefetch_reserve}
+            stats['tokens_spent'] += entry['tokens']
+            entry['future'] = self.submit_request(self._prefetch_course(entry, api_key),
+                                                  lambda result, e=entry: self.on_prefetch_done(e, result),
+                                                  screen='prefetch')
+            self._prefetched[key] = entry
+            stats['started'] += 1
+            self.log(f"Упреждающая генерация курса: {topic}", applog.DEBUG)
+
+    @staticmethod
+    async def _prefetch_course(entry, api_key):
+        """Корутина упреждающей генерации; отмечает, что запрос ушёл в сеть"""
+        entry['sent'] = True
+        return await agenerate_quiz(entry['topic'], entry['difficulty'], api_key)
+
+    def on_prefetch_done(self, entry, result):
+        """Принимает заранее сгенерированный курс в UI-потоке"""
+        key = self._prefetch_key(entry['topic'])
+        if not entry['waiting'] and self._prefetched.get(key) is not entry:
+            # Раунд уже списан (_discard_prefetched), ответ пришёл к отмене
+            return
+        ok = bool(result) and 'error' not in result and bool(result.get('questions'))
+        if ok:
+            # Резерв заменяется оценкой по фактическому размеру курса
+            tokens = self._estimate_tokens(result)
+            self._prefetch_stats['tokens_spent'] += tokens - entry['tokens']
+            entry['tokens'] = self._prefetch_reserve = tokens
+        else:
+            # Ответ (или его часть) мог быть оплачен - резерв остаётся потраченным
+            self._prefetch_stats['failed'] += 1
+        if entry['waiting']:
+            # Пользователь уже выбрал эту тему и ждёт на экране загрузки
+            self._prefetched.pop(key, None)
+            if ok:
+                self.on_generation_complete(result)
+            else:
+                self.run_task(self.generate_quiz_thread, entry['topic'], entry['difficulty'],
+                              priority=task_scheduler.HIGH)
+            return
+        if ok:
+            entry['result'] = result
+        else:
+            self._prefetched.pop(key, None)
+
+    def _take_prefetched_course(self, topic):
+        """Забирает курс выбранной темы; остальные курсы раунда - потрачены зря"""
+        entry = self._prefetched.pop(self._prefetch_key(topic), None)
+        if entry is not None:
+            # Выбранный курс не отменяем вместе с остальными
+            with self._screen_requests_lock:
+                self._screen_requests.get('prefetch', set()).discard(entry['future'])
+        self._discard_prefetched()
+        stats = self._prefetch_stats
+        if entry is not None:
+            stats['hits'] += 1
+        elif stats['started']:
+            stats['misses'] += 1
+        if stats['started']:
+            self.log(f"Упреждающая генерация: попаданий {stats['hits']}, промахов {stats['misses']}, "
+                     f"впустую {stats['wasted']} курсов (~{stats['tokens_wasted']} токенов)")
+        return entry
+
+    def _discard_prefetched(self):
+        """Отменяет и списывает курсы текущего раунда упреждающей генерации"""
+        self.cancel_screen_requests('prefetch')
+        stats = self._prefetch_stats
+        for key, entry in list(self._prefetched.items()):
+            if entry['waiting']:
+                # Этот курс уже выбран и ждёт ответа на экране загрузки
+                continue
+            del self._prefetched[key]
+            if entry['result'] is not None or entry['sent']:
+                # Готовый курс не открыли или прерванный запрос уже ушёл - токены потрачены
+                stats['wasted'] += 1
+                stats['tokens_wasted'] += entry['tokens']
+            else:
+                # Корутина не успела запуститься - запроса не было
+                stats['tokens_spent'] -= entry['tokens']
+
+    def get_prefetch_stats(self):
+        """Счётчики упреждающей генерации и доля попаданий"""
+        stats = dict(self._prefetch_stats)
+        chosen = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / chosen if chosen else 0.0
+        stats['pending'] = len(self._prefetched)
+        return stats
 
     def delete_current_course(self):
         """
@@ -3409,7 +5292,7 @@ class MyApp(MDApp):
         if removed:
             self.log(f"Курс '{topic}' ({difficulty}) удалён из истории.")
             self._last_saved_meta = None
-            self.load_saved_courses_ui()
+            self._on_saved_course_removed(topic, difficulty)
 
     def delete_saved_course(self, topic, difficulty):
         """
@@ -3429,31 +5312,77 @@ class MyApp(MDApp):
         if self._last_saved_meta and self._last_saved_meta.get('topic') == topic and \
                 self._last_saved_meta.get('difficulty') == difficulty:
             self._last_saved_meta = None
-        self.load_saved_courses_ui()
+        self._on_saved_course_removed(topic, difficulty)
 
-    def load_saved_courses_ui(self):
+    def _saved_courses_list(self):
         main_screen = self.root.get_screen('main')
         saved_screen = main_screen.ids.tab_manager.get_screen('saved')
-        grid = saved_screen.ids.courses_grid
-        grid.clear_widgets()
+        return saved_screen.ids.courses_list
+
+    def load_saved_courses_ui(self, force=False):
+        """
+        Заполняет список сохранённых курсов.
+        
+        RecycleView получает только записи {topic, difficulty} и создаёт
+        карточки лишь для видимых строк. Список читается из хранилища один
+        раз (или при force=True), дальнейшие сохранения и удаления меняют
+        его точечно через _on_saved_course_changed/_on_saved_course_removed.
         
-        courses = self.storage.get_all()
-        if not courses:
-            lbl = Label(text="Нет сохраненных курсов", color=(0.5, 0.5, 0.5, 1), size_hint_y=None, height=dp(40))
-            grid.add_widget(lbl)
+        Args:
+            force: Перечитать список из хранилища, даже если он уже загружен
+        """
+        if self._saved_courses_loaded and not force:
+            return
+        # Только метаданные: теория и вопросы читаются при открытии курса
+        self._saved_courses_list().data = [self._saved_course_record(meta) for meta in self.storage.list_meta()]
+        self._saved_courses_loaded = True
+
+    @staticmethod
+    def _saved_course_record(meta):
+        """Запись RecycleView для карточки курса"""
+        return {'topic': meta.get('topic') or '', 'difficulty': meta.get('difficulty') or ''}
+
+    def _find_saved_course_record(self, data, topic, difficulty):
+        key = CourseStorage._key(topic, difficulty)
+        for i, record in enumerate(data):
+            if CourseStorage._key(record['topic'], record['difficulty']) == key:
+                return i
+        return -1
+
+    def _on_saved_course_changed(self, meta):
+        """Переносит (или добавляет) курс в начало списка сохранённых"""
+        if not self._saved_courses_loaded:
             return
+        data = self._saved_courses_list().data
+        i = self._find_saved_course_record(data, meta.get('topic'), meta.get('difficulty'))
+        if i == 0:
+            return
+        if i > 0:
+            data.pop(i)
+        data.insert(0, self._saved_course_record(meta))
 
-        for course in courses:
-            meta = course.get('meta', {})
-            topic = meta.get('topic', 'Без темы')
-            diff = meta.get('difficulty', '')
-            
-            btn = CourseCard(topic=topic, difficulty=diff)
-            # Use a closure to capture the specific course
-            btn.bind(on_release=lambda x, c=course: self.start_saved_course(c))
-            grid.add_widget(btn)
+    def _on_saved_course_removed(self, topic, difficulty):
+        """Убирает карточку удалённого курса из списка"""
+        if not self._saved_courses_loaded:
+            return
+        data = self._saved_courses_list().data
+        i = self._find_saved_course_record(data, topic, difficulty)
+        if i >= 0:
+            data.pop(i)
 
-    def start_saved_course(self, course):
+    def start_saved_course(self, topic, difficulty):
+        """
+        Открывает сохранённый курс, загружая его целиком из хранилища.
+        
+        Args:
+            topic: Название темы курса
+            difficulty: Уровень сложности
+        """
+        course = self.storage.find(topic, difficulty)
+        if course is None:
+            self.log(f"Курс '{topic}' ({difficulty}) не найден в хранилище", applog.WARNING)
+            self._on_saved_course_removed(topic, difficulty)
+            return
         self.on_generation_complete(course)
 
     def start_quiz_from_theory(self):
@@ -3472,6 +5401,10 @@ class MyApp(MDApp):
         """
         quiz = self.root.get_screen('quiz')
         quiz.reset_quiz()
+        # Предзагрузка для прошлого теста не должна подменить вопросы нового
+        self.cancel_screen_requests('quiz')
+        self._preload_task = None
+        self._cancel_preload_wait()
         # Сбрасываем флаги предзагрузки для нового теста
         self.open_questions_preloading = False
         if hasattr(self, 'preloaded_open_questions'):
@@ -3562,6 +5495,9 @@ class MyApp(MDApp):
             self.root.current = 'main'
 
 
+startup_profile.mark('main_module')
+
+
 # ============================================================================
 # ТОЧКА ВХОДА ПРИЛОЖЕНИЯ
 # ============================================================================
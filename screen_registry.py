@@ -0,0 +1,144 @@
+"""Screens built on first use and released when idle.
+
+ScreenRegistry is a ScreenManager whose lazy_screens ({name: Factory
+class name}) are not built up front: a screen is created on the first
+get_screen(name) or current = name. Screens listed in releasable keep no
+state of their own, so release_idle() may remove those that are not
+shown and have not been for a while; they are rebuilt on the next visit.
+snapshot() gives the widget count and process memory for comparing the
+app at startup with the app after navigation.
+"""
+import gc
+import os
+import time
+
+from kivy.clock import Clock
+from kivy.factory import Factory
+from kivy.properties import DictProperty, ListProperty
+from kivy.uix.screenmanager import ScreenManager
+
+
+def rss_bytes():
+    """Resident memory of the process in bytes, or None if unknown."""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+        # Peak, not current memory; ru_maxrss is in bytes on macOS, in KiB elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == 'Darwin' else peak * 1024
+    except (ImportError, AttributeError, OSError):
+        return None
+
+
+def _walk(root):
+    """Widgets of the tree, including built screens that are not shown."""
+    stack = [root]
+    while stack:
+        widget = stack.pop()
+        yield widget
+        stack.extend(widget.children)
+        if isinstance(widget, ScreenManager):
+            stack.extend(s for s in widget.screens if s not in widget.children)
+
+
+def snapshot(root):
+    """Widget count, resident memory (MB) and built/not built screens of every ScreenRegistry."""
+    widgets = 0
+    built, not_built = [], []
+    for widget in _walk(root):
+        widgets += 1
+        if isinstance(widget, ScreenRegistry):
+            built.extend(s.name for s in widget.screens)
+            not_built.extend(name for name in widget.lazy_screens if not ScreenManager.has_screen(widget, name))
+    rss = rss_bytes()
+    return {
+        'widgets': widgets,
+        'rss_mb': round(rss / 2 ** 20, 1) if rss is not None else None,
+        'built': sorted(built),
+        'not_built': sorted(not_built),
+    }
+
+
+class ScreenRegistry(ScreenManager):
+    """
+    ScreenManager that creates lazy_screens on demand.
+
+    Attributes:
+        lazy_screens: {screen name: Factory class name} built on first use
+        releasable: Names of lazy screens release_idle() may remove
+        stats: Counters of created/released screens and build time in seconds
+    """
+    lazy_screens = DictProperty({})
+    releasable = ListProperty([])
+
+    def __init__(self, **kwargs):
+        self.stats = {'created': 0, 'released': 0, 'build_time': 0.0}
+        self._last_shown = {}  # name -> monotonic time the screen was last current
+        super().__init__(**kwargs)
+
+    def get_screen(self, name):
+        if name in self.lazy_screens and not super().has_screen(name):
+            started = time.perf_counter()
+            self.add_widget(Factory.get(self.lazy_screens[name])(name=name))
+            self.stats['created'] += 1
+            self.stats['build_time'] += time.perf_counter() - started
+            self._last_shown[name] = time.monotonic()
+        return super().get_screen(name)
+
+    def has_screen(self, name):
+        return name in self.lazy_screens or super().has_screen(name)
+
+    def is_built(self, name):
+        """True if the screen exists now (has_screen() is also True for lazy screens not built yet)."""
+        return super().has_screen(name)
+
+    def on_current(self, instance, value):
+        now = time.monotonic()
+        if self.current_screen is not None:
+            self._last_shown[self.current_screen.name] = now
+        super().on_current(instance, value)
+        if value:
+            self._last_shown[value] = now
+
+    def release(self, name):
+        """Removes a built lazy screen that is not shown; returns True if removed."""
+        if name not in self.lazy_screens or name == self.current or not super().has_screen(name):
+            return False
+        screen = super().get_screen(name)
+        transition = self.transition
+        if screen in (transition.screen_in, transition.screen_out):
+            if transition.is_active or self.current_screen is None:
+                return False
+            # A finished transition still references the screens it moved (None is not allowed)
+            if transition.screen_in is screen:
+                transition.screen_in = self.current_screen
+            if transition.screen_out is screen:
+                transition.screen_out = self.current_screen
+        self.remove_widget(screen)
+        self._last_shown.pop(name, None)
+        self.stats['released'] += 1
+        return True
+
+    def release_idle(self, min_idle=0.0, keep=()):
+        """
+        Releases releasable screens not shown for min_idle seconds.
+
+        Args:
+            min_idle: Seconds since the screen was last current
+            keep: Names that must stay (e.g. screens with pending work)
+
+        Returns:
+            list: Names of released screens
+        """
+        now = time.monotonic()
+        released = [name for name in self.releasable
+                    if name not in keep and now - self._last_shown.get(name, 0) >= min_idle and self.release(name)]
+        if released:
+            # Widgets reference each other through properties and bindings, and
+            # pending layout triggers hold them until the next frame
+            Clock.schedule_once(lambda dt: gc.collect())
+        return released
@@ -0,0 +1,118 @@
+"""Fill the chat with many messages and scroll back through all of them.
+
+Starts MyApp in this process, opens the chat tab and adds --messages
+messages (random length, BATCH per frame), then scrolls to the top of
+the window until the whole history has been paged in from disk, and back
+to the bottom. Reports the time per added message, the time of a page
+load, frame times while scrolling, memory growth and the texture cache.
+
+Usage: python scripts/bench_chat.py [--messages N]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+
+WORDS = ('лорем ипсум долор сит амет консектетур адиписцинг элит сед до эиусмод '
+         'lorem ipsum dolor sit amet consectetur adipiscing elit').split()
+BATCH = 100
+STEP = 0.05  # Seconds between scroll steps
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    sys.argv = [os.path.join(ROOT, 'main.py')]
+    import main as app_main
+    import screen_registry
+    from kivy.clock import Clock
+
+    app = app_main.MyApp()
+    rng = random.Random(args.seed)
+    state = {'added': 0, 'add_times': [], 'page_times': [], 'frames': [], 'last_frame': None, 'pages': 0}
+
+    def on_frame(dt):
+        now = time.perf_counter()
+        if state['last_frame'] is not None and state.get('scrolling'):
+            state['frames'].append(now - state['last_frame'])
+        state['last_frame'] = now
+
+    def start(dt):
+        tabs = app.root.get_screen('main').ids.tab_manager
+        tabs.current = 'chat'
+        state['chat'] = tabs.get_screen('chat')
+        state['rss'] = screen_registry.rss_bytes()
+        Clock.schedule_interval(on_frame, 0)
+        Clock.schedule_once(fill, 0.5)
+
+    def fill(dt):
+        chat = state['chat']
+        started = time.perf_counter()
+        count = min(BATCH, args.messages - state['added'])
+        for _ in range(count):
+            text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 120)))
+            chat.add_message(text, 'user' if state['added'] % 2 else 'assistant')
+            state['added'] += 1
+        state['add_times'].append((time.perf_counter() - started) / max(count, 1))
+        if state['added'] < args.messages:
+            Clock.schedule_once(fill, 0)
+        else:
+            state['rss_filled'] = screen_registry.rss_bytes()
+            state['scrolling'] = True
+            Clock.schedule_once(scroll_up, 0.3)
+
+    def scroll_up(dt):
+        chat = state['chat']
+        if chat.history.has_older:
+            started = time.perf_counter()
+            chat.ids.chat_list.scroll_y = 1
+            state['page_times'].append(time.perf_counter() - started)
+            state['pages'] += 1
+            Clock.schedule_once(scroll_up, STEP)
+        else:
+            Clock.schedule_once(scroll_down, STEP)
+
+    def scroll_down(dt):
+        chat = state['chat']
+        if chat.history.has_newer:
+            chat.ids.chat_list.scroll_y = 0
+            Clock.schedule_once(scroll_down, STEP)
+        else:
+            state['rss_scrolled'] = screen_registry.rss_bytes()
+            app.stop()
+
+    Clock.schedule_once(start, 0.5)
+    app.run()
+
+    chat = state['chat']
+    mb = lambda value: (value - state['rss']) / 2 ** 20  # noqa: E731
+    print(f"messages: {len(chat.history)}, in memory: {len(chat.history.messages)}, "
+          f"rows: {len(chat.ids.chat_list.data)}")
+    print(f"add: {sum(state['add_times']) / len(state['add_times']) * 1000:.2f} ms/message")
+    if state['page_times']:
+        print(f"page load: {len(state['page_times'])} pages, "
+              f"avg {sum(state['page_times']) / len(state['page_times']) * 1000:.2f} ms, "
+              f"max {max(state['page_times']) * 1000:.2f} ms")
+    print(f"frames while scrolling: median {percentile(state['frames'], 0.5) * 1000:.1f} ms, "
+          f"p95 {percentile(state['frames'], 0.95) * 1000:.1f} ms")
+    print(f"RSS growth: {mb(state['rss_filled']):.1f} MB after filling, "
+          f"{mb(state['rss_scrolled']):.1f} MB after scrolling")
+    cache = app_main.CHAT_TEXTURES
+    print(f"texture cache: {cache.stats}, {cache._bytes / 2 ** 20:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
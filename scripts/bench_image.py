@@ -0,0 +1,99 @@
+"""Compare the image payload of chat_with_image before and after recompression.
+
+Creates a camera-sized photo (--width x --height, JPEG with EXIF, a
+gradient plus noise so it compresses like a real photo), or takes
+--image, and measures for each way of encoding it the data URL size, the
+size of the JSON request body and the time to build both:
+  original      the whole file base64-encoded (the behaviour before)
+  recompressed  encode_image_to_base64 with an empty cache
+  cached        encode_image_to_base64 for the same file again
+
+Usage: python scripts/bench_image.py [--image PATH] [--runs N] [--max-side PX] [--quality Q] [--format JPEG]
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_photo(path, width, height):
+    from PIL import Image
+
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    photo = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    exif = Image.Exif()
+    exif[0x010F] = 'Camera'  # Make
+    exif[0x0112] = 1  # Orientation
+    photo.save(path, format='JPEG', quality=92, exif=exif.tobytes())
+
+
+def original_data_url(path):
+    with open(path, 'rb') as f:
+        return 'data:image/jpeg;base64,' + base64.b64encode(f.read()).decode('utf-8')
+
+
+def measure(encode, runs):
+    """(data URL, request body bytes, median encode ms, median body ms)"""
+    encode_times, body_times = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        data_url = encode()
+        encoded = time.perf_counter()
+        body = json.dumps({'messages': [{'role': 'user', 'content': [
+            {'type': 'image_url', 'image_url': {'url': data_url}}]}]}, ensure_ascii=False).encode('utf-8')
+        encode_times.append(encoded - started)
+        body_times.append(time.perf_counter() - encoded)
+    return data_url, len(body), statistics.median(encode_times) * 1000, statistics.median(body_times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--image', help='photo to encode instead of a generated one')
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-side', type=int)
+    parser.add_argument('--quality', type=int)
+    parser.add_argument('--format')
+    args = parser.parse_args()
+
+    import llm
+
+    path = args.image
+    if not path:
+        fd, path = tempfile.mkstemp(suffix='.jpg')
+        os.close(fd)
+        make_photo(path, args.width, args.height)
+    try:
+        options = {'max_side': args.max_side, 'quality': args.quality, 'image_format': args.format}
+
+        def recompress():
+            llm._image_cache.clear()
+            return llm.encode_image_to_base64(path, **options)
+
+        rows = [
+            ('original', measure(lambda: original_data_url(path), args.runs)),
+            ('recompressed', measure(recompress, args.runs)),
+            ('cached', measure(lambda: llm.encode_image_to_base64(path, **options), args.runs)),
+        ]
+        print(f"{os.path.getsize(path) / 1024:.0f} KB file, median of {args.runs} runs")
+        print(f"  {'':<14}{'data URL':>12}{'request body':>14}{'encode':>11}{'json.dumps':>12}")
+        for name, (data_url, body_bytes, encode_ms, body_ms) in rows:
+            print(f"  {name:<14}{len(data_url) / 1024:>9.0f} KB{body_bytes / 1024:>11.0f} KB"
+                  f"{encode_ms:>8.1f} ms{body_ms:>9.1f} ms")
+        print(f"  cache: {llm.get_image_cache_stats()}")
+    finally:
+        if not args.image:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Compare end-to-end latency of single-call and split generate_quiz() against a local stub server.
+
+The stub imitates a model that needs FIRST_TOKEN_DELAY seconds before it
+starts answering and then produces CHARS_PER_SECOND characters per second,
+so the combined request costs about the sum of the theory and questions
+answers while the split mode costs about the longer of the two.
+
+Usage: python scripts/bench_quiz_split.py [--runs N] [--stream]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIRST_TOKEN_DELAY = 0.3
+CHARS_PER_SECOND = 20000
+CHUNK_SIZE = 200
+
+THEORY = "[b]Раздел[/b]\nТекст теоретического материала для проверки скорости генерации. " * 150
+QUESTIONS = [
+    {"question": f"Вопрос {i + 1}?", "options": ["Вариант A", "Вариант B", "Вариант C", "Вариант D"], "answer": i % 4}
+    for i in range(10)
+]
+
+
+def build_reply(prompt):
+    """Returns the content the stub model answers with for the given prompt."""
+    wants_theory = 'теоретический материал' in prompt
+    wants_questions = 'вопросов' in prompt
+    if wants_theory and wants_questions:
+        return json.dumps({"theory": THEORY, "questions": QUESTIONS}, ensure_ascii=False)
+    if wants_theory:
+        return THEORY
+    return json.dumps({"questions": QUESTIONS}, ensure_ascii=False)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        reply = build_reply(body['messages'][-1]['content'])
+        time.sleep(FIRST_TOKEN_DELAY)
+
+        if body.get('stream'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for start in range(0, len(reply), CHUNK_SIZE):
+                chunk = reply[start:start + CHUNK_SIZE]
+                time.sleep(len(chunk) / CHARS_PER_SECOND)
+                event = {"choices": [{"delta": {"content": chunk}}]}
+                self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n")
+            self._write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            return
+
+        time.sleep(len(reply) / CHARS_PER_SECOND)
+        payload = json.dumps({"choices": [{"message": {"role": "assistant", "content": reply}}]},
+                             ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+
+def run_once(llm, split, stream):
+    first_question = []
+    start = time.perf_counter()
+
+    def on_question(question):
+        if not first_question:
+            first_question.append(time.perf_counter() - start)
+
+    result = llm.generate_quiz("Бенчмарк", "средний", api_key="bench-key",
+                               on_question=on_question if stream else None, split=split)
+    total = time.perf_counter() - start
+    if result.get('error') or len(result['questions']) != len(QUESTIONS):
+        raise RuntimeError(f"Unexpected result: {result.get('error')}")
+    return total, (first_question[0] if first_question else None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--stream', action='store_true', help='stream answers and report time to the first question')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # llm reads the endpoint at import time
+    os.environ['OPENROUTER_URL'] = f"http://127.0.0.1:{server.server_port}/api/v1/chat/completions"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import llm
+    # Kivy UrlRequest needs a running Kivy event loop, which the benchmark does not have
+    llm._transport_selector.mark_unavailable('kivy', 'no Kivy event loop in the benchmark')
+
+    print(f"Theory: {len(THEORY)} chars, questions: {len(json.dumps(QUESTIONS, ensure_ascii=False))} chars, "
+          f"{CHARS_PER_SECOND} chars/s, first token after {FIRST_TOKEN_DELAY}s")
+    for split in (False, True):
+        runs = [run_once(llm, split, args.stream) for _ in range(args.runs)]
+        totals = [total for total, _ in runs]
+        line = (f"{'split ' if split else 'single'}: median {statistics.median(totals):.3f}s, "
+                f"min {min(totals):.3f}s, max {max(totals):.3f}s")
+        if args.stream:
+            firsts = [first for _, first in runs if first is not None]
+            if firsts:
+                line += f", first question after {statistics.median(firsts):.3f}s"
+        print(line)
+
+    llm.close_connection_pools()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Widget count and memory of the app at startup and after navigation.
+
+Starts MyApp in this process, takes screen_registry.snapshot() after the
+first frame, then opens every screen and tab (which builds all lazy
+screens - the state every launch had before screens were lazy), and
+finally releases the idle screens the way MyApp.release_idle_screens()
+does under memory pressure.
+
+Usage: python scripts/bench_screens.py
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+sys.argv = [os.path.join(ROOT, 'main.py')]
+
+import main  # noqa: E402
+import screen_registry  # noqa: E402
+from kivy.clock import Clock  # noqa: E402
+
+STEP = 0.5  # Seconds between navigation steps, longer than a screen transition
+
+
+def row(label, snap):
+    print(f"{label:<22}{snap['widgets']:>8}{snap['rss_mb'] or 0:>10.1f}  {', '.join(snap['built'])}")
+
+
+def run(app):
+    results = {}
+    steps = []
+
+    def startup(dt):
+        root = app.root
+        tabs = root.get_screen('main').ids.tab_manager
+        steps.extend((tabs, name) for name in tabs.lazy_screens)
+        steps.append((tabs, 'saved'))
+        steps.extend((root, name) for name in root.lazy_screens)
+        steps.append((root, 'main'))
+        results['startup'] = screen_registry.snapshot(root)
+        step(0)
+
+    def step(dt):
+        root = app.root
+        if steps:
+            manager, name = steps.pop(0)
+            manager.current = name
+            Clock.schedule_once(step, STEP)
+            return
+        results['navigated'] = screen_registry.snapshot(root)
+        app.release_idle_screens()
+        results['released'] = screen_registry.snapshot(root)
+        app.stop()
+
+    Clock.schedule_once(startup, 0.5)
+    app.run()
+
+    print(f"{'':<22}{'widgets':>8}{'RSS, MB':>10}  built screens")
+    row('startup', results['startup'])
+    row('after navigation', results['navigated'])
+    row('after release_idle', results['released'])
+    stats = app.get_screen_stats()
+    print(f"screens created {stats['screens']['created'] + stats['tabs']['created']}, "
+          f"build time {(stats['screens']['build_time'] + stats['tabs']['build_time']) * 1000:.1f} ms, "
+          f"released {stats['screens']['released']}")
+
+
+if __name__ == '__main__':
+    run(main.MyApp())
@@ -0,0 +1,75 @@
+"""Measure time-to-first-frame of main.py.
+
+Each run starts a fresh interpreter with SMARTTEST_STARTUP_PROFILE=1 and
+SMARTTEST_STARTUP_EXIT=1, so the app reports its startup phases (see
+startup_profile.py) and quits right after the first frame. --preimport
+imports the given modules before main.py runs, e.g. "--preimport llm"
+reproduces the old eager import of llm.py for comparison.
+
+Usage: python scripts/bench_startup.py [--runs N] [--preimport MODULE ...]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RUNNER = """
+import importlib, runpy, sys
+for name in sys.argv[1:]:
+    importlib.import_module(name)
+sys.argv = ['main.py']
+runpy.run_path('main.py', run_name='__main__')
+"""
+
+
+def run_once(preimport, timeout):
+    fd, profile_path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    env = dict(os.environ, SMARTTEST_STARTUP_PROFILE='1', SMARTTEST_STARTUP_EXIT='1',
+               STARTUP_PROFILE_FILE=profile_path, KIVY_NO_ARGS='1')
+    start = time.perf_counter()
+    try:
+        subprocess.run([sys.executable, '-c', RUNNER, *preimport], cwd=ROOT, env=env, timeout=timeout,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        wall = time.perf_counter() - start
+        with open(profile_path, 'r', encoding='utf-8') as f:
+            profile = json.load(f)
+    finally:
+        os.remove(profile_path)
+    return wall, profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--preimport', nargs='*', default=[], help='modules imported before main.py')
+    parser.add_argument('--timeout', type=float, default=60)
+    args = parser.parse_args()
+
+    # The first run warms the bytecode and font caches and is not counted
+    run_once(args.preimport, args.timeout)
+    runs = [run_once(args.preimport, args.timeout) for _ in range(args.runs)]
+
+    phases = {}
+    for _, profile in runs:
+        for phase, _, duration in profile['phases']:
+            phases.setdefault(phase, []).append(duration)
+    label = f" (preimport: {', '.join(args.preimport)})" if args.preimport else ''
+    print(f"{args.runs} runs{label}")
+    for phase, durations in phases.items():
+        print(f"  {phase:<24} {statistics.median(durations) * 1000:8.1f} ms")
+    totals = [profile['total'] for _, profile in runs]
+    walls = [wall for wall, _ in runs]
+    print(f"  {'first frame':<24} {statistics.median(totals) * 1000:8.1f} ms "
+          f"(min {min(totals) * 1000:.1f}, max {max(totals) * 1000:.1f})")
+    print(f"  {'process wall time':<24} {statistics.median(walls) * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
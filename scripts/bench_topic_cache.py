@@ -0,0 +1,167 @@
+"""Measure the open-questions cache hit rate with exact and fuzzy topic keys.
+
+The corpus is the topic history (course_topics.json) plus the topics of
+saved courses (courses.json); when it is too small, a built-in list of
+typical topics is added. Half of the topics are put into the cache, then
+each of them is queried the way users actually retype a topic (case,
+filler words, Russian inflection, transliteration, a typo). The other
+half is queried as is, and so is the second topic of each NEAR_MISSES
+pair whose first topic is cached: any hit there is a false match.
+
+Usage: python scripts/bench_topic_cache.py [--topics FILE] [--courses FILE] [--threshold T]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from topic_match import TopicIndex, DEFAULT_THRESHOLD, TRANSLIT  # noqa: E402
+
+MIN_CORPUS = 40
+DIFFICULTY = 'средний'
+
+SAMPLE_TOPICS = [
+    'Python', 'Java', 'JavaScript', 'Kotlin', 'C++', 'C#', 'Go', 'Rust', 'SQL', 'Linux', 'Git', 'Docker',
+    'React', 'Машинное обучение', 'Нейронные сети', 'Линейная алгебра', 'Теория вероятностей',
+    'Математический анализ', 'Биология клетки', 'Органическая химия', 'Квантовая физика',
+    'История России', 'История Франции', 'Древний Рим', 'Вторая мировая война', 'Экономика',
+    'Микроэкономика', 'Философия', 'Психология', 'Английский язык', 'Немецкий язык', 'Астрономия',
+    'География', 'Блокчейн', 'Биткоин', 'Компьютерные сети', 'Операционные системы', 'Алгоритмы',
+    'Структуры данных', 'Кибербезопасность', 'Фотография', 'Музыкальная теория', 'Генетика',
+    'Statistics', 'Marketing', 'Photoshop', 'Excel', 'Unity', 'Android', 'Kubernetes',
+]
+
+# (cached, query): topics that differ in one meaningful word or number
+NEAR_MISSES = [
+    ('Органическая химия', 'Неорганическая химия'), ('Физика 7 класс', 'Физика 8 класс'),
+    ('Алгебра 9 класс', 'Алгебра 10 класс'), ('Angular', 'AngularJS'), ('Python 2', 'Python 3'),
+    ('Windows 10', 'Windows 11'), ('Java', 'JavaScript'), ('C', 'C++'), ('Vue 2', 'Vue 3'),
+    ('История России XIX век', 'История России XX век'), ('Типичные ошибки', 'Нетипичные ошибки'),
+    ('Микроэкономика', 'Макроэкономика'), ('Биология 5 класс', 'Биология 6 класс'),
+]
+
+LATIN_TO_CYRILLIC = [
+    ('sch', 'щ'), ('sh', 'ш'), ('ch', 'ч'), ('zh', 'ж'), ('ya', 'я'), ('yu', 'ю'), ('ts', 'ц'),
+    ('th', 'т'), ('ph', 'ф'), ('ck', 'к'), ('x', 'кс'), ('j', 'дж'), ('y', 'и'), ('w', 'в'), ('q', 'к'),
+    ('a', 'а'), ('b', 'б'), ('c', 'к'), ('d', 'д'), ('e', 'е'), ('f', 'ф'), ('g', 'г'), ('h', 'х'),
+    ('i', 'и'), ('k', 'к'), ('l', 'л'), ('m', 'м'), ('n', 'н'), ('o', 'о'), ('p', 'п'), ('r', 'р'),
+    ('s', 'с'), ('t', 'т'), ('u', 'у'), ('v', 'в'), ('z', 'з'),
+]
+
+
+def load_corpus(topics_file, courses_file):
+    topics = []
+    if os.path.exists(topics_file):
+        with open(topics_file, 'r', encoding='utf-8') as f:
+            topics.extend(t for t in json.load(f) if isinstance(t, str))
+    if os.path.exists(courses_file):
+        with open(courses_file, 'r', encoding='utf-8') as f:
+            topics.extend(c.get('meta', {}).get('topic', '') for c in json.load(f))
+    history = len(topics)
+    if len(topics) < MIN_CORPUS:
+        topics.extend(SAMPLE_TOPICS)
+    seen = set()
+    corpus = []
+    for topic in topics:
+        topic = (topic or '').strip()
+        if topic and topic.lower() not in seen:
+            seen.add(topic.lower())
+            corpus.append(topic)
+    return corpus, history
+
+
+def transliterate(topic):
+    if any(ch in TRANSLIT for ch in topic.lower()):
+        return ''.join(TRANSLIT.get(ch, ch) for ch in topic.lower())
+    text = topic.lower()
+    for src, dst in LATIN_TO_CYRILLIC:
+        text = text.replace(src, dst)
+    return text
+
+
+def inflect(topic):
+    """Genitive-like forms the way the topic appears inside a phrase."""
+    words = []
+    for word in topic.split():
+        for src, dst in (('ая', 'ой'), ('ые', 'ых'), ('ие', 'ия'), ('а', 'ы'), ('я', 'и')):
+            if word.endswith(src):
+                word = word[:-len(src)] + dst
+                break
+        words.append(word)
+    return 'Основы ' + ' '.join(words)
+
+
+def typo(topic, rng):
+    if len(topic) < 5:
+        return topic + ' '
+    i = rng.randrange(1, len(topic) - 2)
+    return topic[:i] + topic[i + 1] + topic[i] + topic[i + 2:]
+
+
+def variants(topic, rng):
+    return {
+        'case': f'  {topic.upper()} ',
+        'filler': f'{topic} для начинающих',
+        'inflection': inflect(topic),
+        'translit': transliterate(topic),
+        'typo': typo(topic, rng),
+    }
+
+
+def exact_key(topic):
+    """Key of the cache before fuzzy lookup: MyApp._get_open_questions_cache_key"""
+    return f"{(topic or '').strip().lower()}|{DIFFICULTY}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--topics', default=os.path.join(ROOT, 'course_topics.json'))
+    parser.add_argument('--courses', default=os.path.join(ROOT, 'courses.json'))
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus, history = load_corpus(args.topics, args.courses)
+    rng.shuffle(corpus)
+    cached, unseen = corpus[::2], corpus[1::2]
+    near_miss = {query.lower() for _, query in NEAR_MISSES}
+    cached = [t for t in cached if t.lower() not in near_miss] + [t for t, _ in NEAR_MISSES]
+    unseen = [t for t in unseen if t not in cached] + [q for _, q in NEAR_MISSES]
+    print(f"Corpus: {len(corpus)} topics ({history} from history), {len(cached)} cached, "
+          f"threshold {args.threshold}")
+
+    exact = {exact_key(t) for t in cached}
+    index = TopicIndex(args.threshold)
+    for topic in cached:
+        index.add(exact_key(topic), topic, DIFFICULTY)
+
+    by_kind = {}
+    for topic in cached:
+        for kind, query in variants(topic, rng).items():
+            counts = by_kind.setdefault(kind, [0, 0, 0])
+            counts[0] += 1
+            if exact_key(query) in exact:
+                counts[1] += 1
+            match = index.lookup(query, DIFFICULTY)
+            if exact_key(query) in exact or (match and match[0] == exact_key(topic)):
+                counts[2] += 1
+
+    total = [sum(c[i] for c in by_kind.values()) for i in range(3)]
+    print(f"{'variant':<12}{'queries':>8}{'exact':>8}{'fuzzy':>8}")
+    for kind, (n, hits_exact, hits_fuzzy) in by_kind.items():
+        print(f"{kind:<12}{n:>8}{hits_exact / n:>8.0%}{hits_fuzzy / n:>8.0%}")
+    print(f"{'all':<12}{total[0]:>8}{total[1] / total[0]:>8.0%}{total[2] / total[0]:>8.0%}")
+
+    false_hits = [(t, index.lookup(t, DIFFICULTY)) for t in unseen]
+    false_hits = [(t, m) for t, m in false_hits if m]
+    print(f"False matches for {len(unseen)} uncached topics: {len(false_hits)}")
+    for topic, (key, score) in false_hits:
+        print(f"  {topic!r} -> {key.rpartition('|')[0]!r} ({score:.2f})")
+
+
+if __name__ == '__main__':
+    main()
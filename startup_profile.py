@@ -0,0 +1,71 @@
+"""Startup phase timings from process start to the first frame.
+
+main.py calls mark(phase) after each startup step. With
+SMARTTEST_STARTUP_PROFILE=1 the phases are reported when the first frame
+has been drawn: printed, written to STARTUP_PROFILE_FILE (if set) as
+JSON, and with SMARTTEST_STARTUP_EXIT=1 the app stops right after, which
+is how scripts/bench_startup.py measures time-to-first-frame.
+"""
+import json
+import os
+import sys
+import time
+
+ENABLED = os.getenv('SMARTTEST_STARTUP_PROFILE', '').lower() in ('1', 'true', 'yes')
+EXIT_AFTER_FIRST_FRAME = os.getenv('SMARTTEST_STARTUP_EXIT', '').lower() in ('1', 'true', 'yes')
+PROFILE_FILE = os.getenv('STARTUP_PROFILE_FILE')
+
+
+def _process_start():
+    """Wall-clock time the process started (Linux/Android), else now."""
+    try:
+        with open('/proc/self/stat', 'rb') as f:
+            fields = f.read().rsplit(b')', 1)[1].split()
+        start_ticks = int(fields[19])  # Field 22 of stat: start time in clock ticks since boot
+        with open('/proc/uptime', 'rb') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.time()
+
+
+_origin = _process_start()
+_phases = []
+_reported = False
+
+
+def elapsed():
+    """Seconds since process start."""
+    return time.time() - _origin
+
+
+def mark(phase):
+    """Records that a startup phase has finished."""
+    if ENABLED and not _reported:
+        _phases.append((phase, elapsed()))
+
+
+def report():
+    """Phase timings as {'phases': [[name, end, duration]], 'total': seconds}."""
+    rows = []
+    previous = 0.0
+    for phase, end in _phases:
+        rows.append([phase, round(end, 4), round(end - previous, 4)])
+        previous = end
+    return {'phases': rows, 'total': round(previous, 4), 'python': sys.version.split()[0]}
+
+
+def first_frame():
+    """Closes the profile at the first frame; returns True if the app should exit."""
+    global _reported
+    if not ENABLED or _reported:
+        return False
+    mark('first_frame')
+    _reported = True
+    result = report()
+    for phase, end, duration in result['phases']:
+        print(f"[STARTUP] {phase:<24} +{duration * 1000:7.1f} ms  (at {end * 1000:7.1f} ms)")
+    if PROFILE_FILE:
+        with open(PROFILE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+    return EXIT_AFTER_FIRST_FRAME
@@ -0,0 +1,148 @@
+"""Shared worker pool for blocking background work of the app.
+
+Instead of a new thread per generation, preload, evaluation or chat
+message, TaskScheduler runs tasks on a fixed number of daemon workers
+taking them from a priority queue: user-visible work (HIGH) goes ahead
+of speculative work such as preloading (LOW). Every task carries a
+CancelToken; a task cancelled before it starts is skipped, a running
+task can check the token, and its result is not delivered after
+cancellation. get_stats() reports queue depth and wait/run latency.
+"""
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, CancelledError
+
+HIGH = 0
+NORMAL = 10
+LOW = 20
+
+PRIORITY_NAMES = {HIGH: 'high', NORMAL: 'normal', LOW: 'low'}
+
+DEFAULT_WORKERS = 3
+LATENCY_WINDOW = 100  # Tasks kept for latency statistics
+
+
+class CancelToken:
+    """Cancellation flag shared between the caller and a running task."""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise CancelledError()
+
+
+class Task:
+    """
+    A queued call.
+
+    Attributes:
+        name: Label used in statistics
+        priority: HIGH, NORMAL or LOW
+        token: CancelToken of the task
+        future: concurrent.futures.Future with the result
+    """
+
+    def __init__(self, fn, args, kwargs, priority, token, name):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.token = token or CancelToken()
+        self.name = name or getattr(fn, '__name__', 'task')
+        self.future = Future()
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+
+    def cancel(self):
+        self.token.cancel()
+        self.future.cancel()
+
+
+class TaskScheduler:
+    """Priority queue served by a fixed set of daemon worker threads."""
+
+    def __init__(self, workers=DEFAULT_WORKERS, name='worker'):
+        self.workers = workers
+        self.name = name
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'cancelled': 0}
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = 0
+        self._waits = {}  # priority -> deque of queue wait times
+        self._runs = deque(maxlen=LATENCY_WINDOW)
+
+    def submit(self, fn, *args, priority=NORMAL, token=None, name=None, **kwargs):
+        """Queues fn(*args, **kwargs) and returns its Task."""
+        task = Task(fn, args, kwargs, priority, token, name)
+        with self._cond:
+            heapq.heappush(self._heap, (priority, next(self._seq), task))
+            self.stats['submitted'] += 1
+            self._start_workers()
+            self._cond.notify()
+        return task
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f'{self.name}-{len(self._threads)}', daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, task = heapq.heappop(self._heap)
+                if task.token.cancelled or not task.future.set_running_or_notify_cancel():
+                    task.future.cancel()
+                    self.stats['cancelled'] += 1
+                    continue
+                self._running += 1
+                task.started = time.monotonic()
+                self._waits.setdefault(task.priority, deque(maxlen=LATENCY_WINDOW)).append(
+                    task.started - task.submitted)
+            try:
+                result = task.fn(*task.args, **task.kwargs)
+            except BaseException as e:
+                error, outcome = e, 'cancelled' if isinstance(e, CancelledError) else 'failed'
+            else:
+                error, outcome = None, 'completed'
+            task.finished = time.monotonic()
+            with self._cond:
+                self._running -= 1
+                self._runs.append((task.name, task.finished - task.started))
+                self.stats[outcome] += 1
+            # Callbacks of the future run here, after the statistics are updated
+            if error is None:
+                task.future.set_result(result)
+            else:
+                task.future.set_exception(error)
+
+    def get_stats(self):
+        """Counters, queue depth and average wait/run times in seconds."""
+        with self._cond:
+            depth = {}
+            for priority, _, task in self._heap:
+                if not task.token.cancelled:
+                    name = PRIORITY_NAMES.get(priority, priority)
+                    depth[name] = depth.get(name, 0) + 1
+            waits = {PRIORITY_NAMES.get(p, p): sum(w) / len(w) for p, w in self._waits.items() if w}
+            runs = [duration for _, duration in self._runs]
+            return dict(self.stats, queued=sum(depth.values()), queue_depth=depth, running=self._running,
+                        avg_wait=waits, avg_run=sum(runs) / len(runs) if runs else 0.0,
+                        max_run=max(runs) if runs else 0.0)
@@ -0,0 +1,201 @@
+"""Fuzzy matching of course topics for the open-questions cache.
+
+Users type the same topic in many ways: "Python", "python programming",
+"Питон", "основы Python". normalize_topic() folds such variants to a
+common form (case, filler words, simple Russian endings, transliteration
+to Latin and a few spelling folds such as th -> t, y -> i), and
+TopicIndex finds the most similar cached topic by character trigrams
+(Jaccard similarity over an inverted index, so a lookup only scores
+topics that share at least one trigram with the query).
+
+Trigrams barely see a one-word difference that changes the subject, so
+similar topics are still rejected when they differ in a number ("Физика
+7 класс" / "Физика 8 класс", "XIX век" / "XX век") or when a word of one
+is a word of the other extended by a prefix or suffix ("органическая" /
+"неорганическая", "Angular" / "AngularJS"); see conflicting().
+"""
+import re
+from collections import defaultdict
+
+DEFAULT_THRESHOLD = 0.6
+
+TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'i', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
+    'ъ': '', 'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+}
+
+# Applied in order after transliteration, so that English spellings and
+# Russian transcriptions of the same word meet ("python"/"питон" -> "piton")
+SPELLING_FOLDS = (
+    ('dzh', 'j'), ('zh', 'j'), ('kh', 'h'), ('th', 't'), ('ph', 'f'), ('ck', 'k'), ('qu', 'kv'),
+    ('x', 'ks'), ('w', 'v'), ('c', 'k'), ('q', 'k'), ('y', 'i'), ('ee', 'i'), ('oo', 'u'),
+)
+
+# Words that describe the kind of course rather than its subject
+FILLER_WORDS = frozenset("""
+    основы основа введение курс курсы урок уроки для начинающих начинающим новичков с нуля
+    язык языка программирование программирования изучение теория и в по на о об
+    basics basic intro introduction to course tutorial for beginners beginner the a an of and in on
+    programming language learn learning
+""".split())
+
+# Endings stripped from Cyrillic words longer than MIN_STEM + ending
+RUSSIAN_ENDINGS = sorted("""
+    ами ями ого его ому ему ыми ими ая яя ое ее ые ие ый ий ой ом ем ах ях ам ям ов ев ей
+    ых их ым им ую юю а я ы и у ю е о ь
+""".split(), key=len, reverse=True)
+MIN_STEM = 3
+
+# A word that is another word plus at least this many letters is another
+# word; a single extra letter is more likely a typo or an ending
+MIN_EXTENSION = 2
+
+_TOKEN_RE = re.compile(r'[\w+#]+', re.UNICODE)  # Keep C++ and C# apart
+_CYRILLIC_RE = re.compile('[а-яё]')
+# Digits or a Roman numeral of up to 39 (classes, centuries, versions)
+_NUMBER_RE = re.compile(r'\d|^(?=[ivx]{2,}$)x{0,3}(?:ix|iv|v?i{0,3})$')
+
+
+def _stem(token):
+    if not _CYRILLIC_RE.search(token):
+        return token
+    for ending in RUSSIAN_ENDINGS:
+        if token.endswith(ending) and len(token) - len(ending) >= MIN_STEM:
+            return token[:-len(ending)]
+    return token
+
+
+def _fold(token):
+    if _NUMBER_RE.search(token):
+        # "11" is not "1", "xix" is not "ksiks"
+        return token
+    token = ''.join(TRANSLIT.get(ch, ch) for ch in token)
+    for src, dst in SPELLING_FOLDS:
+        token = token.replace(src, dst)
+    # Collapse doubled letters ("kommit" / "komit")
+    token = re.sub(r'(.)\1+', r'\1', token)
+    # A final vowel is often an ending in one language and absent in the other ("джава" / "java")
+    if len(token) > 3 and token[-1] in 'aeiou':
+        token = token[:-1]
+    return token
+
+
+def normalize_topic(topic):
+    """Canonical form of a topic: folded significant words in sorted order."""
+    tokens = _TOKEN_RE.findall((topic or '').casefold().replace('ё', 'е'))
+    words = [t for t in tokens if t not in FILLER_WORDS]
+    if not words:
+        # The topic consists of filler words only - keep them
+        words = tokens
+    return ' '.join(sorted(_fold(_stem(w)) for w in words))
+
+
+def trigrams(text):
+    """Set of character trigrams of every word, padded at word boundaries."""
+    grams = set()
+    for word in text.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+# Russian endings as they look at the end of a folded transliterated word
+# ("lineinaya" -> "lineinai"): not stemmed away like Cyrillic endings, but
+# not a different word either
+_FOLDED_ENDINGS = frozenset(_fold('бар' + ending)[3:] for ending in RUSSIAN_ENDINGS) - {''}
+
+
+def conflicting(a, b):
+    """
+    True if two normalized topics name different subjects however similar
+    their trigrams are: they differ in a number, or a word of one is a word
+    of the other with MIN_EXTENSION or more letters added at either end
+    (other than a transliterated Russian ending).
+    """
+    words_a, words_b = set(a.split()), set(b.split())
+    only_a, only_b = words_a - words_b, words_b - words_a
+    if any(_NUMBER_RE.search(word) for word in only_a | only_b):
+        return True
+    for word_a in only_a:
+        for word_b in only_b:
+            short, long = sorted((word_a, word_b), key=len)
+            if len(long) - len(short) < MIN_EXTENSION:
+                continue
+            if long.endswith(short) or (long.startswith(short) and long[len(short):] not in _FOLDED_ENDINGS):
+                return True
+    return False
+
+
+def similarity(a, b):
+    """Jaccard similarity of two topics after normalization (0..1); 0 if they are conflicting()."""
+    na, nb = normalize_topic(a), normalize_topic(b)
+    ga, gb = trigrams(na), trigrams(nb)
+    if not ga or not gb or conflicting(na, nb):
+        return 0.0
+    return len(ga & gb) / len(ga | gb)
+
+
+class TopicIndex:
+    """
+    Trigram index of topics, partitioned by an exact group (difficulty).
+
+    Topics of different groups never match each other, and neither do
+    conflicting() topics.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self._normalized = {}  # key -> normalized topic
+        self._grams = {}  # key -> trigram set
+        self._groups = {}  # key -> group
+        self._postings = defaultdict(set)  # (group, trigram) -> keys
+
+    def __len__(self):
+        return len(self._grams)
+
+    def add(self, key, topic, group=''):
+        self.remove(key)
+        normalized = normalize_topic(topic)
+        grams = trigrams(normalized)
+        self._normalized[key] = normalized
+        self._grams[key] = grams
+        self._groups[key] = group
+        for gram in grams:
+            self._postings[(group, gram)].add(key)
+
+    def remove(self, key):
+        grams = self._grams.pop(key, None)
+        if grams is None:
+            return
+        del self._normalized[key]
+        group = self._groups.pop(key)
+        for gram in grams:
+            keys = self._postings.get((group, gram))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[(group, gram)]
+
+    def lookup(self, topic, group='', threshold=None):
+        """
+        Returns (key, score) of the most similar topic in the group, or None
+        if nothing reaches the threshold.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        normalized = normalize_topic(topic)
+        grams = trigrams(normalized)
+        if not grams:
+            return None
+        shared = defaultdict(int)
+        for gram in grams:
+            for key in self._postings.get((group, gram), ()):
+                shared[key] += 1
+        best = None
+        for key, common in shared.items():
+            score = common / (len(grams) + len(self._grams[key]) - common)
+            if score >= threshold and (best is None or score > best[1]) \
+                    and not conflicting(normalized, self._normalized[key]):
+                best = (key, score)
+        return best